@@ -0,0 +1,250 @@
+import os
+import math
+import time
+import asyncio
+from collections import deque, defaultdict
+from contextlib import asynccontextmanager
+from cachetools import TTLCache
+from fastapi import HTTPException
+from dotenv import load_dotenv
+import metrics
+import profiles
+
+
+load_dotenv()
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_SLOTS = int(os.getenv("ADMISSION_SLOTS", 16))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", 100))
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", 20))
+ADMISSION_BUSY_RETRY_AFTER = int(os.getenv("ADMISSION_BUSY_RETRY_AFTER", 5))
+ADMISSION_USER_CACHE_SIZE = int(os.getenv("ADMISSION_USER_CACHE_SIZE", 10000))
+
+DEFAULT_TIER = "free"
+
+# rate is generations per minute per user (token bucket refill) and burst its
+# capacity; concurrency caps one user's in-flight generations; weight is the
+# tier's share of generation slots while they are contended. Any value can be
+# overridden per tier, e.g. ADMISSION_RATE_FREE=10 or ADMISSION_WEIGHT_PRO=8.
+TIER_DEFAULTS = {
+    "free": {"rate": 6.0, "burst": 3, "concurrency": 2, "weight": 1.0},
+    "standard": {"rate": 20.0, "burst": 6, "concurrency": 4, "weight": 3.0},
+    "pro": {"rate": 60.0, "burst": 15, "concurrency": 8, "weight": 6.0},
+}
+
+TIER_LIMITS = {
+    tier: {name: type(value)(os.getenv(f"ADMISSION_{name.upper()}_{tier.upper()}", value)) for name, value in settings.items()}
+    for tier, settings in TIER_DEFAULTS.items()
+}
+
+def limits_for(tier: str) -> dict:
+    return TIER_LIMITS.get(tier) or TIER_LIMITS[DEFAULT_TIER]
+
+def too_many_requests(detail: str, retry_after: float, reason: str):
+    metrics.incr("admission_rejected")
+    metrics.incr(f"admission_rejected_{reason}")
+
+    return HTTPException(429, detail, headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+class TokenBucket:
+    # Unlike http_client.RateLimiter this never waits: a request either gets
+    # a token now or is told how long until the next one.
+    def __init__(self, rate_per_minute: float, burst: int):
+        self.rate = rate_per_minute / 60
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+
+    def take(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+
+        return (1 - self.tokens) / self.rate
+
+class FairQueue:
+    # Weighted fair queuing over a fixed number of generation slots. Each
+    # tier has a virtual clock advanced by 1/weight per grant and the tier
+    # with the lowest clock is served next, so under contention pro,
+    # standard and free get slots in proportion to their weights and no tier
+    # is starved. A tier coming back from idle starts at the current clock
+    # rather than cashing in the time it was away.
+    def __init__(self, slots: int, weights: dict):
+        self.slots = slots
+        self.weights = weights
+        self.in_use = 0
+        self.queues = defaultdict(deque)
+        self.vtime = defaultdict(float)
+        self.clock = 0.0
+
+    def depth(self, tier: str = None) -> int:
+        if tier is not None:
+            return len(self.queues[tier])
+
+        return sum(len(queue) for queue in self.queues.values())
+
+    async def acquire(self, tier: str, timeout: float):
+        if self.in_use < self.slots and not self.depth():
+            self.in_use += 1
+            return
+
+        if self.depth(tier) >= ADMISSION_MAX_QUEUE:
+            raise too_many_requests("Generation queue is full, try again shortly", ADMISSION_BUSY_RETRY_AFTER, "queue_full")
+
+        if not self.queues[tier]:
+            self.vtime[tier] = max(self.vtime[tier], self.clock)
+
+        future = asyncio.get_running_loop().create_future()
+        self.queues[tier].append(future)
+        self._report(tier)
+
+        try:
+            await asyncio.wait_for(future, timeout)
+
+        except BaseException as e:
+            # _grant may have handed this waiter a slot just as it timed out
+            # or was cancelled; the slot goes back rather than leaking
+            if future.done() and not future.cancelled():
+                self.release()
+
+            if isinstance(e, asyncio.TimeoutError):
+                raise too_many_requests("Generation capacity is busy, try again shortly", ADMISSION_BUSY_RETRY_AFTER, "timeout")
+
+            raise
+
+        finally:
+            if future in self.queues[tier]:
+                self.queues[tier].remove(future)
+
+            self._report(tier)
+
+    def release(self):
+        self.in_use -= 1
+        self._grant()
+
+    def _grant(self):
+        while self.in_use < self.slots:
+            waiting = [tier for tier, queue in self.queues.items() if queue]
+
+            if not waiting:
+                break
+
+            tier = min(waiting, key=lambda t: self.vtime[t])
+            future = self.queues[tier].popleft()
+
+            # Waiters that timed out or disconnected are skipped
+            if future.done():
+                continue
+
+            self.clock = self.vtime[tier]
+            self.vtime[tier] += 1 / self.weights.get(tier, self.weights[DEFAULT_TIER])
+            self.in_use += 1
+            future.set_result(None)
+            self._report(tier)
+
+        metrics.set_gauge("admission_in_flight", self.in_use)
+
+    def _report(self, tier: str):
+        metrics.set_gauge(f"admission_queue_depth_{tier}", self.depth(tier))
+        metrics.set_gauge("admission_queue_depth", self.depth())
+
+class Ticket:
+    def __init__(self, controller, email: str, tier: str, slot: bool):
+        self.controller = controller
+        self.email = email
+        self.tier = tier
+        self.slot = slot
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.controller._release(self)
+
+class AdmissionController:
+    def __init__(self, slots: int = ADMISSION_SLOTS):
+        self.queue = FairQueue(slots, {tier: limits["weight"] for tier, limits in TIER_LIMITS.items()})
+        self.buckets = TTLCache(maxsize=ADMISSION_USER_CACHE_SIZE, ttl=3600)
+        self.in_flight = defaultdict(int)
+
+    async def tier_for(self, email: str) -> str:
+        # Read from the profile cache, which credit reservations keep
+        # current, so a rejected request never touches the credit tables
+        profile = await profiles.get_profile(email) if email else None
+
+        return (profile or {}).get("subscription_tier") or DEFAULT_TIER
+
+    async def check_rate(self, email: str, route: str, tier: str = None) -> str:
+        tier = tier or await self.tier_for(email)
+
+        if not ADMISSION_ENABLED:
+            return tier
+
+        limits = limits_for(tier)
+        bucket = self.buckets.get(email)
+
+        if bucket is None or bucket.capacity != limits["burst"]:
+            bucket = self.buckets[email] = TokenBucket(limits["rate"], limits["burst"])
+
+        wait = bucket.take()
+
+        if wait:
+            raise too_many_requests(f"Too many {route} requests for the {tier} tier, slow down", wait, "rate")
+
+        return tier
+
+    async def acquire(self, email: str, route: str) -> Ticket:
+        tier = await self.tier_for(email)
+
+        if not ADMISSION_ENABLED:
+            return Ticket(self, email, tier, slot=False)
+
+        # Checked before the rate limit so a request turned away here doesn't spend a token
+        if self.in_flight.get(email, 0) >= limits_for(tier)["concurrency"]:
+            raise too_many_requests(f"Too many generations in progress for the {tier} tier", ADMISSION_BUSY_RETRY_AFTER, "concurrency")
+
+        await self.check_rate(email, route, tier)
+
+        # Queued requests count towards the user's cap too, so one user can't fill the queue
+        self.in_flight[email] += 1
+        started = time.perf_counter()
+
+        try:
+            await self.queue.acquire(tier, ADMISSION_MAX_WAIT)
+
+        except BaseException:
+            self._leave(email)
+            raise
+
+        metrics.observe(f"admission_wait_seconds_{tier}", time.perf_counter() - started)
+        metrics.incr(f"admission_admitted_{tier}")
+        metrics.set_gauge("admission_in_flight", self.queue.in_use)
+
+        return Ticket(self, email, tier, slot=True)
+
+    @asynccontextmanager
+    async def admit(self, email: str, route: str):
+        ticket = await self.acquire(email, route)
+
+        try:
+            yield ticket
+
+        finally:
+            ticket.release()
+
+    def _release(self, ticket: Ticket):
+        if ticket.slot:
+            self._leave(ticket.email)
+            self.queue.release()
+
+    def _leave(self, email: str):
+        self.in_flight[email] -= 1
+
+        if self.in_flight[email] <= 0:
+            del self.in_flight[email]
+
+admission = AdmissionController()
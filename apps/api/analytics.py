@@ -1,63 +1,39 @@
 import os
 import datetime
 from datetime import timedelta
-import io
-import requests
+import http_client
+import asyncio
 from fastapi import APIRouter, HTTPException
-from supabase import create_client, Client
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from google.auth.transport.requests import Request as GoogleRequest
+from google_services import build_service
 from dotenv import load_dotenv
-from PIL import Image
-from collections import Counter
-from auth import SCOPES
 from auth import LINKEDIN_SCOPES
+from executor import run_blocking
+from token_manager import token_manager
+import color_engine
+import thumbnail_cache
+import youtube_sync
+import analytics_store
+import instagram
 
 load_dotenv()
 
 router = APIRouter()
 
-supabase: Client = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_KEY")
-)
-
-def get_refreshed_credentials(token_data):
-    creds = Credentials(
-        token=token_data['access_token'],
-        refresh_token=token_data['refresh_token'],
-        token_uri="https://oauth2.googleapis.com/token",
-        client_id=os.getenv("GOOGLE_CLIENT_ID"),
-        client_secret=os.getenv("GOOGLE_CLIENT_SECRET"),
-        scopes=SCOPES
-    )
-
-    if creds.expired and creds.refresh_token:
-        creds.refresh(GoogleRequest())
-
-        supabase.table("social_tokens").update({
-            "access_token": creds.token
-        }).eq("user_email", token_data['user_email']).execute()
-
-    return creds
-
 @router.get("/api/analytics/youtube")
-async def get_youtube_stats(email:str):
+async def get_youtube_stats(email:str, days: int = 30):
+    if not 1 <= days <= analytics_store.ANALYTICS_MAX_DAYS:
+        raise HTTPException(400, f"days must be between 1 and {analytics_store.ANALYTICS_MAX_DAYS}")
+
     try:
-        response = supabase.table("social_tokens").select("*").eq("user_email", email).eq("provider", "youtube").execute()
+        creds = await token_manager.get_google_credentials(email)
 
-        if not response.data:
+        if not creds:
             raise HTTPException(status_code=404, detail="User not connected to YouTube")
 
-        token_data = response.data[0]
-
-        creds = get_refreshed_credentials(token_data)
-
-        yt_data = build('youtube', 'v3', credentials=creds)
-        youtube_analytics = build('youtubeAnalytics', 'v2', credentials=creds)
-
-        channel_res = yt_data.channels().list(mine=True, part="snippet,statistics").execute()
+        channel_res, rows = await asyncio.gather(
+            youtube_sync.get_channel(email, creds),
+            analytics_store.get_days(email, creds, days)
+        )
 
         if not channel_res.get("items"):
             raise HTTPException(404, "No channel found")
@@ -65,39 +41,34 @@ async def get_youtube_stats(email:str):
         stats_lifetime = channel_res["items"][0]["statistics"]
         channel_title = channel_res["items"][0]["snippet"]["title"]
 
-        end_date = datetime.date.today().strftime('%Y-%m-%d')
-        start_date = (datetime.date.today() - timedelta(days=30)).strftime('%Y-%m-%d')
+        period = analytics_store.rollup(rows)
+        today = datetime.date.today()
 
-        report = youtube_analytics.reports().query(
-            ids='channel==MINE',
-            startDate=start_date,
-            endDate=end_date,
-            metrics='views,estimatedMinutesWatched,likes,subscribersGained',
-            dimensions='day',
-            sort='day'
-        ).execute()
-
-        rows = report.get("rows", [])
-
-        period_views = sum(r[1] for r in rows)
-        period_minutes = sum(r[2] for r in rows)
-        period_likes = sum(r[3] for r in rows)
+        rollups = {
+            f"{window}d": analytics_store.rollup(rows, start=today - timedelta(days=window))
+            for window in analytics_store.ROLLUP_WINDOWS
+            if window <= days
+        }
 
-        graph_data = [{"date": r[0], "views": r[1], "likes": r[3]} for r in rows]
+        graph_data = [{"date": str(r["day"]), "views": r["views"], "likes": r["likes"]} for r in rows]
 
         return {
             "status": "success",
             "channel_name": channel_title,
             "overview": {
-                "views": period_views,
-                "watch_time_hours": int(period_minutes / 60),
-                "likes": period_likes,
+                "views": period["views"],
+                "watch_time_hours": int(period["minutes_watched"] / 60),
+                "likes": period["likes"],
                 "total_subs": stats_lifetime.get("subscriberCount"),
                 "total_views": stats_lifetime.get("viewCount")
             },
+            "rollups": rollups,
             "graph_data": graph_data
         }
 
+    except HTTPException as he:
+        raise he
+
     except Exception as e:
         print(f"YT Analytics Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -105,21 +76,19 @@ async def get_youtube_stats(email:str):
 @router.get("/api/analytics/linkedin")
 async def get_linkedin_analytics(linkedin_id: str, company_urn: str = None):
     try:
-        res = supabase.table("social_tokens").select("access_token")\
-            .eq("user_email", f"linkedin_{linkedin_id}").execute()
+        token = await token_manager.get_linkedin_token(linkedin_id)
 
-        if not res.data:
+        if not token:
             return {"connected": False}
 
-        token = res.data[0]['access_token']
-
         headers = {
             "Authorization": f"Bearer {token}",
             "X-Restli-Protocol-Version": "2.0.0"
         }
 
         if not company_urn:
-            user_info = requests.get("https://api.linkedin.com/v2/userinfo", headers=headers).json()
+            user_res = await http_client.get("https://api.linkedin.com/v2/userinfo", headers=headers)
+            user_info = user_res.json()
 
             return {
                 "connected": True,
@@ -133,7 +102,7 @@ async def get_linkedin_analytics(linkedin_id: str, company_urn: str = None):
         encoded_urn = company_urn.replace(":", "%3A")
         url = f"https://api.linkedin.com/v2/organizationalEntityShareStatistics?q=organizationalEntity&organizationalEntity={encoded_urn}"
 
-        stats_res = requests.get(url, headers=headers)
+        stats_res = await http_client.get(url, headers=headers)
 
         if stats_res.status_code != 200:
             print(f"LI Stats Error: {stats_res.text}")
@@ -170,85 +139,181 @@ async def get_linkedin_analytics(linkedin_id: str, company_urn: str = None):
         print(f"LinkedIn Analytics Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-def get_dominant_color(image_url):
-    try:
-        response = requests.get(image_url)
-        img = Image.open(io.BytesIO(response.content))
-        img = img.resize((50, 50))
-        img = img.convert('RGB')
+THUMBNAIL_FETCH_CONCURRENCY = int(os.getenv("THUMBNAIL_FETCH_CONCURRENCY", 16))
+THUMBNAIL_FETCH_TIMEOUT = float(os.getenv("THUMBNAIL_FETCH_TIMEOUT", 5))
+INTELLIGENCE_MAX_VIDEOS = int(os.getenv("INTELLIGENCE_MAX_VIDEOS", 200))
+INTELLIGENCE_MODES = ("recent", "channel")
 
-        pixels = list(img.getdata())
-        filtered_pixels = [p for p in pixels if not (p[0] < 30 and p[1] < 30 and p[2] < 30) and not (p[0] > 220 and p[1] > 220 and p[2] > 220)]
+# Downloads go through the shared "media" HTTP pool; the semaphore caps how
+# many are in flight across all concurrent dashboard requests, not per request.
+thumbnail_semaphore = asyncio.Semaphore(THUMBNAIL_FETCH_CONCURRENCY)
 
-        if not filtered_pixels:
-            filtered_pixels = pixels
+async def fetch_thumbnail_async(image_url: str, etag: str = None):
+    # Returns (status, content, etag); status is None when the fetch failed
+    # and 304 when the ETag we already analysed is still current.
+    if not image_url:
+        return None, None, None
 
-        most_common = Counter(filtered_pixels).most_common(1)[0][0]
+    headers = {"If-None-Match": etag} if etag else {}
 
-        return "#{:02x}{:02x}{:02x}".format(most_common[0], most_common[1], most_common[2])
+    async with thumbnail_semaphore:
+        try:
+            response = await http_client.get(image_url, provider="media", headers=headers, timeout=THUMBNAIL_FETCH_TIMEOUT)
+
+            if response.status_code == 304:
+                return 304, None, etag
+
+            response.raise_for_status()
+
+            return response.status_code, response.content, response.headers.get("ETag")
+
+        except Exception as e:
+            print(f"Thumbnail fetch failed for {image_url}: {e}")
+            return None, None, None
+
+async def get_thumbnail_palettes(video_ids: list, urls: list, method: str):
+    # Only thumbnails that are new, replaced, or fail ETag revalidation are
+    # downloaded and analysed; everything else comes from the color cache.
+    cached = await thumbnail_cache.lookup(video_ids, urls, method)
+
+    palettes = {}
+    pending = []
+
+    for vid_id, url in zip(video_ids, urls):
+        entry = cached.get(vid_id)
+
+        if entry and thumbnail_cache.is_fresh(entry):
+            palettes[vid_id] = entry["palette"]
+
+        elif url:
+            pending.append((vid_id, url, entry))
+
+    hits = len(palettes)
+
+    responses = await asyncio.gather(*(
+        fetch_thumbnail_async(url, entry["etag"] if entry else None) for _, url, entry in pending
+    ))
+
+    to_analyse = []
+    updates = []
+    revalidated = 0
+
+    for (vid_id, url, entry), (status, content, etag) in zip(pending, responses):
+        if status == 304:
+            palettes[vid_id] = entry["palette"]
+            revalidated += 1
+            updates.append(thumbnail_cache.make_entry(vid_id, method, url, etag, entry["palette"]))
+
+        elif content:
+            to_analyse.append((vid_id, url, etag, content))
+
+        elif entry:
+            # Download failed but an older analysis exists; better than nothing
+            palettes[vid_id] = entry["palette"]
+
+    if to_analyse:
+        analysed = await run_blocking(
+            "images", color_engine.extract_palettes, [content for *_, content in to_analyse], method=method
+        )
+
+        for (vid_id, url, etag, _), palette in zip(to_analyse, analysed):
+            palettes[vid_id] = palette
+
+            if palette:
+                updates.append(thumbnail_cache.make_entry(vid_id, method, url, etag, palette))
+
+    thumbnail_cache.record(hits=hits + revalidated, misses=len(to_analyse), revalidated=revalidated)
+
+    await thumbnail_cache.save(updates)
+
+    return [palettes.get(vid_id, []) for vid_id in video_ids]
 
-    except:
-        return "#000000"
-    
 @router.get("/api/analytics/intelligence")
-async def get_analytics_intelligence(email: str):
+async def get_analytics_intelligence(email: str, palette_method: str = "histogram", max_videos: int = 10, mode: str = "recent"):
+    if palette_method not in color_engine.METHODS:
+        raise HTTPException(400, f"palette_method must be one of {', '.join(color_engine.METHODS)}")
+
+    if mode not in INTELLIGENCE_MODES:
+        raise HTTPException(400, f"mode must be one of {', '.join(INTELLIGENCE_MODES)}")
+
+    if mode == "recent" and not 1 <= max_videos <= INTELLIGENCE_MAX_VIDEOS:
+        raise HTTPException(400, f"max_videos must be between 1 and {INTELLIGENCE_MAX_VIDEOS}")
+
     try: 
-        response = supabase.table("social_tokens").select("*")\
-            .eq("user_email", email).eq("provider", "youtube").execute()
+        creds = await token_manager.get_google_credentials(email)
 
-        if not response.data:
+        if not creds:
             raise HTTPException(404, "YouTube not connected")
 
-        creds = get_refreshed_credentials(response.data[0])
-        youtube = build('youtube', 'v3', credentials=creds)
+        quota = youtube_sync.QuotaMeter()
+        sync = None
 
-        channels_res = youtube.channels().list(part="contentDetails", mine=True).execute()
+        if mode == "channel":
+            # Whole channel: pull new uploads since the last sync, then refresh
+            # counts for everything stored at one quota unit per 50 videos
+            sync = await youtube_sync.sync_channel(email, creds, quota=quota)
 
-        if not channels_res.get("items"):
-            raise HTTPException(404, "No channel found")
+            if not sync:
+                raise HTTPException(404, "No channel found")
+
+            rows = await youtube_sync.load_videos(email)
+            video_ids = [row["video_id"] for row in rows]
+
+            rows, palettes = await asyncio.gather(
+                youtube_sync.refresh_statistics(creds, rows, quota),
+                get_thumbnail_palettes(video_ids, [row["thumbnail_url"] for row in rows], palette_method)
+            )
+
+            videos = [(row["title"], row["view_count"], row["thumbnail_url"]) for row in rows]
 
-        uploads_id = channels_res["items"][0]["contentDetails"]["relatedPlaylists"]["uploads"]
+        else:
+            youtube = build_service('youtube', 'v3', creds)
+            uploads_id = await youtube_sync.get_uploads_playlist(youtube, quota)
 
-        videos_res = youtube.playlistItems().list(
-            part="snippet",
-            playlistId=uploads_id,
-            maxResults=10
-        ).execute()
+            if not uploads_id:
+                raise HTTPException(404, "No channel found")
 
-        if not videos_res.get("items"):
+            items = []
+
+            async for page in youtube_sync.iter_upload_pages(youtube, uploads_id, quota, limit=max_videos, part="snippet"):
+                items.extend(page)
+
+            video_ids = [youtube_sync.video_id(item) for item in items]
+            thumb_urls = [youtube_sync.thumbnail_url(item['snippet']) for item in items]
+
+            # Statistics and thumbnail palettes don't depend on each other
+            stats_by_id, palettes = await asyncio.gather(
+                youtube_sync.get_videos(creds, video_ids, quota),
+                get_thumbnail_palettes(video_ids, thumb_urls, palette_method)
+            )
+
+            videos = []
+
+            for item, vid_id, thumb_url in zip(items, video_ids, thumb_urls):
+                stats = stats_by_id.get(vid_id)
+                views = int(stats['statistics'].get('viewCount', 0)) if stats else 0
+
+                videos.append((item['snippet']['title'], views, thumb_url))
+
+        if not videos:
             return {
                 "status": "success", 
                 "analysis": {
                     "best_performing_color": "#000000",
                     "data": []
-                }
+                },
+                "quota": quota.to_dict()
             }
 
-        video_ids = [item['snippet']['resourceId']['videoId'] for item in videos_res['items']]
-
-        stats_res = youtube.videos().list(
-            part="statistics",
-            id=','.join(video_ids)
-        ).execute()
-
         data_points = []
 
-        for i, item in enumerate(videos_res['items']):
-            vid_id = item['snippet']['resourceId']['videoId']
-            title = item['snippet']['title']
-            thumb_dict = item['snippet']['thumbnails']
-            thumb_url = thumb_dict.get('high', thumb_dict.get('medium', thumb_dict.get('default', {}))).get('url', '')
-            
-            stats = next((s for s in stats_res['items'] if s['id'] == vid_id), None)
-            views = int(stats['statistics'].get('viewCount', 0)) if stats else 0
-
-            dominant_color = get_dominant_color(thumb_url)
-
+        for (title, views, thumb_url), palette in zip(videos, palettes):
             data_points.append({
                 "title": title,
                 "views": views,
-                "color": dominant_color,
-                "thumbnail": thumb_url
+                "thumbnail": thumb_url,
+                "color": color_engine.dominant_color(palette),
+                "palette": palette
             })
 
         data_points.sort(key=lambda x: x['views'], reverse=True)
@@ -260,7 +325,9 @@ async def get_analytics_intelligence(email: str):
             "analysis": {
                 "best_performing_color": best_color,
                 "data": data_points
-            }
+            },
+            "sync": sync,
+            "quota": quota.to_dict()
         }
     
     except Exception as e:
@@ -277,19 +344,39 @@ async def get_analytics_intelligence(email: str):
             }
         }
 
+@router.post("/api/analytics/youtube/sync")
+async def sync_youtube_channel(email: str, full: bool = False):
+    creds = await token_manager.get_google_credentials(email)
+
+    if not creds:
+        raise HTTPException(404, "YouTube not connected")
+
+    quota = youtube_sync.QuotaMeter()
+
+    try:
+        sync = await youtube_sync.sync_channel(email, creds, full=full, quota=quota)
+
+    except Exception as e:
+        print(f"YouTube Sync Error: {e}")
+        raise HTTPException(500, str(e))
+
+    if not sync:
+        raise HTTPException(404, "No channel found")
+
+    return {**sync, "quota": quota.to_dict()}
+
 @router.get("/api/analytics/instagram")
 async def get_instagram_analytics(instagram_id: str):
     try:
-        response = supabase.table("social_tokens").select("access_token").eq("user_email", f"instagram_{instagram_id}").execute()
+        access_token = await token_manager.get_instagram_token(instagram_id)
 
-        if not response.data:
+        if not access_token:
             raise HTTPException(401, "Instagram not connected")
-        
-        access_token = response.data[0]['access_token']
 
-        url = f"https://graph.facebook.com/v18.0/{instagram_id}?fields=username,followers_count,media_count,profile_picture_url&access_token={access_token}"
+        url = f"{instagram.GRAPH_API}/{instagram_id}?fields=username,followers_count,media_count,profile_picture_url&access_token={access_token}"
 
-        res = requests.get(url).json()
+        response = await http_client.get(url)
+        res = response.json()
 
         if "error" in res: 
             raise HTTPException(400, res["error"]["message"])
@@ -0,0 +1,113 @@
+import os
+import datetime
+from datetime import timedelta
+from dotenv import load_dotenv
+from db import supabase
+from executor import run_blocking
+from google_services import build_service
+import metrics
+
+
+load_dotenv()
+
+# YouTube Analytics keeps revising the most recent days, so rows younger
+# than this when they were fetched are treated as provisional and refetched.
+ANALYTICS_SETTLE_DAYS = int(os.getenv("ANALYTICS_SETTLE_DAYS", 3))
+ANALYTICS_MAX_DAYS = int(os.getenv("ANALYTICS_MAX_DAYS", 730))
+ROLLUP_WINDOWS = (7, 28, 90, 365)
+
+METRICS = ("views", "estimatedMinutesWatched", "likes", "subscribersGained")
+COLUMNS = ("views", "minutes_watched", "likes", "subscribers_gained")
+
+def _date(value) -> datetime.date:
+    return value if isinstance(value, datetime.date) else datetime.date.fromisoformat(str(value)[:10])
+
+def is_settled(row: dict) -> bool:
+    return _date(row["fetched_at"]) - _date(row["day"]) >= timedelta(days=ANALYTICS_SETTLE_DAYS)
+
+async def load_days(email: str, start: datetime.date, end: datetime.date):
+    res = await run_blocking("supabase", supabase.table("youtube_daily_metrics").select("*")\
+        .eq("user_email", email)\
+        .gte("day", start.isoformat())\
+        .lte("day", end.isoformat())\
+        .order("day").execute)
+
+    return {_date(row["day"]): row for row in res.data or []}
+
+def needs_fetch(row: dict, today: datetime.date) -> bool:
+    # Provisional rows are refreshed at most once a day
+    return row is None or (not is_settled(row) and _date(row["fetched_at"]) < today)
+
+def missing_range(stored: dict, start: datetime.date, end: datetime.date):
+    # One contiguous range covering every day that still needs fetching. In
+    # steady state that is the last few days, once a day: one small query.
+    today = datetime.date.today()
+    days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    missing = [day for day in days if needs_fetch(stored.get(day), today)]
+
+    return (missing[0], missing[-1]) if missing else None
+
+async def fetch_days(email: str, creds, start: datetime.date, end: datetime.date):
+    youtube_analytics = build_service('youtubeAnalytics', 'v2', creds)
+
+    report = await run_blocking("google", youtube_analytics.reports().query(
+        ids='channel==MINE',
+        startDate=start.isoformat(),
+        endDate=end.isoformat(),
+        metrics=','.join(METRICS),
+        dimensions='day',
+        sort='day'
+    ).execute)
+
+    metrics.incr("youtube_analytics_queries")
+    metrics.incr("youtube_analytics_days_fetched", (end - start).days + 1)
+
+    today = datetime.date.today().isoformat()
+    by_day = {r[0]: r for r in report.get("rows", [])}
+    rows = []
+
+    # Days YouTube has nothing for are stored as zeros so they are not asked for again
+    for i in range((end - start).days + 1):
+        day = (start + timedelta(days=i)).isoformat()
+        values = by_day.get(day, [day, 0, 0, 0, 0])
+
+        rows.append({
+            "user_email": email,
+            "day": day,
+            **{column: int(value) for column, value in zip(COLUMNS, values[1:])},
+            "fetched_at": today
+        })
+
+    await run_blocking("supabase", supabase.table("youtube_daily_metrics").upsert(rows).execute)
+
+    return rows
+
+async def get_days(email: str, creds, days: int):
+    end = datetime.date.today()
+    start = end - timedelta(days=days)
+
+    stored = await load_days(email, start, end)
+    gap = missing_range(stored, start, end)
+
+    if gap:
+        for row in await fetch_days(email, creds, *gap):
+            stored[_date(row["day"])] = row
+
+    else:
+        metrics.incr("youtube_analytics_queries_saved")
+
+    return [stored[day] for day in sorted(stored)]
+
+def rollup(rows: list, start: datetime.date = None, end: datetime.date = None):
+    totals = dict.fromkeys(COLUMNS, 0)
+
+    for row in rows:
+        day = _date(row["day"])
+
+        if (start and day < start) or (end and day > end):
+            continue
+
+        for column in COLUMNS:
+            totals[column] += row.get(column) or 0
+
+    return totals
@@ -1,24 +1,24 @@
 import os
-from google.oauth2.credentials import Credentials
 from fastapi import APIRouter, HTTPException, Request
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, StreamingResponse
 from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
-from supabase import create_client, Client
+from google_services import build_service
 from dotenv import load_dotenv
+from db import supabase
 import base64
-import requests
+import http_client
 import secrets
 import hashlib
 from pydantic import BaseModel
-import io
-import time
-from googleapiclient.http import MediaIoBaseUpload
 from datetime import datetime, timedelta
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 import razorpay
-from supabase import Client, create_client
+from executor import run_blocking
+from token_manager import token_manager
+from jobs import JobQueue
+from typing import Optional
+import canva_export
+import youtube_sync
+import profiles
 
 
 os.environ['OAUTHLIB_RELAX_TOKEN_SCOPE'] = '1'
@@ -30,11 +30,6 @@ router = APIRouter()
 
 razorpay_client = razorpay.Client(auth=(os.getenv("RAZORPAY_KEY_ID"), os.getenv("RAZORPAY_KEY_SECRET")))
 
-supabase: Client = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_KEY")
-)
-
 SCOPES = [
     "https://www.googleapis.com/auth/yt-analytics.readonly",
     "https://www.googleapis.com/auth/youtube.readonly",
@@ -106,11 +101,11 @@ async def callback_youtube(request: Request):
 
     try:
         flow = get_google_flow()
-        flow.fetch_token(code=code)
+        await run_blocking("google", flow.fetch_token, code=code)
         credentials = flow.credentials
 
-        user_info_service = build('oauth2', 'v2', credentials=credentials)
-        user_info = user_info_service.userinfo().get().execute()
+        user_info_service = build_service('oauth2', 'v2', credentials)
+        user_info = await run_blocking("google", user_info_service.userinfo().get().execute)
 
         user_email = user_info.get('email')
 
@@ -124,9 +119,12 @@ async def callback_youtube(request: Request):
             "provider": "youtube",
             "access_token": credentials.token,
             "refresh_token": credentials.refresh_token,
+            "updated_at": "now()"
         }
 
-        supabase.table("social_tokens").upsert(data).execute()
+        await run_blocking("supabase", supabase.table("social_tokens").upsert(data).execute)
+
+        token_manager.invalidate("youtube", user_email)
 
         frontend_url = os.getenv("FRONTEND_URL", "http://127.0.0.1:3000")
         return RedirectResponse(f"{frontend_url}/dashboard?status=connected&email={user_email}")
@@ -184,20 +182,15 @@ async def callback_canva(request: Request):
             "code_verifier": code_verifier
         }
 
-        session = requests.Session()
-        retry = Retry(connect=3, backoff_factor=1)
-        adapter = HTTPAdapter(max_retries=retry)
-        session.mount('https://', adapter)
-
         print(f"Connecting to Canva API...")
-        response = session.post("https://api.canva.com/rest/v1/oauth/token", headers=headers, data=data)
+        response = await http_client.post("https://api.canva.com/rest/v1/oauth/token", headers=headers, data=data)
         tokens = response.json()
 
         if "access_token" not in tokens:
             print(f"❌ Canva Token Error: {tokens}")
             raise HTTPException(status_code=400, detail=f"Failed to retrieve tokens: {tokens}")
 
-        profile_res = session.get(
+        profile_res = await http_client.get(
             "https://api.canva.com/rest/v1/users/me/profile",
             headers={"Authorization": f"Bearer {tokens['access_token']}"}
         )
@@ -211,9 +204,12 @@ async def callback_canva(request: Request):
             "provider": "canva",
             "access_token": tokens['access_token'],
             "refresh_token": tokens.get('refresh_token'),
+            "updated_at": "now()"
         }
 
-        supabase.table("social_tokens").upsert(db_data).execute()
+        await run_blocking("supabase", supabase.table("social_tokens").upsert(db_data).execute)
+
+        token_manager.invalidate("canva", f"canva_{canva_user_id}")
         
         frontend_url = os.getenv("FRONTEND_URL", "http://127.0.0.1:3000")
         return RedirectResponse(f"{frontend_url}/studio?status=connected&canva_id={canva_user_id}")
@@ -225,41 +221,29 @@ async def callback_canva(request: Request):
 @router.get("/canva/designs")
 async def get_canva_designs(canva_id: str):
     try:
-        response =  supabase.table("social_tokens")\
-            .select("access_token, refresh_token")\
-            .eq("user_email", f"canva_{canva_id}")\
-            .eq("provider", "canva")\
-            .execute()
+        access_token = await token_manager.get_canva_token(canva_id)
 
-        if not response.data:
+        if not access_token:
             raise HTTPException(status_code=401, detail="User not connected to Canva")
-        
-        tokens = response.data[0]
-        access_token = tokens['access_token']
-        refresh_token = tokens['refresh_token']
 
         url = "https://api.canva.com/rest/v1/designs?sort_by=modified_descending&limit=10"
 
-        canvas_res = requests.get(url, 
-            headers={"Authorization": f"Bearer {access_token}"}
-        )
+        canvas_res = await http_client.get(url, headers={"Authorization": f"Bearer {access_token}"})
 
         if canvas_res.status_code == 401:
             print("Token Expired. Attempting refresh...")
 
-            new_token = refresh_canva_token(canva_id, refresh_token)
+            new_token = await token_manager.force_refresh("canva", f"canva_{canva_id}")
 
             if new_token:
-                canvas_res = requests.get(url, 
-                headers={"Authorization": f"Bearer {new_token}"}
-                )
+                canvas_res = await http_client.get(url, headers={"Authorization": f"Bearer {new_token}"})
 
             else:
                 raise HTTPException(status_code=401, detail="Session expired. Please reconnect Canva.")
 
 
         if canvas_res.status_code != 200:
-            return {"error": "Failed to fetch from Canva", "details": canva_res.json()}
+            return {"error": "Failed to fetch from Canva", "details": canvas_res.json()}
 
         return canvas_res.json()
 
@@ -268,49 +252,6 @@ async def get_canva_designs(canva_id: str):
         print(f"Design Fetch Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
         
-def refresh_canva_token(canva_user_id: str, refresh_token: str):
-    print(f"Refreshing token for {canva_user_id}...")
-
-    client_id = os.getenv("CANVA_CLIENT_ID")
-    client_secret = os.getenv("CANVA_CLIENT_SECRET")
-
-    credentials = f"{client_id}:{client_secret}"
-    encoded_credentials = base64.b64encode(credentials.encode()).decode()
-
-    headers = {
-        "Authorization": f"Basic {encoded_credentials}",
-        "Content-Type": "application/x-www-form-urlencoded"
-    }
-
-    data = {
-        "grant_type": "refresh_token",
-        "refresh_token": refresh_token
-    }
-
-    try:
-        response = requests.post("https://api.canva.com/rest/v1/oauth/token", headers=headers, data=data)
-        tokens = response.json()
-
-        if "access_token" not in tokens:
-            print(F"Refresh Failed: {tokens}")
-            return None
-
-        new_access_token = tokens['access_token']
-        new_refresh_token = tokens.get('refresh_token', refresh_token)
-
-        supabase.table("social_tokens").update({
-            "access_token": new_access_token,
-            "refresh_token": new_refresh_token,
-            "updated_at": "now()"
-        }).eq("user_email", f"canva_{canva_user_id}").eq("provider", "canva").execute()
-
-        print("Token refreshed and saved.")
-        return new_access_token
-
-    except Exception as e:
-        print(f"Refresh Logic Error: {e}")
-        return None
-
 class CreateDesignRequest(BaseModel):
     canva_id: str
     design_type: str
@@ -319,16 +260,10 @@ class CreateDesignRequest(BaseModel):
 @router.post("/canva/create")
 async def create_canva_design(payload: CreateDesignRequest):
     try:
-        response = supabase.table("social_tokens")\
-            .select("access_token")\
-            .eq("user_email", f"canva_{payload.canva_id}")\
-            .eq("provider", "canva")\
-            .execute()
+        access_token = await token_manager.get_canva_token(payload.canva_id)
 
-        if not response.data:
+        if not access_token:
             raise HTTPException(status_code=401, detail="User not connected")
-        
-        access_token = response.data[0]['access_token']
 
         api_payload = {
             "title": payload.title,
@@ -348,7 +283,7 @@ async def create_canva_design(payload: CreateDesignRequest):
             api_payload["design_type"] = {"type": "custom", "width": 1920, "height": 1080}
 
 
-        create_res = requests.post(
+        create_res = await http_client.post(
             "https://api.canva.com/rest/v1/designs",
             headers={
                 "Authorization": f"Bearer {access_token}",
@@ -370,34 +305,12 @@ async def create_canva_design(payload: CreateDesignRequest):
 @router.get("/youtube/stats")
 async def get_youtube_stats(email: str):
     try: 
-        response = supabase.table("social_tokens")\
-            .select("access_token, refresh_token")\
-            .eq("user_email", email)\
-            .eq("provider", "youtube")\
-            .execute()
+        creds = await token_manager.get_google_credentials(email)
 
-        if not response.data:
+        if not creds:
             raise HTTPException(status_code=401, detail="User not connected to YouTube")
 
-        token_data = response.data[0]
-
-        creds = Credentials(
-            token=token_data["access_token"],
-            refresh_token=token_data["refresh_token"],
-            token_uri="https://oauth2.googleapis.com/token",
-            client_id=os.getenv("GOOGLE_CLIENT_ID"),
-            client_secret=os.getenv("GOOGLE_CLIENT_SECRET"),
-            scopes=SCOPES
-        )
-
-        youtube = build('youtube', 'v3', credentials=creds)
-
-        request = youtube.channels().list(
-            part="snippet,statistics",
-            mine=True
-        )
-
-        response = request.execute()
+        response = await youtube_sync.get_channel(email, creds)
 
         if not response.get("items"):
             return {"error": "No channel found"}
@@ -419,57 +332,45 @@ async def get_youtube_stats(email: str):
         print(f"YouTube Stats Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+YOUTUBE_VIDEOS_MAX = int(os.getenv("YOUTUBE_VIDEOS_MAX", 500))
+
 @router.get("/youtube/videos")
-async def get_youtube_videos(email: str):
+async def get_youtube_videos(email: str, limit: int = 5):
+    if not 1 <= limit <= YOUTUBE_VIDEOS_MAX:
+        raise HTTPException(400, f"limit must be between 1 and {YOUTUBE_VIDEOS_MAX}")
+
     try:
-        response = supabase.table("social_tokens")\
-            .select("access_token, refresh_token")\
-            .eq("user_email", email)\
-            .eq("provider", "youtube")\
-            .execute()
-        
-        if not response.data:
-            raise HTTPException(status_code=401, detail="User not connected to YouTube")
+        creds = await token_manager.get_google_credentials(email)
 
-        token_data = response.data[0]
-        creds = Credentials(
-            token=token_data['access_token'],
-            refresh_token=token_data['refresh_token'],
-            token_uri="https://oauth2.googleapis.com/token",
-            client_id=os.getenv("GOOGLE_CLIENT_ID"),
-            client_secret=os.getenv("GOOGLE_CLIENT_SECRET"),
-            scopes=SCOPES
-        )
+        if not creds:
+            raise HTTPException(status_code=401, detail="User not connected to YouTube")
 
-        youtube = build('youtube', 'v3', credentials=creds)
+        youtube = build_service('youtube', 'v3', creds)
+        quota = youtube_sync.QuotaMeter()
 
-        channel_res = youtube.channels().list(part="contentDetails", mine=True).execute()
+        uploads_playlist_id = await youtube_sync.get_uploads_playlist(youtube, quota)
 
-        if not channel_res.get("items"):
+        if not uploads_playlist_id:
             return []
 
-        uploads_playlist_id = channel_res["items"][0]["contentDetails"]["relatedPlaylists"]["uploads"]
-
-        videos_res = youtube.playlistItems().list(
-            part="snippet,status",
-            playlistId=uploads_playlist_id,
-            maxResults=5        
-        ).execute()
-
         videos = []
 
-        for item in videos_res.get("items", []):
-            snippet = item["snippet"]
-            videos.append({
-                "id": snippet["resourceId"]["videoId"],
-                "title": snippet["title"],
-                "thumbnail": snippet["thumbnails"].get("medium", snippet["thumbnails"].get("default"))["url"],
-                "published_at": snippet["publishedAt"],
-                "status": item["status"]["privacyStatus"]
-            })
+        async for page in youtube_sync.iter_upload_pages(youtube, uploads_playlist_id, quota, limit=limit, part="snippet,status"):
+            for item in page:
+                snippet = item["snippet"]
+                videos.append({
+                    "id": snippet["resourceId"]["videoId"],
+                    "title": snippet["title"],
+                    "thumbnail": youtube_sync.thumbnail_url(snippet, "medium", "default"),
+                    "published_at": snippet["publishedAt"],
+                    "status": item["status"]["privacyStatus"]
+                })
 
         return videos
     
+    except HTTPException as he:
+        raise he
+
     except Exception as e:
         print(f"YouTube Videos Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -479,93 +380,108 @@ class ThumbnailRequest(BaseModel):
     canva_design_id: str
     youtube_email: str
     canva_user_id: str
+    background: bool = False
+    deadline: Optional[float] = None
+
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", 2))
+
+THUMBNAIL_PROGRESS = {
+    "exporting": 0.1,
+    "in_progress": 0.3,
+    "success": 0.6,
+    "uploading": 0.7
+}
+
+async def run_thumbnail_job(job):
+    payload = job.payload["request"]
+
+    def on_status(status):
+        progress = THUMBNAIL_PROGRESS.get(status, job.progress)
+
+        if progress != job.progress:
+            job.update(progress=progress)
+
+    await canva_export.export_to_thumbnail(
+        payload.canva_design_id,
+        payload.video_id,
+        job.payload["canva_token"],
+        job.payload["credentials"],
+        deadline=payload.deadline or canva_export.CANVA_EXPORT_DEADLINE,
+        on_status=on_status
+    )
+
+    return {"video_id": payload.video_id, "message": "Thumbnail updated successfully"}
+
+thumbnail_jobs = JobQueue("thumbnail", run_thumbnail_job, concurrency=THUMBNAIL_WORKERS)
+
+@router.on_event("startup")
+async def start_thumbnail_workers():
+    thumbnail_jobs.start()
+
+@router.on_event("shutdown")
+async def stop_thumbnail_workers():
+    await thumbnail_jobs.stop()
 
 @router.post("/bridge/thumbnail")
 async def update_thumbnail(payload: ThumbnailRequest):
     print(f"Starting Bridge: Design {payload.canva_design_id} -> Video {payload.video_id}")
 
     try:
-        c_res = supabase.table("social_tokens").select("access_token")\
-            .eq("user_email", f"canva_{payload.canva_user_id}")\
-            .execute()
+        canva_token = await token_manager.get_canva_token(payload.canva_user_id)
 
-        if not c_res.data:
+        if not canva_token:
             raise HTTPException(401, "Canva not connected")
 
-        canva_token = c_res.data[0]['access_token']
+        creds = await token_manager.get_google_credentials(payload.youtube_email)
 
-        y_res = supabase.table("social_tokens").select("access_token, refresh_token")\
-            .eq("user_email", payload.youtube_email).execute()
-
-        if not y_res.data: 
+        if not creds: 
             raise HTTPException(401, "YouTube not connected")
-        
-        yt_data = y_res.data[0]
 
-        print("Requesting Export from Canva...")
+        if payload.background:
+            job = await thumbnail_jobs.submit({"request": payload, "canva_token": canva_token, "credentials": creds})
 
-        export_url = "https://api.canva.com/rest/v1/exports"
-        export_payload = {
-            "design_id": payload.canva_design_id,
-            "format": {"type": "jpg", "quality": 100}
-        }
+            return {"status": "queued", "job_id": job.id}
 
-        headers = {"Authorization": f"Bearer {canva_token}", "Content-Type": "application/json"}
+        print("Exporting from Canva and uploading to YouTube...")
 
-        init_req = requests.post(export_url, json=export_payload, headers=headers)
-
-        if init_req.status_code != 200:
-            return {"error": "Canva Export Failed", "details": init_req.json()}
-
-        job_id = init_req.json()['job']['id']
-
-        download_url = None
-
-        for _ in range(10):
-            time.sleep(1)
-            status_req = requests.get(f"{export_url}/{job_id}", headers=headers)
-            job = status_req.json()['job']
-        
-            if job['status'] == 'success':
-                download_url = job['urls'][0]
-                break
-
-            elif job['status'] == 'failed':
-                raise HTTPException(500, f"Canva rendering failed: {job.get('error')}")
-
-        if not download_url:
-            raise HTTPException(408, "Canva export timed out")
-
-        print("Downloading rendered image...")
-        img_response = requests.get(download_url)
-        img_bytes = io.BytesIO(img_response.content)
-
-        print("Uploading to YouTube...")
-
-        creds = Credentials(
-            token=yt_data['access_token'],
-            refresh_token=yt_data['refresh_token'],
-            token_uri="https://oauth2.googleapis.com/token",
-            client_id=os.getenv("GOOGLE_CLIENT_ID"),
-            client_secret=os.getenv("GOOGLE_CLIENT_SECRET"),
-            scopes=SCOPES
-        )
-
-        youtube = build('youtube', 'v3', credentials=creds)
-
-        request = youtube.thumbnails().set(
-            videoId=payload.video_id,
-            media_body=MediaIoBaseUpload(img_bytes, mimetype='image/jpeg')
+        await canva_export.export_to_thumbnail(
+            payload.canva_design_id,
+            payload.video_id,
+            canva_token,
+            creds,
+            deadline=payload.deadline or canva_export.CANVA_EXPORT_DEADLINE
         )
-        request.execute()
 
         print("Success! Thumbnail Updated.")
         return {"status": "success", "message": "Thumbnail updated successfully"}
 
+    except HTTPException as he:
+        raise he
+
     except Exception as e:
         print(f"Bridge Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/bridge/thumbnail/jobs/{job_id}")
+async def get_thumbnail_job(job_id: str):
+    job = thumbnail_jobs.get(job_id)
+
+    if not job:
+        raise HTTPException(404, "Job not found")
+
+    return job.to_dict()
+
+@router.get("/bridge/thumbnail/jobs/{job_id}/events")
+async def stream_thumbnail_job(job_id: str):
+    if not thumbnail_jobs.get(job_id):
+        raise HTTPException(404, "Job not found")
+
+    return StreamingResponse(
+        thumbnail_jobs.events(job_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 class CalendarEvent(BaseModel):
     email: str
     title: str
@@ -575,37 +491,27 @@ class CalendarEvent(BaseModel):
 @router.get("/calendar/events")
 async def get_calendar_events(email: str):
     try: 
-        response = supabase.table("social_tokens").select("access_token, refresh_token")\
-            .eq("user_email", email).execute()
+        creds = await token_manager.get_google_credentials(email)
 
-        if not response.data: 
+        if not creds:
             raise HTTPException(401, "User not connected")
-        
-        token_data = response.data[0]
-
-        creds = Credentials(
-            token=token_data['access_token'],
-            refresh_token=token_data['refresh_token'],
-            token_uri="https://oauth2.googleapis.com/token",
-            client_id=os.getenv("GOOGLE_CLIENT_ID"),
-            client_secret=os.getenv("GOOGLE_CLIENT_SECRET"),
-            scopes=SCOPES
-        )
 
-        service = build('calendar', 'v3', credentials=creds)
+        service = build_service('calendar', 'v3', creds)
 
         now = datetime.utcnow()
         time_min = (now - timedelta(days=30)).isoformat() + 'Z'
         time_max = (now + timedelta(days=90)).isoformat() + 'Z'
 
-        events_result = service.events().list(
+        request = service.events().list(
             calendarId='primary',
             timeMin=time_min,
             timeMax=time_max,
             q="AfterGlow",
             singleEvents=True,
             orderBy='startTime'
-        ).execute()
+        )
+
+        events_result = await run_blocking("google", request.execute)
 
         return events_result.get('items', [])
 
@@ -616,24 +522,12 @@ async def get_calendar_events(email: str):
 @router.post("/calendar/create")
 async def create_calendar_event(payload: CalendarEvent):
     try:
-        response = supabase.table("social_tokens").select("access_token, refresh_token")\
-            .eq("user_email", payload.email).execute()
+        creds = await token_manager.get_google_credentials(payload.email)
 
-        if not response.data:
+        if not creds:
             raise HTTPException(401, "User not connected")
-        
-        token_data = response.data[0]
-
-        creds = Credentials(
-            token=token_data['access_token'],
-            refresh_token=token_data['refresh_token'],
-            token_uri="https://oauth2.googleapis.com/token",
-            client_id=os.getenv("GOOGLE_CLIENT_ID"),
-            client_secret=os.getenv("GOOGLE_CLIENT_SECRET"),
-            scopes=SCOPES
-        )
 
-        service = build('calendar', 'v3', credentials=creds)
+        service = build_service('calendar', 'v3', creds)
 
         event = {
             'summary': payload.title,
@@ -648,7 +542,7 @@ async def create_calendar_event(payload: CalendarEvent):
             },
         }
 
-        event = service.events().insert(calendarId='primary', body=event).execute()
+        event = await run_blocking("google", service.events().insert(calendarId='primary', body=event).execute)
 
         return event
 
@@ -663,21 +557,24 @@ class CheckoutRequest(BaseModel):
 @router.post("/stripe/create-checkout-session")
 async def create_checkout_session(payload: CheckoutRequest):
     try:
-        res = supabase.table("profiles").select("*")\
-            .eq("user_email", payload.email).execute()
+        profile = await profiles.get_profile(payload.email)
 
         customer_id = None
-        if res.data:
-            customer_id = res.data[0].get('stripe_customer_id')
+        if profile:
+            customer_id = profile.get('stripe_customer_id')
 
         if not customer_id:
-            customer = stripe.Customer.create(email=payload.email)
+            customer = await run_blocking("payments", stripe.Customer.create, email=payload.email)
             customer_id = customer.id
 
-            supabase.table("profiles").upsert({
+            query = supabase.table("profiles").upsert({
                 "user_email": payload.email,
                 "stripe_customer_id": customer_id
-            }, on_conflict="user_email").execute()
+            }, on_conflict="user_email")
+
+            await run_blocking("supabase", query.execute)
+
+            profiles.invalidate(payload.email)
 
         prices = {
             "starter": "price_1Qr...",  # $15/mo Recurring
@@ -691,7 +588,9 @@ async def create_checkout_session(payload: CheckoutRequest):
         
         mode = "subscription" if payload.plan_type in ['starter', 'pro'] else "payment"
 
-        checkout_session = stripe.checkout.Session.create(
+        checkout_session = await run_blocking(
+            "payments",
+            stripe.checkout.Session.create,
             customer=customer_id,
             payment_method_types=['card'],
             line_items=[{
@@ -716,16 +615,19 @@ async def create_checkout_session(payload: CheckoutRequest):
 @router.get("/user/credits")
 async def get_user_credits(email: str):
     try:
-        res = supabase.table("profiles")\
-            .select("credits_balance, subscription_tier")\
-            .eq("user_email", email).execute()
+        profile = await profiles.get_profile(email)
 
-        if res.data:
-            return res.data[0]
+        if profile:
+            return {
+                "credits_balance": profile["credits_balance"],
+                "subscription_tier": profile["subscription_tier"]
+            }
 
         else:
             new_profile = {"user_email": email, "credits_balance": 50, "subscription_tier": "free"}
-            supabase.table("profiles").insert(new_profile).execute()
+            await run_blocking("supabase", supabase.table("profiles").insert(new_profile).execute)
+
+            profiles.store(email, new_profile)
 
             return new_profile
 
@@ -760,11 +662,15 @@ async def create_razorpay_order(payload: OrderRequest):
             }
         }
 
-        order = razorpay_client.order.create(data=data)
+        order = await run_blocking("payments", razorpay_client.order.create, data=data)
 
-        supabase.table("profiles").upsert({
+        query = supabase.table("profiles").upsert({
             "user_email": payload.email,
-        }, on_conflict="user_email").execute()
+        }, on_conflict="user_email")
+
+        await run_blocking("supabase", query.execute)
+
+        profiles.invalidate(payload.email)
 
         return order
     
@@ -772,26 +678,6 @@ async def create_razorpay_order(payload: OrderRequest):
         print(f"Razorpay Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/user/credits")
-async def get_user_credits(email:str):
-    try:
-        res = supabase.table("profiles")\
-            .select("credits_balance, subscription_tier")\
-            .eq("user_email", email).execute()
-
-        if res.data:
-            return res.data[0]
-
-        else:
-            new_profile = {"user_email": email, "credits_balance": 50, "subscription_tier": "free"}
-            supabase.table("profiles")\
-                .insert(new_profile).execute()
-            
-            return new_profile
-        
-    except Exception as e:
-        raise HTTPException(500, str(e))
-
 @router.get("/auth/instagram/login")
 async def login_instagram():
     client_id = os.getenv("INSTAGRAM_CLIENT_ID")
@@ -838,7 +724,8 @@ async def callback_instagram(request: Request):
             f"code={code}"
         )
 
-        token_res = requests.get(token_url).json()
+        token_response = await http_client.get(token_url)
+        token_res = token_response.json()
 
         if "access_token" not in token_res:
             raise HTTPException(400, f"Token exchange failed: {token_res}")
@@ -846,7 +733,7 @@ async def callback_instagram(request: Request):
         access_token = token_res["access_token"]
 
         pages_url = f"https://graph.facebook.com/v18.0/me/accounts?access_token={access_token}"
-        pages_res = requests.get(pages_url)
+        pages_res = await http_client.get(pages_url)
         print(f"DEBUG Status: {pages_res.status_code}")
         print(f"DEBUG Raw Body: {pages_res.text}")
         data = pages_res.json()
@@ -860,9 +747,8 @@ async def callback_instagram(request: Request):
                 page_id = page["id"]
                 page_name = page["name"]
 
-                ig_req = requests.get(
-                    f"https://graph.facebook.com/v18.0/{page_id}?fields=instagram_business_account&access_token={access_token}"
-                ).json()
+                page_res = await http_client.get(f"https://graph.facebook.com/v18.0/{page_id}?fields=instagram_business_account&access_token={access_token}")
+                ig_req = page_res.json()
 
                 print(f"DEBUG: Checking Page '{page_name}' ({page_id}): {ig_req}")
 
@@ -885,7 +771,9 @@ async def callback_instagram(request: Request):
             "updated_at": "now()"
         }
 
-        supabase.table("social_tokens").upsert(db_data).execute()
+        await run_blocking("supabase", supabase.table("social_tokens").upsert(db_data).execute)
+
+        token_manager.invalidate("instagram", f"instagram_{ig_user_id}")
 
         return RedirectResponse(
             f"{os.getenv('FRONTEND_URL')}/dashboard?status=connected&instagram_id={ig_user_id}"
@@ -904,27 +792,14 @@ class UpdateEventStatusRequest(BaseModel):
 @router.post("/calendar/mark-complete")
 async def mark_calendar_event_complete(payload: UpdateEventStatusRequest):
     try:
-        response = supabase.table("social_tokens")\
-            .select("access_token, refresh_token")\
-            .eq("user_email", payload.email).execute()
+        creds = await token_manager.get_google_credentials(payload.email)
 
-        if not response.data:
+        if not creds:
             raise HTTPException(401, "User not connected")
 
-        token_data = response.data[0]
-
-        creds = Credentials(
-            token=token_data['access_token'],
-            refresh_token=token_data['refresh_token'],
-            token_uri="https://oauth2.googleapis.com/token",
-            client_id=os.getenv("GOOGLE_CLIENT_ID"),
-            client_secret=os.getenv("GOOGLE_CLIENT_SECRET"),
-            scopes=SCOPES
-        )
-
-        service = build('calendar', 'v3', credentials=creds)
+        service = build_service('calendar', 'v3', creds)
 
-        event = service.events().get(calendarId='primary', eventId=payload.event_id).execute()
+        event = await run_blocking("google", service.events().get(calendarId='primary', eventId=payload.event_id).execute)
 
         current_desc = event.get('description', '')
 
@@ -941,11 +816,13 @@ async def mark_calendar_event_complete(payload: UpdateEventStatusRequest):
 
             changes['colorId'] = None
 
-        updated_event = service.events().patch(
+        request = service.events().patch(
             calendarId='primary',
             eventId=payload.event_id,
             body=changes
-        ).execute()
+        )
+
+        updated_event = await run_blocking("google", request.execute)
 
         return {"status": "success", "event": updated_event}
 
@@ -993,17 +870,19 @@ async def callback_linkedin(request: Request):
             "Content-Type": "application/x-www-form-urlencoded"
         }
 
-        token_res = requests.post(token_url, data=data, headers=headers).json()
+        token_response = await http_client.post(token_url, data=data, headers=headers)
+        token_res = token_response.json()
 
         access_token = token_res.get("access_token")
 
         if not access_token:
             raise HTTPException(400, f"Failed to retrieve LinkedIn token: {token_res}")
 
-        profile_res = requests.get(
+        profile_response = await http_client.get(
             "https://api.linkedin.com/v2/userinfo",
             headers={"Authorization": f"Bearer {access_token}"}
-        ).json()
+        )
+        profile_res = profile_response.json()
 
         linkedin_urn = profile_res.get("sub")
         # email = profile_res.get("email")
@@ -1016,7 +895,9 @@ async def callback_linkedin(request: Request):
             "updated_at": "now()"
         }
 
-        supabase.table("social_tokens").upsert(db_data).execute()
+        await run_blocking("supabase", supabase.table("social_tokens").upsert(db_data).execute)
+
+        token_manager.invalidate("linkedin", f"linkedin_{linkedin_urn}")
 
         frontend_url = os.getenv("FRONTEND_URL", "http://127.0.0.1:3000")
 
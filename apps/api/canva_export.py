@@ -0,0 +1,115 @@
+import os
+import time
+import asyncio
+import tempfile
+import http_client
+from fastapi import HTTPException
+from googleapiclient.http import MediaIoBaseUpload
+from dotenv import load_dotenv
+from google_services import build_service
+from executor import run_blocking
+
+
+load_dotenv()
+
+CANVA_EXPORT_URL = "https://api.canva.com/rest/v1/exports"
+
+CANVA_EXPORT_DEADLINE = float(os.getenv("CANVA_EXPORT_DEADLINE", 60))
+CANVA_POLL_INITIAL = float(os.getenv("CANVA_POLL_INITIAL", 0.5))
+CANVA_POLL_MAX = float(os.getenv("CANVA_POLL_MAX", 5))
+CANVA_POLL_BACKOFF = float(os.getenv("CANVA_POLL_BACKOFF", 1.5))
+
+# Thumbnails are capped at 2MB by YouTube, so this normally stays in memory
+THUMBNAIL_SPOOL_SIZE = int(os.getenv("THUMBNAIL_SPOOL_SIZE", 4 * 1024 * 1024))
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+async def start_export(design_id: str, access_token: str, quality: int = 100):
+    headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
+
+    res = await http_client.post(CANVA_EXPORT_URL, json={
+        "design_id": design_id,
+        "format": {"type": "jpg", "quality": quality}
+    }, headers=headers)
+
+    if res.status_code != 200:
+        raise HTTPException(502, f"Canva Export Failed: {res.text}")
+
+    return res.json()['job']['id']
+
+async def wait_for_export(export_id: str, access_token: str, deadline: float = CANVA_EXPORT_DEADLINE, on_status=None):
+    headers = {"Authorization": f"Bearer {access_token}"}
+    give_up_at = time.monotonic() + deadline
+    delay = CANVA_POLL_INITIAL
+
+    while True:
+        remaining = give_up_at - time.monotonic()
+
+        if remaining <= 0:
+            raise HTTPException(408, "Canva export timed out")
+
+        await asyncio.sleep(min(delay, remaining))
+        delay = min(delay * CANVA_POLL_BACKOFF, CANVA_POLL_MAX)
+
+        res = await http_client.get(f"{CANVA_EXPORT_URL}/{export_id}", headers=headers)
+
+        if res.status_code == 429:
+            # Rate limited: honour Retry-After when given, otherwise back off harder
+            delay = max(delay, float(res.headers.get("Retry-After") or CANVA_POLL_MAX))
+            continue
+
+        if res.status_code != 200:
+            raise HTTPException(502, f"Canva export status failed: {res.text}")
+
+        job = res.json()['job']
+
+        if on_status:
+            on_status(job['status'])
+
+        if job['status'] == 'success':
+            return job['urls'][0]
+
+        elif job['status'] == 'failed':
+            raise HTTPException(500, f"Canva rendering failed: {job.get('error')}")
+
+def upload_thumbnail(credentials, video_id: str, image, mimetype: str = 'image/jpeg'):
+    youtube = build_service('youtube', 'v3', credentials)
+
+    request = youtube.thumbnails().set(
+        videoId=video_id,
+        media_body=MediaIoBaseUpload(image, mimetype=mimetype, chunksize=DOWNLOAD_CHUNK_SIZE, resumable=True)
+    )
+
+    response = None
+
+    while response is None:
+        _, response = request.next_chunk()
+
+    return response
+
+async def transfer_thumbnail(credentials, video_id: str, download_url: str):
+    # The Canva response is copied chunk by chunk into a spooled file that
+    # MediaIoBaseUpload reads from directly, instead of holding
+    # response.content and a BytesIO copy of it at the same time.
+    with tempfile.SpooledTemporaryFile(max_size=THUMBNAIL_SPOOL_SIZE) as spool:
+        async with http_client.stream("GET", download_url, provider="media") as res:
+            res.raise_for_status()
+
+            async for chunk in res.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                spool.write(chunk)
+
+        spool.seek(0)
+
+        return await run_blocking("google", upload_thumbnail, credentials, video_id, spool)
+
+async def export_to_thumbnail(design_id: str, video_id: str, canva_token: str, credentials, deadline: float = CANVA_EXPORT_DEADLINE, on_status=None):
+    export_id = await start_export(design_id, canva_token)
+
+    if on_status:
+        on_status("exporting")
+
+    download_url = await wait_for_export(export_id, canva_token, deadline, on_status)
+
+    if on_status:
+        on_status("uploading")
+
+    return await transfer_thumbnail(credentials, video_id, download_url)
@@ -0,0 +1,157 @@
+import io
+import os
+import numpy as np
+from PIL import Image
+from dotenv import load_dotenv
+
+
+load_dotenv()
+
+SAMPLE_SIZE = int(os.getenv("COLOR_SAMPLE_SIZE", 50))
+PALETTE_SIZE = int(os.getenv("COLOR_PALETTE_SIZE", 5))
+QUANTIZE_BITS = int(os.getenv("COLOR_QUANTIZE_BITS", 4))
+KMEANS_ITERATIONS = int(os.getenv("COLOR_KMEANS_ITERATIONS", 8))
+
+# Near-black and near-white pixels are letterboxing / text, not the thumbnail's color
+DARK_THRESHOLD = 30
+LIGHT_THRESHOLD = 220
+
+METHODS = ("histogram", "kmeans")
+
+def to_hex(rgb) -> str:
+    r, g, b = (int(round(c)) for c in rgb)
+
+    return "#{:02x}{:02x}{:02x}".format(r, g, b)
+
+def decode(data: bytes, size: int = SAMPLE_SIZE):
+    img = Image.open(io.BytesIO(data))
+
+    # Lets the JPEG decoder downscale by 2/4/8 while decoding instead of
+    # producing the full 480x360 frame only to throw most of it away
+    img.draft('RGB', (size * 2, size * 2))
+
+    img = img.convert('RGB').resize((size, size))
+
+    return np.asarray(img, dtype=np.uint8).reshape(-1, 3)
+
+def _colorful_mask(pixels):
+    dark = (pixels < DARK_THRESHOLD).all(axis=-1)
+    light = (pixels > LIGHT_THRESHOLD).all(axis=-1)
+    mask = ~(dark | light)
+
+    # Thumbnails that are entirely black/white fall back to every pixel
+    mask[~mask.any(axis=-1)] = True
+
+    return mask
+
+def histogram_palettes(batch, k: int = PALETTE_SIZE, bits: int = QUANTIZE_BITS):
+    # batch is (images, pixels, 3). Every image gets its own block of
+    # 2^(3*bits) bins so one bincount builds all the histograms at once.
+    n = batch.shape[0]
+    bins = 1 << (3 * bits)
+    mask = _colorful_mask(batch)
+
+    q = (batch >> (8 - bits)).astype(np.int64)
+    codes = (q[..., 0] << (2 * bits)) | (q[..., 1] << bits) | q[..., 2]
+    codes += np.arange(n, dtype=np.int64)[:, None] * bins
+
+    flat = codes[mask]
+    kept = batch[mask].astype(np.float64)
+
+    counts = np.bincount(flat, minlength=n * bins).reshape(n, bins)
+    sums = np.stack(
+        [np.bincount(flat, weights=kept[:, c], minlength=n * bins) for c in range(3)],
+        axis=-1
+    ).reshape(n, bins, 3)
+
+    # Only the k largest bins are ordered; a full sort of every bin is wasted work
+    k = min(k, bins)
+    top = np.argpartition(-counts, k - 1, axis=1)[:, :k]
+    top = np.take_along_axis(top, np.argsort(-np.take_along_axis(counts, top, axis=1), axis=1, kind="stable"), axis=1)
+    totals = mask.sum(axis=1)
+
+    palettes = []
+
+    for i in range(n):
+        palette = []
+
+        for b in top[i]:
+            count = counts[i, b]
+
+            if not count:
+                break
+
+            # Report the mean of the pixels in the bin, not the bin's corner
+            palette.append((sums[i, b] / count, count / totals[i]))
+
+        palettes.append(palette)
+
+    return palettes
+
+def kmeans_palette(pixels, k: int = PALETTE_SIZE, iterations: int = KMEANS_ITERATIONS):
+    pixels = pixels[_colorful_mask(pixels)].astype(np.float32)
+
+    # Seeding from the histogram keeps the result deterministic and means a
+    # handful of Lloyd iterations is enough to converge on 2,500 pixels
+    seeds = histogram_palettes(pixels[None].astype(np.uint8), k)[0]
+    centers = np.array([color for color, _ in seeds], dtype=np.float32)
+    k = len(centers)
+
+    for _ in range(iterations):
+        distances = ((pixels[:, None, :] - centers[None, :, :]) ** 2).sum(axis=-1)
+        labels = distances.argmin(axis=1)
+        counts = np.bincount(labels, minlength=k)
+
+        updated = np.stack([np.bincount(labels, weights=pixels[:, c], minlength=k) for c in range(3)], axis=-1)
+        populated = counts > 0
+        updated[populated] /= counts[populated, None]
+        updated[~populated] = centers[~populated]
+
+        if np.allclose(updated, centers, atol=0.5):
+            centers = updated
+            break
+
+        centers = updated.astype(np.float32)
+
+    distances = ((pixels[:, None, :] - centers[None, :, :]) ** 2).sum(axis=-1)
+    counts = np.bincount(distances.argmin(axis=1), minlength=k)
+    order = np.argsort(-counts, kind="stable")
+
+    return [(centers[i], counts[i] / len(pixels)) for i in order if counts[i]]
+
+def extract_palettes(images: list, k: int = PALETTE_SIZE, method: str = "histogram"):
+    # images is a list of raw image bytes (None for downloads that failed);
+    # returns one palette per input, each a list of {"color", "share"} sorted
+    # by share, with an empty list for anything that could not be decoded.
+    decoded = {}
+
+    for i, data in enumerate(images):
+        if not data:
+            continue
+
+        try:
+            decoded[i] = decode(data)
+
+        except Exception as e:
+            print(f"Color decode failed: {e}")
+
+    results = [[] for _ in images]
+
+    if not decoded:
+        return results
+
+    indexes = list(decoded.keys())
+
+    if method == "kmeans":
+        palettes = [kmeans_palette(decoded[i], k) for i in indexes]
+
+    else:
+        palettes = histogram_palettes(np.stack([decoded[i] for i in indexes]), k)
+
+    for i, palette in zip(indexes, palettes):
+        results[i] = [{"color": to_hex(color), "share": round(float(share), 4)} for color, share in palette]
+
+    return results
+
+def dominant_color(palette: list, default: str = "#000000") -> str:
+    return palette[0]["color"] if palette else default
@@ -0,0 +1,165 @@
+import os
+import asyncio
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Optional
+from fastapi import HTTPException
+from dotenv import load_dotenv
+from db import supabase
+from executor import run_blocking
+import profiles
+
+
+load_dotenv()
+
+DEFAULT_CREDITS = 50
+DEFAULT_TIER = "free"
+
+CREDIT_RESERVATION_TIMEOUT = int(os.getenv("CREDIT_RESERVATION_TIMEOUT", 1800))
+CREDIT_SWEEP_INTERVAL = int(os.getenv("CREDIT_SWEEP_INTERVAL", 60))
+
+@dataclass
+class Reservation:
+    id: Optional[str]
+    email: str
+    amount: int
+    balance: int
+    tier: str
+
+async def reserve(email: str, amount: int, reason: str = None, commit: bool = False, create_missing: bool = True) -> Reservation:
+    # One round trip: conditional decrement + ledger row, returning the tier
+    res = await run_blocking("supabase", supabase.rpc("reserve_credits", {
+        "p_email": email,
+        "p_amount": amount,
+        "p_reason": reason,
+        "p_commit": commit
+    }).execute)
+
+    if res.data:
+        row = res.data[0]
+
+        profiles.update_cached(email, credits_balance=row["credits_balance"], subscription_tier=row["subscription_tier"])
+
+        return Reservation(
+            id=row["reservation_id"],
+            email=email,
+            amount=amount,
+            balance=row["credits_balance"],
+            tier=row["subscription_tier"]
+        )
+
+    # Only the failure path pays for a second query to tell the cases apart
+    profile = await run_blocking("supabase", supabase.table("profiles").select("credits_balance")\
+        .eq("user_email", email).execute)
+
+    if not profile.data:
+        if not create_missing:
+            raise HTTPException(404, "user not found. Please visit Pricing page to initialize.")
+
+        new_profile = {
+            "user_email": email,
+            "credits_balance": DEFAULT_CREDITS,
+            "subscription_tier": DEFAULT_TIER
+        }
+
+        await run_blocking("supabase", supabase.table("profiles").insert(new_profile).execute)
+
+        profiles.store(email, new_profile)
+
+        return Reservation(id=None, email=email, amount=0, balance=DEFAULT_CREDITS, tier=DEFAULT_TIER)
+
+    raise HTTPException(402, detail=f"Insufficient credits. Need {amount}, have {profile.data[0]['credits_balance']}.")
+
+async def debit(email: str, amount: int, reason: str = None) -> Reservation:
+    return await reserve(email, amount, reason=reason, commit=True)
+
+async def add(email: str, amount: int, tier: str = None) -> Optional[int]:
+    # Atomic top-up; returns the new balance, or None if there is no profile
+    res = await run_blocking("supabase", supabase.rpc("add_credits", {
+        "p_email": email,
+        "p_amount": amount,
+        "p_tier": tier
+    }).execute)
+
+    profiles.invalidate(email)
+
+    return res.data
+
+async def commit(reservation: Reservation) -> bool:
+    if not reservation.id:
+        return False
+
+    res = await run_blocking("supabase", supabase.rpc("commit_credits", {
+        "p_reservation_id": reservation.id
+    }).execute)
+
+    return bool(res.data)
+
+async def refund(reservation: Reservation):
+    if not reservation.id:
+        return None
+
+    res = await run_blocking("supabase", supabase.rpc("refund_credits", {
+        "p_reservation_id": reservation.id
+    }).execute)
+
+    if res.data is not None:
+        profiles.update_cached(reservation.email, credits_balance=res.data)
+
+    return res.data
+
+async def renew(reservation: Reservation) -> bool:
+    # Restarts the hold's CREDIT_RESERVATION_TIMEOUT; False once it was settled or swept
+    if not reservation.id:
+        return False
+
+    res = await run_blocking("supabase", supabase.rpc("renew_credit_reservation", {
+        "p_reservation_id": reservation.id
+    }).execute)
+
+    return bool(res.data)
+
+@asynccontextmanager
+async def hold(email: str, amount: int, reason: str = None, create_missing: bool = True):
+    reservation = await reserve(email, amount, reason=reason, create_missing=create_missing)
+
+    try:
+        yield reservation
+
+    except BaseException:
+        # Shielded so a client disconnect cannot cancel the refund itself
+        try:
+            await asyncio.shield(refund(reservation))
+
+        except Exception as e:
+            print(f"Credit refund failed for {email} ({reservation.id}): {e}")
+
+        raise
+
+    try:
+        await commit(reservation)
+
+    except Exception as e:
+        print(f"Credit commit failed for {email} ({reservation.id}): {e}")
+
+async def expire_stale_reservations(max_age: int = CREDIT_RESERVATION_TIMEOUT) -> int:
+    res = await run_blocking("supabase", supabase.rpc("expire_credit_reservations", {
+        "p_max_age_seconds": max_age
+    }).execute)
+
+    return res.data or 0
+
+async def run_reservation_sweeper(interval: int = CREDIT_SWEEP_INTERVAL):
+    while True:
+        try:
+            released = await expire_stale_reservations()
+
+            if released:
+                # The RPC does not say whose balances moved, so drop them all
+                profiles.clear()
+                print(f"Released {released} stale credit reservations")
+
+        except Exception as e:
+            print(f"Credit sweeper error: {e}")
+
+        await asyncio.sleep(interval)
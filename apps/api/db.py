@@ -0,0 +1,37 @@
+import os
+import httpx
+from supabase import create_client, Client, ClientOptions
+from dotenv import load_dotenv
+
+
+load_dotenv()
+
+SUPABASE_POOL_SIZE = int(os.getenv("SUPABASE_POOL_SIZE", 20))
+SUPABASE_KEEPALIVE_CONNECTIONS = int(os.getenv("SUPABASE_KEEPALIVE_CONNECTIONS", 20))
+SUPABASE_KEEPALIVE_EXPIRY = float(os.getenv("SUPABASE_KEEPALIVE_EXPIRY", 60))
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", 15))
+SUPABASE_CONNECT_TIMEOUT = float(os.getenv("SUPABASE_CONNECT_TIMEOUT", 5))
+SUPABASE_HTTP2 = os.getenv("SUPABASE_HTTP2", "true").lower() == "true"
+
+# One connection pool shared by PostgREST, Storage, Auth and Functions for the
+# whole process. Calls still go through executor.run_blocking("supabase", ...),
+# so POOL_SIZE_SUPABASE threads multiplex over these keep-alive connections.
+http_client = httpx.Client(
+    http2=SUPABASE_HTTP2,
+    limits=httpx.Limits(
+        max_connections=SUPABASE_POOL_SIZE,
+        max_keepalive_connections=SUPABASE_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=SUPABASE_KEEPALIVE_EXPIRY
+    ),
+    timeout=httpx.Timeout(SUPABASE_TIMEOUT, connect=SUPABASE_CONNECT_TIMEOUT),
+    follow_redirects=True
+)
+
+supabase: Client = create_client(
+    os.getenv("SUPABASE_URL"),
+    os.getenv("SUPABASE_KEY"),
+    options=ClientOptions(httpx_client=http_client)
+)
+
+def close_supabase():
+    http_client.close()
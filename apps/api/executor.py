@@ -0,0 +1,118 @@
+import os
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+
+load_dotenv()
+
+# Every provider SDK we use is synchronous. Each provider gets its own bounded
+# thread pool so a slow provider (Replicate, HF) can only exhaust its own
+# workers and never the event loop or the pools used by cheap routes.
+POOL_SIZES = {
+    "supabase": int(os.getenv("POOL_SIZE_SUPABASE", 16)),
+    "groq": int(os.getenv("POOL_SIZE_GROQ", 8)),
+    "gemini": int(os.getenv("POOL_SIZE_GEMINI", 8)),
+    "huggingface": int(os.getenv("POOL_SIZE_HUGGINGFACE", 4)),
+    "replicate": int(os.getenv("POOL_SIZE_REPLICATE", 4)),
+    "google": int(os.getenv("POOL_SIZE_GOOGLE", 8)),
+    "payments": int(os.getenv("POOL_SIZE_PAYMENTS", 4)),
+    "images": int(os.getenv("POOL_SIZE_IMAGES", 2)),
+}
+
+DEFAULT_POOL_SIZE = int(os.getenv("POOL_SIZE_DEFAULT", 4))
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(provider: str) -> ThreadPoolExecutor:
+    pool = _pools.get(provider)
+
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(provider)
+
+            if pool is None:
+                pool = ThreadPoolExecutor(
+                    max_workers=POOL_SIZES.get(provider, DEFAULT_POOL_SIZE),
+                    thread_name_prefix=f"{provider}-pool"
+                )
+                _pools[provider] = pool
+
+    return pool
+
+async def run_blocking(provider: str, func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+
+    return await loop.run_in_executor(get_pool(provider), functools.partial(func, *args, **kwargs))
+
+async def iterate_blocking(provider: str, func, *args, **kwargs):
+    # Drives a blocking iterator (e.g. an SDK's streaming response) on the
+    # provider's pool and yields its items on the loop as they arrive. Closing
+    # the generator stops the worker before its next item and closes the
+    # iterator, which releases the underlying HTTP stream.
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stop = threading.Event()
+    done = object()
+
+    def emit(item, error=None):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, (item, error))
+
+        except RuntimeError:
+            # The loop is gone; nobody is listening any more
+            stop.set()
+
+    def produce():
+        iterator = None
+
+        try:
+            iterator = func(*args, **kwargs)
+
+            for item in iterator:
+                if stop.is_set():
+                    break
+
+                emit(item)
+
+            emit(done)
+
+        except Exception as e:
+            emit(done, e)
+
+        finally:
+            close = getattr(iterator, "close", None)
+
+            if close:
+                try:
+                    close()
+
+                except Exception:
+                    pass
+
+    loop.run_in_executor(get_pool(provider), produce)
+
+    try:
+        while True:
+            item, error = await queue.get()
+
+            if item is done:
+                if error:
+                    raise error
+
+                return
+
+            yield item
+
+    finally:
+        stop.set()
+
+def shutdown_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        _pools.clear()
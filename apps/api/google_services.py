@@ -0,0 +1,46 @@
+import json
+import threading
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+
+
+# Every API this service talks to; parsed once at startup from the discovery
+# documents bundled with google-api-python-client, so no network is needed.
+DISCOVERY_APIS = [
+    ("youtube", "v3"),
+    ("youtubeAnalytics", "v2"),
+    ("drive", "v3"),
+    ("calendar", "v3"),
+    ("oauth2", "v2"),
+]
+
+_documents = {}
+_lock = threading.Lock()
+
+def get_discovery_document(api: str, version: str) -> dict:
+    key = (api, version)
+    document = _documents.get(key)
+
+    if document is None:
+        with _lock:
+            document = _documents.get(key)
+
+            if document is None:
+                raw = get_static_doc(api, version)
+
+                if raw is None:
+                    raise ValueError(f"No bundled discovery document for {api} {version}")
+
+                document = json.loads(raw)
+                _documents[key] = document
+
+    return document
+
+def build_service(api: str, version: str, credentials):
+    # build_from_document only reads the parsed document, so binding a user's
+    # credentials is a cheap Resource construction instead of a JSON parse.
+    return build_from_document(get_discovery_document(api, version), credentials=credentials)
+
+def preload_discovery_documents():
+    for api, version in DISCOVERY_APIS:
+        get_discovery_document(api, version)
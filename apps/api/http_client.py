@@ -0,0 +1,219 @@
+import os
+import time
+import random
+import asyncio
+import httpx
+from urllib.parse import urlsplit
+from dotenv import load_dotenv
+import metrics
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+load_dotenv()
+
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 15))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", 3))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", 0.25))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", 8))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 30))
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+def _provider_setting(provider: str, name: str, default):
+    return type(default)(os.getenv(f"HTTP_{name}_{provider.upper()}", default))
+
+# rate is requests/second (token bucket refill), burst its capacity and
+# connections the pool size per host. Values can be overridden per provider,
+# e.g. HTTP_RATE_LINKEDIN=5 or HTTP_CONNECTIONS_MEDIA=64.
+PROVIDERS = {
+    "linkedin": {"rate": 10.0, "burst": 20, "connections": 16},
+    "canva": {"rate": 5.0, "burst": 10, "connections": 8},
+    "facebook": {"rate": 10.0, "burst": 20, "connections": 8},
+    "media": {"rate": 50.0, "burst": 100, "connections": 32},
+    "default": {"rate": 20.0, "burst": 40, "connections": 16},
+}
+
+HOST_PROVIDERS = {
+    "api.linkedin.com": "linkedin",
+    "www.linkedin.com": "linkedin",
+    "api.canva.com": "canva",
+    "graph.facebook.com": "facebook",
+}
+
+class RateLimiter:
+    # Token bucket; callers wait for a token instead of being rejected, so a
+    # burst of requests is smoothed to the provider's allowed rate.
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+def backoff_delay(attempt: int, retry_after: str = None) -> float:
+    if retry_after:
+        try:
+            return min(float(retry_after), HTTP_BACKOFF_MAX)
+
+        except ValueError:
+            pass
+
+    # Full jitter: spreads retries from many requests instead of synchronising them
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * (2 ** attempt)))
+
+class ProviderClient:
+    def __init__(self, name: str):
+        settings = PROVIDERS.get(name, PROVIDERS["default"])
+        connections = _provider_setting(name, "CONNECTIONS", settings["connections"])
+
+        self.name = name
+        self.limiter = RateLimiter(
+            _provider_setting(name, "RATE", settings["rate"]),
+            _provider_setting(name, "BURST", settings["burst"])
+        )
+        # httpx keeps a separate keep-alive pool per origin inside the client
+        self.client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=connections,
+                max_keepalive_connections=connections,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+            ),
+            follow_redirects=True
+        )
+
+    async def request(self, method: str, url: str, retries: int = None, idempotent: bool = None, **kwargs):
+        method = method.upper()
+        retries = HTTP_RETRIES if retries is None else retries
+        idempotent = method in IDEMPOTENT_METHODS if idempotent is None else idempotent
+        attempt = 0
+
+        while True:
+            await self.limiter.acquire()
+            started = time.perf_counter()
+
+            try:
+                response = await self.client.request(method, url, **kwargs)
+
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+                # The request never reached the server, so even a POST is safe to resend
+                if attempt >= retries:
+                    metrics.incr(f"http_{self.name}_errors")
+                    raise
+
+                error = e
+
+            except httpx.TransportError:
+                if not idempotent or attempt >= retries:
+                    metrics.incr(f"http_{self.name}_errors")
+                    raise
+
+                error = None
+
+            else:
+                metrics.observe(f"http_{self.name}_seconds", time.perf_counter() - started)
+
+                if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                    return response
+
+                # 429 means the request was rejected before doing anything
+                if not idempotent and response.status_code != 429:
+                    return response
+
+                await response.aclose()
+                error = response
+
+            delay = backoff_delay(attempt, error.headers.get("Retry-After") if isinstance(error, httpx.Response) else None)
+            attempt += 1
+            metrics.incr(f"http_{self.name}_retries")
+
+            await asyncio.sleep(delay)
+
+    def stream(self, method: str, url: str, **kwargs):
+        # Streaming bodies can't be replayed, so these are not retried; the
+        # caller still goes through the provider's rate limit.
+        return _RateLimitedStream(self, method, url, kwargs)
+
+    async def get(self, url: str, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def put(self, url: str, **kwargs):
+        return await self.request("PUT", url, **kwargs)
+
+    async def delete(self, url: str, **kwargs):
+        return await self.request("DELETE", url, **kwargs)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+class _RateLimitedStream:
+    def __init__(self, provider: ProviderClient, method: str, url: str, kwargs: dict):
+        self.provider = provider
+        self.context = provider.client.stream(method, url, **kwargs)
+
+    async def __aenter__(self):
+        await self.provider.limiter.acquire()
+
+        return await self.context.__aenter__()
+
+    async def __aexit__(self, *exc):
+        return await self.context.__aexit__(*exc)
+
+_clients = {}
+
+def provider_for(url: str) -> str:
+    return HOST_PROVIDERS.get(urlsplit(url).hostname or "", "default")
+
+def client(provider: str) -> ProviderClient:
+    # Clients are created on first use so each binds to the running loop
+    instance = _clients.get(provider)
+
+    if instance is None:
+        instance = _clients[provider] = ProviderClient(provider)
+
+    return instance
+
+async def request(method: str, url: str, provider: str = None, **kwargs):
+    return await client(provider or provider_for(url)).request(method, url, **kwargs)
+
+async def get(url: str, provider: str = None, **kwargs):
+    return await request("GET", url, provider, **kwargs)
+
+async def post(url: str, provider: str = None, **kwargs):
+    return await request("POST", url, provider, **kwargs)
+
+async def put(url: str, provider: str = None, **kwargs):
+    return await request("PUT", url, provider, **kwargs)
+
+def stream(method: str, url: str, provider: str = None, **kwargs):
+    return client(provider or provider_for(url)).stream(method, url, **kwargs)
+
+async def close_all():
+    clients = list(_clients.values())
+    _clients.clear()
+
+    await asyncio.gather(*(c.aclose() for c in clients), return_exceptions=True)
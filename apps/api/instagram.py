@@ -0,0 +1,79 @@
+import os
+import time
+import asyncio
+from fastapi import HTTPException
+from dotenv import load_dotenv
+import http_client
+import metrics
+
+
+load_dotenv()
+
+GRAPH_API = os.getenv("FACEBOOK_GRAPH_URL", "https://graph.facebook.com/v18.0")
+
+INSTAGRAM_CONTAINER_DEADLINE = float(os.getenv("INSTAGRAM_CONTAINER_DEADLINE", 60))
+INSTAGRAM_POLL_INITIAL = float(os.getenv("INSTAGRAM_POLL_INITIAL", 1))
+INSTAGRAM_POLL_MAX = float(os.getenv("INSTAGRAM_POLL_MAX", 5))
+
+async def create_container(ig_user_id: str, token: str, image_url: str, caption: str):
+    # Instagram fetches the image itself, so the media has to be at a public URL
+    res = await http_client.post(
+        f"{GRAPH_API}/{ig_user_id}/media",
+        provider="facebook",
+        data={"image_url": image_url, "caption": caption, "access_token": token}
+    )
+
+    if res.status_code != 200:
+        print(f"Instagram Container Error: {res.text}")
+        raise HTTPException(400, f"Instagram Error: {res.text}")
+
+    return res.json()["id"]
+
+async def wait_for_container(container_id: str, token: str, deadline: float = INSTAGRAM_CONTAINER_DEADLINE):
+    give_up_at = time.monotonic() + deadline
+    delay = INSTAGRAM_POLL_INITIAL
+
+    while True:
+        res = await http_client.get(
+            f"{GRAPH_API}/{container_id}",
+            provider="facebook",
+            params={"fields": "status_code", "access_token": token}
+        )
+
+        if res.status_code != 200:
+            raise HTTPException(502, f"Instagram container status failed: {res.text}")
+
+        status = res.json().get("status_code")
+
+        if status == "FINISHED":
+            return
+
+        if status in ("ERROR", "EXPIRED"):
+            raise HTTPException(400, f"Instagram could not process the media: {status}")
+
+        remaining = give_up_at - time.monotonic()
+
+        if remaining <= 0:
+            raise HTTPException(408, "Instagram media processing timed out")
+
+        await asyncio.sleep(min(delay, remaining))
+        delay = min(delay * 2, INSTAGRAM_POLL_MAX)
+
+async def publish_image(ig_user_id: str, token: str, image_url: str, caption: str):
+    container_id = await create_container(ig_user_id, token, image_url, caption)
+
+    await wait_for_container(container_id, token)
+
+    res = await http_client.post(
+        f"{GRAPH_API}/{ig_user_id}/media_publish",
+        provider="facebook",
+        data={"creation_id": container_id, "access_token": token}
+    )
+
+    if res.status_code != 200:
+        print(f"Instagram Publish Error: {res.text}")
+        raise HTTPException(400, f"Instagram Error: {res.text}")
+
+    metrics.incr("instagram_posts_published")
+
+    return res.json()["id"]
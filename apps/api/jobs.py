@@ -0,0 +1,177 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+from fastapi import HTTPException
+from dotenv import load_dotenv
+
+
+load_dotenv()
+
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", 3600))
+JOB_QUEUE_RETRY_AFTER = int(os.getenv("JOB_QUEUE_RETRY_AFTER", 30))
+# Worker count uvicorn reads when --workers is not given
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+class Job:
+    def __init__(self, kind: str, payload: dict):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.payload = payload
+        self.status = "queued"
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.version = 0
+        self.changed = asyncio.Event()
+
+    @property
+    def done(self):
+        return self.status in TERMINAL_STATUSES
+
+    def update(self, **fields):
+        for key, value in fields.items():
+            setattr(self, key, value)
+
+        self.updated_at = time.time()
+        self.version += 1
+
+        # Wake every subscriber, then arm a fresh event for the next change
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at
+        }
+
+class JobQueue:
+    # handler(job) is an async callable that drives the job, reports progress
+    # through job.update(...) and returns the result dict. max_pending bounds
+    # the jobs waiting for a worker; 0 leaves the queue unbounded.
+    #
+    # Jobs live in this process's memory, so the API must run as a single
+    # uvicorn worker: with more, a status poll or event stream can land on a
+    # worker that never saw the job and gets a 404. Scale by raising the
+    # queue's concurrency rather than the number of workers.
+    def __init__(self, kind: str, handler, concurrency: int = 2, max_pending: int = 0):
+        self.kind = kind
+        self.handler = handler
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.jobs = {}
+        self.queue = asyncio.Queue()
+        self.workers = []
+
+    def start(self):
+        if self.workers:
+            return
+
+        if WEB_CONCURRENCY > 1:
+            print(f"WARNING: {self.kind} jobs are held in memory but WEB_CONCURRENCY={WEB_CONCURRENCY}; job lookups will 404 on the other workers")
+
+        for i in range(self.concurrency):
+            self.workers.append(asyncio.create_task(self._worker(i)))
+
+    async def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+        # Jobs that never reached a worker are failed and handed back so the
+        # caller can release whatever they hold
+        abandoned = []
+
+        while not self.queue.empty():
+            job = self.queue.get_nowait()
+            job.update(status="failed", error="Shut down before the job started")
+            abandoned.append(job)
+
+        return abandoned
+
+    def full(self) -> bool:
+        return bool(self.max_pending) and self.queue.qsize() >= self.max_pending
+
+    def active(self):
+        return [job for job in self.jobs.values() if not job.done]
+
+    async def submit(self, payload: dict) -> Job:
+        if self.full():
+            raise HTTPException(503, f"The {self.kind} queue is full, try again shortly", headers={"Retry-After": str(JOB_QUEUE_RETRY_AFTER)})
+
+        self._evict_finished()
+
+        job = Job(self.kind, payload)
+        self.jobs[job.id] = job
+        await self.queue.put(job)
+
+        return job
+
+    def get(self, job_id: str):
+        return self.jobs.get(job_id)
+
+    async def events(self, job_id: str, heartbeat: float = 15.0):
+        job = self.jobs.get(job_id)
+
+        if not job:
+            return
+
+        last_version = -1
+
+        while True:
+            if job.version != last_version:
+                last_version = job.version
+                yield f"event: {job.status}\ndata: {json.dumps(job.to_dict())}\n\n"
+
+            if job.done:
+                return
+
+            changed = job.changed
+
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=heartbeat)
+
+            except asyncio.TimeoutError:
+                # SSE comment line keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+
+    async def _worker(self, index: int):
+        while True:
+            job = await self.queue.get()
+
+            try:
+                job.update(status="running")
+                result = await self.handler(job)
+                job.update(status="succeeded", progress=1.0, result=result)
+
+            except asyncio.CancelledError:
+                job.update(status="failed", error="Worker shut down before the job finished")
+                raise
+
+            except Exception as e:
+                print(f"{self.kind} job {job.id} failed: {e}")
+                job.update(status="failed", error=str(e))
+
+            finally:
+                self.queue.task_done()
+
+    def _evict_finished(self):
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        expired = [job_id for job_id, job in self.jobs.items() if job.done and job.updated_at < cutoff]
+
+        for job_id in expired:
+            del self.jobs[job_id]
@@ -0,0 +1,250 @@
+import os
+import time
+import asyncio
+from cachetools import TTLCache
+from fastapi import HTTPException
+from dotenv import load_dotenv
+import http_client
+import metrics
+
+
+load_dotenv()
+
+LINKEDIN_API = os.getenv("LINKEDIN_API_URL", "https://api.linkedin.com/v2")
+
+LINKEDIN_CONCURRENCY = int(os.getenv("LINKEDIN_CONCURRENCY", 8))
+LINKEDIN_ORG_BATCH_SIZE = int(os.getenv("LINKEDIN_ORG_BATCH_SIZE", 20))
+ORG_NAME_CACHE_SIZE = int(os.getenv("ORG_NAME_CACHE_SIZE", 10000))
+ORG_NAME_CACHE_TTL = int(os.getenv("ORG_NAME_CACHE_TTL", 86400))
+LINKEDIN_IMAGE_MAX_BYTES = int(os.getenv("LINKEDIN_IMAGE_MAX_BYTES", 10 * 1024 * 1024))
+LINKEDIN_IMAGE_MIN_BYTES = 100
+LINKEDIN_UPLOAD_CHUNK_SIZE = int(os.getenv("LINKEDIN_UPLOAD_CHUNK_SIZE", 64 * 1024))
+
+linkedin_semaphore = asyncio.Semaphore(LINKEDIN_CONCURRENCY)
+
+# Organization names practically never change and are public to every admin,
+# so they are cached by org id regardless of which member looked them up.
+_org_names = TTLCache(maxsize=ORG_NAME_CACHE_SIZE, ttl=ORG_NAME_CACHE_TTL)
+
+def auth_headers(token: str):
+    return {
+        "Authorization": f"Bearer {token}",
+        "X-Restli-Protocol-Version": "2.0.0"
+    }
+
+async def get(path: str, token: str, **kwargs):
+    async with linkedin_semaphore:
+        return await http_client.get(f"{LINKEDIN_API}{path}", provider="linkedin", headers=auth_headers(token), **kwargs)
+
+async def _lookup_one(org_id: str, token: str):
+    try:
+        res = await get(f"/organizations/{org_id}", token)
+
+        if res.status_code != 200:
+            return org_id, f"Company {org_id} (No Access)", False
+
+        return org_id, res.json().get("localizedName", f"Company {org_id}"), True
+
+    except Exception as e:
+        print(f"Failed to fetch name for {org_id}: {e}")
+        return org_id, f"Company {org_id}", False
+
+async def _lookup_batch(org_ids: list, token: str):
+    # BATCH_GET: /organizations?ids=List(1,2,3) answers for every id in one
+    # round trip; ids it reports errors for are retried individually.
+    try:
+        res = await get(f"/organizations?ids=List({','.join(org_ids)})", token)
+
+        if res.status_code != 200:
+            raise RuntimeError(f"batch lookup returned {res.status_code}")
+
+        found = res.json().get("results", {})
+
+    except Exception as e:
+        print(f"LinkedIn batch org lookup failed, falling back to single lookups: {e}")
+        found = {}
+
+    names = [(org_id, found[org_id].get("localizedName", f"Company {org_id}"), True) for org_id in org_ids if org_id in found]
+    missing = [org_id for org_id in org_ids if org_id not in found]
+
+    if missing:
+        names.extend(await asyncio.gather(*(_lookup_one(org_id, token) for org_id in missing)))
+
+    return names
+
+async def resolve_organization_names(org_ids: list, token: str):
+    names = {}
+    missing = []
+
+    for org_id in dict.fromkeys(org_ids):
+        name = _org_names.get(org_id)
+
+        if name is not None:
+            names[org_id] = name
+
+        else:
+            missing.append(org_id)
+
+    metrics.incr("linkedin_org_cache_hits", len(names))
+    metrics.incr("linkedin_org_cache_misses", len(missing))
+
+    batches = [missing[i:i + LINKEDIN_ORG_BATCH_SIZE] for i in range(0, len(missing), LINKEDIN_ORG_BATCH_SIZE)]
+
+    for results in await asyncio.gather(*(_lookup_batch(batch, token) for batch in batches)):
+        for org_id, name, ok in results:
+            names[org_id] = name
+
+            # Placeholders for orgs we could not read are not cached
+            if ok:
+                _org_names[org_id] = name
+
+    return names
+
+async def register_image_upload(token: str, owner: str):
+    res = await http_client.post(
+        f"{LINKEDIN_API}/assets?action=registerUpload",
+        provider="linkedin",
+        headers={**auth_headers(token), "Content-Type": "application/json"},
+        json={
+            "registerUploadRequest": {
+                "recipes": ["urn:li:digitalmediaRecipe:feedshare-image"],
+                "owner": owner,
+                "serviceRelationships": [{
+                    "relationshipType": "OWNER",
+                    "identifier": "urn:li:userGeneratedContent"
+                }]
+            }
+        }
+    )
+
+    if res.status_code != 200:
+        print(f"Register Error: {res.text}")
+        raise HTTPException(400, f"Image Reg Failed: {res.text}")
+
+    upload_data = res.json()
+    upload_url = upload_data['value']['uploadMechanism']['com.linkedin.digitalmedia.uploading.MediaUploadHttpRequest']['uploadUrl']
+
+    return upload_data['value']['asset'], upload_url
+
+async def upload_image(token: str, owner: str, content: bytes, content_type: str = "application/octet-stream"):
+    # For media already held in memory (e.g. shared by several publish
+    # targets); unlike the streamed upload this body can be retried.
+    if len(content) > LINKEDIN_IMAGE_MAX_BYTES:
+        raise HTTPException(413, f"Image is {len(content)} bytes; the limit is {LINKEDIN_IMAGE_MAX_BYTES}")
+
+    asset, upload_url = await register_image_upload(token, owner)
+
+    res = await http_client.put(upload_url, provider="linkedin", content=content, headers={"Content-Type": content_type})
+
+    if res.status_code not in [200, 201]:
+        print(f"Binary Upload Failed: {res.text}")
+        raise HTTPException(status_code=500, detail="Failed to upload image binary to LinkedIn.")
+
+    metrics.incr("linkedin_upload_bytes", len(content))
+
+    return asset
+
+async def create_post(token: str, author: str, text: str, asset: str = None):
+    post_data = {
+        "author": author,
+        "lifecycleState": "PUBLISHED",
+        "specificContent": {
+            "com.linkedin.ugc.ShareContent": {
+                "shareCommentary": {
+                    "text": text
+                },
+                "shareMediaCategory": "IMAGE" if asset else "NONE",
+                "media": [{
+                    "status": "READY",
+                    "description": {"text": "Shared via AfterGlow"},
+                    "media": asset,
+                    "title": {"text": "Image"}
+                }] if asset else []
+            }
+        },
+        "visibility": {
+            "com.linkedin.ugc.MemberNetworkVisibility": "PUBLIC"
+        }
+    }
+
+    res = await http_client.post(
+        f"{LINKEDIN_API}/ugcPosts",
+        provider="linkedin",
+        headers={**auth_headers(token), "Content-Type": "application/json"},
+        json=post_data
+    )
+
+    if res.status_code != 201:
+        print(f"LinkedIn Create Error: {res.text}")
+        raise HTTPException(400, f"LinkedIn Error: {res.text}")
+
+    return res.json().get("id")
+
+async def upload_image_from_url(token: str, owner: str, image_url: str):
+    # Pipes the source image into LinkedIn's upload PUT chunk by chunk, so a
+    # post never holds more than one chunk of the image in memory. The source
+    # is opened (and its status and size checked) before an asset is registered.
+    transferred = 0
+
+    try:
+        async with http_client.stream("GET", image_url, provider="media") as src:
+            if src.status_code != 200:
+                print(f"❌ Image Download Failed: {src.status_code}")
+                raise HTTPException(status_code=400, detail=f"Could not download image. Status: {src.status_code}")
+
+            declared = int(src.headers.get("Content-Length") or 0) or None
+
+            if declared is not None and declared > LINKEDIN_IMAGE_MAX_BYTES:
+                raise HTTPException(413, f"Image is {declared} bytes; the limit is {LINKEDIN_IMAGE_MAX_BYTES}")
+
+            if declared is not None and declared < LINKEDIN_IMAGE_MIN_BYTES:
+                raise HTTPException(status_code=400, detail="Image file is too small or empty.")
+
+            asset, upload_url = await register_image_upload(token, owner)
+
+            async def body():
+                nonlocal transferred
+
+                async for chunk in src.aiter_bytes(LINKEDIN_UPLOAD_CHUNK_SIZE):
+                    transferred += len(chunk)
+
+                    # Sources without Content-Length are held to the limit as bytes arrive
+                    if transferred > LINKEDIN_IMAGE_MAX_BYTES:
+                        raise HTTPException(413, f"Image exceeds the {LINKEDIN_IMAGE_MAX_BYTES} byte limit")
+
+                    yield chunk
+
+            headers = {"Content-Type": "application/octet-stream"}
+
+            if declared is not None:
+                headers["Content-Length"] = str(declared)
+
+            started = time.perf_counter()
+
+            # A streamed body can't be replayed, so this PUT is never retried
+            put_res = await http_client.put(upload_url, provider="linkedin", content=body(), headers=headers, retries=0)
+
+            elapsed = time.perf_counter() - started
+
+    except HTTPException:
+        raise
+
+    except Exception as e:
+        print(f"Image Transfer Error: {e}")
+        raise HTTPException(status_code=400, detail=f"Failed to transfer source image: {str(e)}")
+
+    if put_res.status_code not in [200, 201]:
+        print(f"Binary Upload Failed: {put_res.text}")
+        raise HTTPException(status_code=500, detail="Failed to upload image binary to LinkedIn.")
+
+    if transferred < LINKEDIN_IMAGE_MIN_BYTES:
+        raise HTTPException(status_code=400, detail="Image file is too small or empty.")
+
+    rate = transferred / elapsed if elapsed > 0 else 0.0
+
+    metrics.incr("linkedin_upload_bytes", transferred)
+    metrics.observe("linkedin_upload_bytes_per_second", rate)
+
+    print(f"Streamed {transferred} bytes to LinkedIn in {elapsed:.2f}s ({rate / 1024:.0f} KiB/s)")
+
+    return asset, {"bytes": transferred, "seconds": round(elapsed, 3), "bytes_per_second": round(rate)}
@@ -1,31 +1,45 @@
 from fastapi import FastAPI, HTTPException, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+from google_services import build_service, preload_discovery_documents
 from googleapiclient.http import MediaIoBaseUpload
 from docx import Document
 import io
 import os
 from groq import Groq
 from dotenv import load_dotenv
+from db import supabase, close_supabase
 import base64
 import re
+import asyncio
 from auth import router as auth_router, SCOPES
 from analytics import router as analytics_router
 from webhooks import router as webhooks_router
-from video import router as video_router
+from video import router as video_router, renew_video_holds
 import json
 import replicate
-from supabase import create_client, Client
 from vault import router as vault_router
+from metrics import router as metrics_router
+from publish import router as publish_router
 import time
 from huggingface_hub import InferenceClient
 from auth import LINKEDIN_SCOPES
 from google import genai
 from google.genai import types
-import requests
+import http_client
 from typing import Optional
+from executor import run_blocking, iterate_blocking, shutdown_pools
+import credits
+import profiles
+from token_manager import token_manager
+import linkedin
+import metrics
+from prompt_cache import prompt_cache, cache_key, PROMPT_CACHE_HIT_COST
+from model_router import model_router
+from micro_batcher import MicroBatcher, batching_enabled
+from contextlib import aclosing, asynccontextmanager
+from admission import admission
 
 
 load_dotenv()
@@ -39,11 +53,6 @@ CREDIT_COSTS = {
     "video": 20
 }
 
-supabase: Client = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_KEY")
-)
-
 SCOPES = [
     "https://www.googleapis.com/auth/yt-analytics.readonly",
     "https://www.googleapis.com/auth/youtube.readonly",
@@ -87,6 +96,24 @@ app.include_router(analytics_router)
 app.include_router(webhooks_router)
 app.include_router(video_router)
 app.include_router(vault_router)
+app.include_router(metrics_router)
+app.include_router(publish_router)
+
+@app.on_event("startup")
+async def startup_event():
+    await run_blocking("google", preload_discovery_documents)
+    app.state.credit_sweeper = asyncio.create_task(credits.run_reservation_sweeper())
+    app.state.token_refresher = asyncio.create_task(token_manager.run_refresher())
+    app.state.video_hold_renewer = asyncio.create_task(renew_video_holds())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    app.state.credit_sweeper.cancel()
+    app.state.token_refresher.cancel()
+    app.state.video_hold_renewer.cancel()
+    await http_client.close_all()
+    shutdown_pools()
+    close_supabase()
 
 @app.get("/")
 def read_root():
@@ -102,73 +129,229 @@ class GenerateScriptRequest(BaseModel):
     prompt: str
     tone: str = "professional"
 
-@app.post("/api/generate-script")
-async def generate_script(req: GenerateScriptRequest):
-    try:
-        tier = await process_credits(req.email, CREDIT_COSTS["script"])
+SCRIPT_SYSTEM_PROMPT = "You are a professional scriptwriter. Generate a clear, formatted script based on the user's request."
 
-        model_name = "llama-3.1-8b-instant"
+STREAM_FORMATS = {
+    "sse": "text/event-stream",
+    "ndjson": "application/x-ndjson"
+}
 
-        if tier == "standard": model_name = "llama-3.3-70b-versatile"
-        if tier == "pro": model_name = "gemini-3-flash-preview"
+def script_messages(req: GenerateScriptRequest):
+    return [
+        {
+            "role": "system",
+            "content": SCRIPT_SYSTEM_PROMPT
+        },
+        {
+            "role": "user",
+            "content": f"Write a script for: {req.prompt}. Keep the tone {req.tone}.",
+        }
+    ]
 
-        content = ""
-        print(f"Generating script using {model_name} for {tier} user...")
-
-        if "gemini" in model_name:
-            response = google_client.models.generate_content(
-                model=model_name,
-                contents={'text': f"You are a pro scriptwriter. Write a script for: {req.prompt}. Tone: {req.tone}."},
-                config=types.GenerateContentConfig(
-                    temperature=0.7,
-                    top_p=0.95,
-                    top_k=40,
-                )
-            )
+def script_gemini_request(model_name: str, req: GenerateScriptRequest):
+    return {
+        "model": model_name,
+        "contents": {'text': f"You are a pro scriptwriter. Write a script for: {req.prompt}. Tone: {req.tone}."},
+        "config": types.GenerateContentConfig(
+            temperature=0.7,
+            top_p=0.95,
+            top_k=40,
+        )
+    }
 
-            content = response.text
+async def save_script_asset(email: str, content: str, model_name: str, routing: dict = None):
+    if email:
+        await run_blocking("supabase", supabase.table("assets").insert({
+            "user_email": email,
+            "asset_type": "script",
+            "content": content,
+            "metadata": {"model": model_name, "cost": CREDIT_COSTS["script"], "routing": routing}
+        }).execute)
 
-        else:
-            chat = groq_client.chat.completions.create(
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a professional scriptwriter. Generate a clear, formatted script based on the user's request."
-                    },
-                    {
-                        "role": "user",
-                        "content": f"Write a script for: {req.prompt}. Keep the tone {req.tone}.",
-                    }
-                ],
-                model=model_name,
-            )
+@app.post("/api/generate-script")
+async def generate_script(req: GenerateScriptRequest):
+    try:
+        async with process_credits(req.email, CREDIT_COSTS["script"], reason="script") as reservation:
+            tier = reservation.tier
+
+            async def call(target):
+                print(f"Generating script using {target.model} for {tier} user...")
+
+                if target.provider == "gemini":
+                    response = await run_blocking(
+                        "gemini",
+                        google_client.models.generate_content,
+                        **script_gemini_request(target.model, req)
+                    )
+
+                    return response.text
+
+                chat = await run_blocking(
+                    "groq",
+                    groq_client.chat.completions.create,
+                    messages=script_messages(req),
+                    model=target.model,
+                )
 
-            content = chat.choices[0].message.content
+                return chat.choices[0].message.content
 
-        if req.email:
-            supabase.table("assets").insert({
-                "user_email": req.email,
-                "asset_type": "script",
-                "content": content,
-                "metadata": {"model": model_name, "cost": CREDIT_COSTS["script"]}
-            }).execute()
+            content, routing = await model_router.route("text", tier, call)
 
-        return {"script": content}
+            await save_script_asset(req.email, content, routing["model"], routing)
+
+            return {"script": content}
 
     except HTTPException as he:
         raise he
 
     except Exception as e:
-        # Refund on failure (Optional but recommended)
-        # For simplicity, we skip refund logic here, but in prod you should add it.
         raise HTTPException(status_code=500, detail=f"AI Generation Failed: {str(e)}")
+
+def stream_script_tokens(target, req: GenerateScriptRequest):
+    if target.provider == "gemini":
+        return iterate_blocking("gemini", google_client.models.generate_content_stream, **script_gemini_request(target.model, req))
+
+    return iterate_blocking("groq", groq_client.chat.completions.create, messages=script_messages(req), model=target.model, stream=True)
+
+def token_text(target, chunk) -> str:
+    if target.provider == "gemini":
+        return chunk.text or ""
+
+    return (chunk.choices[0].delta.content or "") if chunk.choices else ""
+
+def stream_event(fmt: str, event: str, data: dict) -> str:
+    if fmt == "ndjson":
+        return json.dumps({"event": event, **data}) + "\n"
+
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def finish_streamed_script(req: GenerateScriptRequest, reservation, target, content: str):
+    # The model has finished, so the script is stored and paid for even if
+    # the client went away while this was running.
+    try:
+        await save_script_asset(req.email, content, target.model, {"provider": target.provider, "model": target.model, "streamed": True})
+
+    except Exception:
+        await credits.refund(reservation)
+        raise
+
+    try:
+        await credits.commit(reservation)
+
+    except Exception as e:
+        print(f"Credit commit failed for {req.email} ({reservation.id}): {e}")
+
+async def script_events(req: GenerateScriptRequest, reservation, target, fmt: str, state: dict):
+    parts = []
+    started = time.perf_counter()
+
+    try:
+        yield stream_event(fmt, "start", {"provider": target.provider, "model": target.model})
+
+        # Tokens already sent can't be taken back, so a stream does not fail
+        # over mid-way; its outcome still feeds the provider's health.
+        async with model_router.track(target), aclosing(stream_script_tokens(target, req)) as chunks:
+            async for chunk in chunks:
+                text = token_text(target, chunk)
+
+                if not text:
+                    continue
+
+                if not parts:
+                    metrics.observe("script_stream_first_token_seconds", time.perf_counter() - started)
+
+                parts.append(text)
+                yield stream_event(fmt, "token", {"text": text})
+
+        state["finished"] = True
+        content = "".join(parts)
+
+        await asyncio.shield(finish_streamed_script(req, reservation, target, content))
+
+        metrics.observe("script_stream_seconds", time.perf_counter() - started)
+        yield stream_event(fmt, "done", {"length": len(content), "cost": CREDIT_COSTS["script"]})
+
+    except (asyncio.CancelledError, GeneratorExit):
+        metrics.incr("script_stream_disconnects")
+        raise
+
+    except Exception as e:
+        print(f"Script Stream Error: {e}")
+        yield stream_event(fmt, "error", {"detail": f"AI Generation Failed: {str(e)}"})
+
+class SettledStreamingResponse(StreamingResponse):
+    # Calls on_close however the response ends. The body generator's own
+    # finally is not enough: it never runs if the client is gone before the
+    # first chunk is pulled.
+    def __init__(self, content, on_close, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+
+        finally:
+            await self.on_close()
+
+@app.post("/api/generate-script/stream")
+async def generate_script_stream(req: GenerateScriptRequest, format: str = "sse"):
+    if format not in STREAM_FORMATS:
+        raise HTTPException(400, f"format must be one of {', '.join(STREAM_FORMATS)}")
+
+    # Admitted and reserved before the response starts, so a 429 or 402 is
+    # still a plain HTTP error. The admission ticket and the hold are
+    # settled when the response ends, whether or not the body ever ran.
+    ticket = await admission.acquire(req.email, "script")
+
+    try:
+        reservation = await credits.reserve(req.email, CREDIT_COSTS["script"], reason="script")
+
+    except BaseException:
+        ticket.release()
+        raise
+
+    try:
+        target = model_router.pick("text", reservation.tier)
+
+    except HTTPException:
+        ticket.release()
+        await credits.refund(reservation)
+        raise
+
+    print(f"Streaming script using {target.model} for {reservation.tier} user...")
+
+    state = {"finished": False}
+    events = script_events(req, reservation, target, format, state)
+
+    async def settle():
+        ticket.release()
+
+        try:
+            await events.aclose()
+
+        finally:
+            # A stream that never completed is not charged; the partial text is discarded
+            if not state["finished"]:
+                try:
+                    await asyncio.shield(credits.refund(reservation))
+
+                except Exception as e:
+                    print(f"Credit refund failed for {req.email} ({reservation.id}): {e}")
+
+    return SettledStreamingResponse(
+        events,
+        on_close=settle,
+        media_type=STREAM_FORMATS[format],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
         
 @app.post("/save-script")
 async def save_script(request: DriveScriptRequest):
     try:
-        creds = get_google_creds(request.email)
+        creds = await get_google_creds(request.email)
 
-        service = build('drive', 'v3', credentials=creds)
+        service = build_service('drive', 'v3', creds)
 
         safe_name = sanitize_filename(request.file_name)
 
@@ -188,11 +371,11 @@ async def save_script(request: DriveScriptRequest):
             resumable=True
         )
 
-        file = service.files().create(
+        file = await run_blocking("google", service.files().create(
             body=file_metadata,
             media_body=media,
             fields='id, webViewLink'
-        ).execute()
+        ).execute)
 
         return {
             "status": "success",
@@ -217,30 +400,19 @@ def sanitize_filename(name:str) -> str:
 
     return name
 
-def get_google_creds(email:str):
-    response = supabase.table("social_tokens")\
-        .select("access_token, refresh_token")\
-            .eq("user_email", email).execute()
+async def get_google_creds(email:str):
+    creds = await token_manager.get_google_credentials(email)
 
-    if not response.data:
+    if not creds:
         raise HTTPException(401, "Google account not connected. Please connect Youtube in dashboard.")
 
-    token_data = response.data[0]
-
-    return Credentials(
-        token=token_data['access_token'],
-        refresh_token=token_data['refresh_token'],
-        token_uri="https://oauth2.googleapis.com/token",
-        client_id=os.getenv("GOOGLE_CLIENT_ID"),
-        client_secret=os.getenv("GOOGLE_CLIENT_SECRET"),
-        scopes=SCOPES
-    )
+    return creds
 
 @app.post("/save-image")
 async def save_image(request: DriveImageRequest):
     try:
-        creds = get_google_creds(email=request.email)
-        service = build('drive', 'v3', credentials=creds)
+        creds = await get_google_creds(email=request.email)
+        service = build_service('drive', 'v3', creds)
 
         safe_name = sanitize_filename(request.file_name)
 
@@ -267,11 +439,11 @@ async def save_image(request: DriveImageRequest):
             resumable=True
         )
 
-        file = service.files().create(
+        file = await run_blocking("google", service.files().create(
             body=file_metadata,
             media_body=media,
             fields='id, webViewLink'
-        ).execute()
+        ).execute)
 
         return {
             "status": "success",
@@ -283,6 +455,10 @@ async def save_image(request: DriveImageRequest):
         print(f"Image Upload Error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/router/health")
+async def get_router_health():
+    return model_router.snapshot()
+
 @app.get("/api/health")
 async def health_def():
     return {
@@ -295,63 +471,105 @@ class RepurposeRequest(BaseModel):
     email: str
     script: str
     tone: str = "engaging"
+    fresh: bool = False
 
-@app.post("/api/repurpose")
-async def repurpose_content(req: RepurposeRequest):
-    try:
-        tier = await process_credits(req.email, CREDIT_COSTS["repurpose"])
+REPURPOSE_SYSTEM_PROMPT = "You are an expert Social Media Manager. Return JSON only: {\"twitter\": \"...\", \"linkedin\": \"...\", \"instagram\": \"...\"}"
 
-        model_name = "llama-3.1-8b-instant"
+async def save_repurpose_asset(req: RepurposeRequest, content: str, cached: bool = False, routing: dict = None):
+    if req.email:
+        await run_blocking("supabase", supabase.table("assets").insert({
+            "user_email": req.email,
+            "asset_type": "social_mix",
+            "content": content,
+            "metadata": {"source_length": len(req.script), "tone": req.tone, "cached": cached, "routing": routing}
+        }).execute)
 
-        if tier == "standard": 
-            model_name = "llama-3.3-70b-versatile"
+async def cached_repurpose(req: RepurposeRequest):
+    # The tier (and so the model in the key) comes from the profile cache,
+    # so a hit needs no credit reservation round trip.
+    if req.fresh or not req.email:
+        return None
 
-        if tier == "pro": 
-            model_name = "gemini-3-flash-preview"
-        
-        content = ""
-        system_prompt = "You are an expert Social Media Manager. Return JSON only: {\"twitter\": \"...\", \"linkedin\": \"...\", \"instagram\": \"...\"}"
-
-        if "gemini" in model_name:
-            response = google_client.models.generate_content(
-                model=model_name,
-                contents={'text': f"{system_prompt}\n\nTask: Repurpose this script:\n{req.script}\n\nTone: {req.tone}"},
-                config=types.GenerateContentConfig(
-                    temperature=0.2,
-                    response_mime_type="application/json"
-                )
-            )
-            content = response.text
+    profile = await profiles.get_profile(req.email)
 
-        else:
-            chat = groq_client.chat.completions.create(
-                messages=[
-                    {
-                        "role": "system",
-                        "content": system_prompt
-                    },
-                    {
-                        "role": "user",
-                        "content": f"Script: {req.script}\n\nTone: {req.tone}",
-                    }
-                ],
-                model=model_name,
-                response_format={"type": "json_object"}
-            )
+    if not profile:
+        return None
 
-            content = chat.choices[0].message.content
+    # Keyed by the tier's preferred model, whichever model actually answered
+    model_name = model_router.primary("text", profile.get("subscription_tier")).model
+    parsed = await prompt_cache.get("repurpose", cache_key("repurpose", model_name, req.script, tone=req.tone))
 
-        parsed = json.loads(content)
+    if parsed is None:
+        return None
+
+    if PROMPT_CACHE_HIT_COST:
+        await credits.debit(req.email, PROMPT_CACHE_HIT_COST, reason="repurpose_cached")
 
-        if req.email:
-            supabase.table("assets").insert({
-                "user_email": req.email,
-                "asset_type": "social_mix",
-                "content": content,
-                "metadata": {"source_length": len(req.script), "tone": req.tone}
-            }).execute()
+    await save_repurpose_asset(req, json.dumps(parsed), cached=True)
+
+    return parsed
+
+@app.post("/api/repurpose")
+async def repurpose_content(req: RepurposeRequest):
+    try:
+        cached = await cached_repurpose(req)
+
+        if cached is not None:
+            return cached
+
+        async with process_credits(req.email, CREDIT_COSTS["repurpose"], reason="repurpose") as reservation:
+            model_name = model_router.primary("text", reservation.tier).model
+            routing = None
+
+            async def call(target):
+                if target.provider == "gemini":
+                    response = await run_blocking(
+                        "gemini",
+                        google_client.models.generate_content,
+                        model=target.model,
+                        contents={'text': f"{REPURPOSE_SYSTEM_PROMPT}\n\nTask: Repurpose this script:\n{req.script}\n\nTone: {req.tone}"},
+                        config=types.GenerateContentConfig(
+                            temperature=0.2,
+                            response_mime_type="application/json"
+                        )
+                    )
+                    content = response.text
+
+                else:
+                    chat = await run_blocking(
+                        "groq",
+                        groq_client.chat.completions.create,
+                        messages=[
+                            {
+                                "role": "system",
+                                "content": REPURPOSE_SYSTEM_PROMPT
+                            },
+                            {
+                                "role": "user",
+                                "content": f"Script: {req.script}\n\nTone: {req.tone}",
+                            }
+                        ],
+                        model=target.model,
+                        response_format={"type": "json_object"}
+                    )
+
+                    content = chat.choices[0].message.content
+
+                # Malformed output counts as a provider failure, so it fails
+                # over and is never cached
+                return json.loads(content)
+
+            async def generate():
+                nonlocal routing
+                parsed, routing = await model_router.route("text", reservation.tier, call)
+
+                return parsed
+
+            parsed = await prompt_cache.generate("repurpose", cache_key("repurpose", model_name, req.script, tone=req.tone), generate)
+
+            await save_repurpose_asset(req, json.dumps(parsed), routing=routing)
         
-        return parsed
+            return parsed
 
     except HTTPException as he:
         raise he
@@ -396,27 +614,103 @@ class ImageRequest(BaseModel):
 
 class EnhancePromptRequest(BaseModel):
     prompt: str
+    fresh: bool = False
+
+ENHANCE_MODEL = "llama-3.1-8b-instant"
+
+ENHANCE_SYSTEM_PROMPT = "You are an expert AI Art Prompt Engineer. Rewrite the user's concept into a highly detailed, descriptive prompt suitable for high-end image generators like Flux, Midjourney, or Google Imagen. Focus on lighting, composition, texture, camera settings, and artistic style. Output ONLY the prompt text, no introductions."
+
+ENHANCE_BATCH_PROMPT = ENHANCE_SYSTEM_PROMPT + """
+
+The user message is a JSON list of concepts, each with an id. Rewrite every concept independently.
+Return ONLY valid JSON in this format: {"results": [{"id": 0, "prompt": "..."}]} with one entry per concept."""
+
+def parse_batch(content: str, field: str) -> dict:
+    # {"results": [{"id": 0, field: ...}]} -> {0: ...}; malformed entries are left out
+    try:
+        items = json.loads(content).get("results", [])
+
+    except (ValueError, AttributeError):
+        return {}
+
+    return {
+        item["id"]: item[field]
+        for item in items
+        if isinstance(item, dict) and isinstance(item.get("id"), int) and item.get(field)
+    }
+
+async def run_structured_batch(name: str, items: list, single, system_prompt: str, field: str, model: str):
+    # One completion answers the whole batch; anything it leaves out (or a
+    # failed batch call) falls back to one request per item.
+    if len(items) == 1:
+        return [await single(items[0])]
 
-@app.post("/api/enhance-prompt")
-async def enhance_prompt(req: EnhancePromptRequest):
     try:
-        chat_completion = groq_client.chat.completions.create(
+        chat = await run_blocking(
+            "groq",
+            groq_client.chat.completions.create,
             messages=[
-                {
-                    "role": "system",
-                    "content": "You are an expert AI Art Prompt Engineer. Rewrite the user's concept into a highly detailed, descriptive prompt suitable for high-end image generators like Flux, Midjourney, or Google Imagen. Focus on lighting, composition, texture, camera settings, and artistic style. Output ONLY the prompt text, no introductions."
-                },
-                {
-                    "role": "user",
-                    "content": f"Enhance this concept: {req.prompt}",
-                }
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": json.dumps([{"id": i, "input": item} for i, item in enumerate(items)])}
             ],
-            model="llama-3.1-8b-instant",
+            model=model,
+            response_format={"type": "json_object"}
         )
 
-        enhanced_text = chat_completion.choices[0].message.content
+        answers = parse_batch(chat.choices[0].message.content, field)
+
+    except Exception as e:
+        print(f"Batch {name} failed, answering items one by one: {e}")
+        answers = {}
+
+    missing = [i for i in range(len(items)) if i not in answers]
+
+    if missing:
+        metrics.incr(f"batch_{name}_fallbacks", len(missing))
+
+        results = await asyncio.gather(*(single(items[i]) for i in missing), return_exceptions=True)
+        answers.update(zip(missing, results))
+
+    return [answers[i] for i in range(len(items))]
+
+async def enhance_one(concept: str):
+    chat_completion = await run_blocking(
+        "groq",
+        groq_client.chat.completions.create,
+        messages=[
+            {
+                "role": "system",
+                "content": ENHANCE_SYSTEM_PROMPT
+            },
+            {
+                "role": "user",
+                "content": f"Enhance this concept: {concept}",
+            }
+        ],
+        model=ENHANCE_MODEL,
+    )
+
+    return chat_completion.choices[0].message.content
+
+enhance_batcher = MicroBatcher(
+    "enhance_prompt",
+    lambda concepts: run_structured_batch("enhance_prompt", concepts, enhance_one, ENHANCE_BATCH_PROMPT, "prompt", ENHANCE_MODEL)
+)
+
+@app.post("/api/enhance-prompt")
+async def enhance_prompt(req: EnhancePromptRequest):
+    try:
+        async def generate():
+            if batching_enabled("enhance_prompt"):
+                return await enhance_batcher.submit(req.prompt)
+
+            return await enhance_one(req.prompt)
+
+        enhanced_text, cached = await prompt_cache.get_or_generate(
+            "enhance_prompt", cache_key("enhance_prompt", ENHANCE_MODEL, req.prompt), generate, fresh=req.fresh
+        )
         
-        return {"enhanced_prompt": enhanced_text}
+        return {"enhanced_prompt": enhanced_text, "cached": cached}
 
     except Exception as e:
         print(f"Enhance Error: {e}")
@@ -425,80 +719,85 @@ async def enhance_prompt(req: EnhancePromptRequest):
 @app.post("/api/generate-image")
 async def generate_image(payload: ImageRequest):
     try:
-        tier = await process_credits(payload.email, CREDIT_COSTS["image"])
-
-        # 2. Select Model
-        # Free: Flux Schnell (HF)
-        # Standard: Playground v2.5 (HF) - Better artistic control
-        # Pro: Stable Diffusion 3.5 Large (HF) - Top tier
-        
-        if tier == "pro":
-            print(f"Generating image via Google Imagen 3 for {tier} user...")
-            model_id = "imagen-4.0-generate-001"
-
-            response = google_client.models.generate_images(
-                model=model_id,
-                prompt=payload.prompt,
-                config=types.GenerateImagesConfig(
-                    aspect_ratio=payload.aspect_ratio,
-                    number_of_images=1,
-                    image_size="2K"
+        async with process_credits(payload.email, CREDIT_COSTS["image"], reason="image") as reservation:
+            tier = reservation.tier
+
+            # Free: Flux Schnell (HF), Standard: SDXL (HF), Pro: Google Imagen;
+            # each falls back along its chain in model_router.
+            async def call(target):
+                print(f"Generating image via {target.model} for {tier} user...")
+
+                if target.provider == "gemini":
+                    response = await run_blocking(
+                        "gemini",
+                        google_client.models.generate_images,
+                        model=target.model,
+                        prompt=payload.prompt,
+                        config=types.GenerateImagesConfig(
+                            aspect_ratio=payload.aspect_ratio,
+                            number_of_images=1,
+                            image_size="2K"
+                        )
+                    )
+
+                    # Imagen answers a prompt its safety filter blocks with no images
+                    if not response.generated_images:
+                        raise HTTPException(422, "The image prompt was blocked by the provider's safety filter")
+
+                    return response.generated_images[0].image.image_bytes
+
+                width, height = 1024, 576
+                if payload.aspect_ratio == "1:1": width, height = 1024, 1024
+                if payload.aspect_ratio == "9:16": width, height = 576, 1024
+
+                image = await run_blocking(
+                    "huggingface",
+                    hf_client.text_to_image,
+                    payload.prompt,
+                    model=target.model,
+                    width=width,
+                    height=height
                 )
-            )
 
-            img_bytes = response.generated_images[0].image.image_bytes
+                img_byte_arr = io.BytesIO()
+                image.save(img_byte_arr, format="PNG")
 
-        else:
-            model_id = "black-forest-labs/flux.1-schnell"
+                return img_byte_arr.getvalue()
 
-            if tier == "standard": 
-                model_id = "stabilityai/stable-diffusion-xl-base-1.0"
+            img_bytes, routing = await model_router.route("image", tier, call)
+            model_id = routing["model"]
 
-            print(f"Generating image via {model_id} for {tier} user...")
+            safe_email = re.sub(r'[^a-zA-Z0-9]', '_', payload.email)
+            filename = f"{safe_email}_{int(time.time())}.png"
+            bucket_name = "generated_images"
 
-            width, height = 1024, 576
-            if payload.aspect_ratio == "1:1": width, height = 1024, 1024
-            if payload.aspect_ratio == "9:16": width, height = 576, 1024
+            print(f"Uploading {filename} to Supabase Storage...")
 
-            image = hf_client.text_to_image(
-                payload.prompt,
-                model=model_id,
-                width=width,
-                height=height
+            await run_blocking(
+                "supabase",
+                supabase.storage.from_(bucket_name).upload,
+                path=filename,
+                file=img_bytes,
+                file_options={"content-type": "image/png"}
             )
 
-            img_byte_arr = io.BytesIO()
-            image.save(img_byte_arr, format="PNG")
-            img_bytes = img_byte_arr.getvalue()
-
-        safe_email = re.sub(r'[^a-zA-Z0-9]', '_', payload.email)
-        filename = f"{safe_email}_{int(time.time())}.png"
-        bucket_name = "generated_images"
-
-        print(f"Uploading {filename} to Supabase Storage...")
-
-        supabase.storage.from_(bucket_name).upload(
-            path=filename,
-            file=img_bytes,
-            file_options={"content-type": "image/png"}
-        )
-
-        public_url = supabase.storage.from_(bucket_name).get_public_url(filename)
+            public_url = supabase.storage.from_(bucket_name).get_public_url(filename)
+
+            if payload.email:
+                await run_blocking("supabase", supabase.table("assets").insert({
+                    "user_email": payload.email,
+                    "asset_type": "image",
+                    "content": public_url,
+                    "metadata": {
+                        "prompt": payload.prompt,
+                        "aspect_ratio": payload.aspect_ratio,
+                        "model": model_id,
+                        "filename": filename,
+                        "routing": routing
+                    }
+                }).execute)
 
-        if payload.email:
-            supabase.table("assets").insert({
-                "user_email": payload.email,
-                "asset_type": "image",
-                "content": public_url,
-                "metadata": {
-                    "prompt": payload.prompt,
-                    "aspect_ratio": payload.aspect_ratio,
-                    "model": model_id,
-                    "filename": filename
-                }
-            }).execute()
-
-        return {"imageUrl": public_url}
+            return {"imageUrl": public_url}
 
     except HTTPException as he:
         raise he
@@ -513,12 +812,71 @@ class NicheRequest(BaseModel):
 
 class IdeaRequest(BaseModel):
     email: str
+    fresh: bool = False
+
+TRENDS_MODEL = "llama-3.3-70b-versatile"
+
+TRENDS_BATCH_PROMPT = """
+You are a Viral Content Strategist. The user message is a JSON list of niches, each with an id. For every niche, generate 3 trending video ideas.
+
+Return ONLY valid JSON in this format:
+{"results": [{"id": 0, "ideas": [{"title": "Hooky Video Title", "angle": "Why this works (1 sentence)", "type": "Educational" | "Entertainment" | "Story"}]}]}
+"""
+
+async def trends_for_niche(niche: str):
+    system_prompt = f"""
+    You are a Viral Content Strategist. Generate 3 trending video ideas for the niche: '{niche}'.
+    
+    Return ONLY valid JSON in this format:
+    [
+      {{
+        "title": "Hooky Video Title",
+        "angle": "Why this works (1 sentence)",
+        "type": "Educational" | "Entertainment" | "Story"
+      }}
+    ]
+    """
+
+    chat_completion = await run_blocking(
+        "groq",
+        groq_client.chat.completions.create,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": "Give me 3 viral ideas now."}
+        ],
+        model=TRENDS_MODEL,
+        response_format={"type": "json_object"}
+    )
+
+    content = chat_completion.choices[0].message.content
+
+    try:
+        parsed = json.loads(content)
+
+        if isinstance(parsed, dict) and "ideas" in parsed:
+            return parsed["ideas"]
+        
+        if isinstance(parsed, dict):
+            return list(parsed.values())[0]
+        
+        return parsed
+
+    except:
+        # Nothing usable: returned as None so it is not cached
+        return None
+
+trends_batcher = MicroBatcher(
+    "trends",
+    lambda niches: run_structured_batch("trends", niches, trends_for_niche, TRENDS_BATCH_PROMPT, "ideas", TRENDS_MODEL)
+)
 
 @app.post("/api/trends/set-niche")
 async def set_niche(req: NicheRequest):
     try:
-        supabase.table("profiles").update({"niche": req.niche})\
-            .eq("user_email", req.email).execute()
+        await run_blocking("supabase", supabase.table("profiles").update({"niche": req.niche})\
+            .eq("user_email", req.email).execute)
+
+        profiles.update_cached(req.email, niche=req.niche)
         
         return {"status": "success", "niche": req.niche}
     
@@ -528,51 +886,23 @@ async def set_niche(req: NicheRequest):
 @app.post("/api/trends/generate")
 async def generate_trends(req: IdeaRequest):
     try:
-        res = supabase.table("profiles").select("niche")\
-            .eq("user_email", req.email).execute()
+        profile = await profiles.get_profile(req.email)
 
-        if not res.data:
+        if not profile:
             raise HTTPException(404, "User profile not found.")
 
-        niche = res.data[0]['niche'] or "General Content"
+        niche = profile.get('niche') or "General Content"
 
-        system_prompt = f"""
-        You are a Viral Content Strategist. Generate 3 trending video ideas for the niche: '{niche}'.
-        
-        Return ONLY valid JSON in this format:
-        [
-          {{
-            "title": "Hooky Video Title",
-            "angle": "Why this works (1 sentence)",
-            "type": "Educational" | "Entertainment" | "Story"
-          }}
-        ]
-        """
-
-        chat_completion = groq_client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": "Give me 3 viral ideas now."}
-            ],
-            model="llama-3.3-70b-versatile",
-            response_format={"type": "json_object"}
-        )
+        async def generate():
+            if batching_enabled("trends"):
+                return await trends_batcher.submit(niche)
 
-        content = chat_completion.choices[0].message.content
+            return await trends_for_niche(niche)
 
-        try:
-            parsed = json.loads(content)
-
-            if isinstance(parsed, dict) and "ideas" in parsed:
-                return parsed["ideas"]
-            
-            if isinstance(parsed, dict):
-                return list(parsed.values())[0]
-            
-            return parsed
+        # Ideas depend only on the niche, so everyone in it shares them for a short window
+        ideas, _ = await prompt_cache.get_or_generate("trends", cache_key("trends", TRENDS_MODEL, niche=niche), generate, fresh=req.fresh)
 
-        except:
-            return []
+        return ideas or []
 
     except Exception as e:
         print(f"Trend Error: {e}")
@@ -581,50 +911,26 @@ async def generate_trends(req: IdeaRequest):
 @app.get("/api/linkedin/companies")
 async def get_linkedin_companies(linkedin_id: str):
     try:
-        res = supabase.table("social_tokens").select("access_token")\
-            .eq("user_email", f"linkedin_{linkedin_id}").execute()
+        token = await token_manager.get_linkedin_token(linkedin_id)
 
-        if not res.data:
+        if not token:
             raise HTTPException(401, "LinkedIn not connected")
 
-        token = res.data[0]['access_token']
-
-        url_list = "https://api.linkedin.com/v2/organizationalEntityAcls?q=roleAssignee&role=ADMINISTRATOR&state=APPROVED"
-
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "X-Restli-Protocol-Version": "2.0.0"
-        }
-
-        response = requests.get(url_list, headers=headers)
+        response = await linkedin.get(
+            "/organizationalEntityAcls",
+            token,
+            params={"q": "roleAssignee", "role": "ADMINISTRATOR", "state": "APPROVED"}
+        )
 
         if response.status_code != 200:
             return {
                 "companies": []
             }
 
-        data = response.json()
-        companies = []
-
-        for item in data.get('elements', []):
-            org_urn = item.get('organizationalTarget')
-            org_id = org_urn.split(":")[-1]
+        org_urns = [item.get('organizationalTarget') for item in response.json().get('elements', [])]
+        names = await linkedin.resolve_organization_names([urn.split(":")[-1] for urn in org_urns], token)
 
-            try:
-                org_url = f"https://api.linkedin.com/v2/organizations/{org_id}"
-                org_res = requests.get(org_url, headers=headers)
-
-                if org_res.status_code == 200:
-                    org_data = org_res.json()
-
-                    name = org_data.get("localizedName", f"Company {org_id}")
-                    companies.append({"id": org_urn, "name": name})
-                else:
-                    companies.append({"id": org_urn, "name": f"Company {org_id} (No Access)"})
-            
-            except Exception as e:
-                print(f"Failed to fetch name for {org_id}: {e}")
-                companies.append({"id": org_urn, "name": f"Company {org_id}"})
+        companies = [{"id": urn, "name": names[urn.split(":")[-1]]} for urn in org_urns]
 
         return {"companies": companies}
 
@@ -633,32 +939,22 @@ async def get_linkedin_companies(linkedin_id: str):
 
         return {"companies": []}
 
-async def process_credits(email: str, cost: int):
-    res = supabase.table("profiles").select("credits_balance, subscription_tier")\
-        .eq("user_email", email).execute()
-
-    if not res.data:
-        supabase.table("profiles").insert({"user_email": email, "credits_balance": 50, "subscription_tier": "free"}).execute()
-        return "free"
-
-    profile = res.data[0]
-
-    if profile['credits_balance'] < cost:
-        raise HTTPException(402, detail=f"Insufficient credits. Need {cost}, have {profile['credits_balance']}.")
-
-    new_balance = profile['credits_balance'] - cost
-    supabase.table("profiles").update({"credits_balance": new_balance})\
-        .eq("user_email", email).execute()
-
-    return profile['subscription_tier']
+@asynccontextmanager
+async def process_credits(email: str, cost: int, reason: str = None):
+    # Admission control runs first, so a throttled request is rejected with a
+    # 429 before any credits move. Credits are then held up front and only
+    # committed once the asset is stored; any failure inside the block
+    # releases them again.
+    async with admission.admit(email, reason), credits.hold(email, cost, reason=reason) as reservation:
+        yield reservation
 
 @app.get("/api/vault/images")
 async def get_vault_images(email: str):
     try:
-        res = supabase.table("assets").select("*")\
+        res = await run_blocking("supabase", supabase.table("assets").select("*")\
             .eq("user_email", email)\
             .eq("asset_type", "image")\
-            .order("created_at", desc=True).limit(20).execute()
+            .order("created_at", desc=True).limit(20).execute)
 
         return {"images": res.data}
     
@@ -678,118 +974,26 @@ async def post_to_linkedin(payload: LinkedInPostRequest):
         # Debug Print: Check if image_url is actually arriving
         print(f"📝 Received Post Request. Image URL: {payload.image_url}") 
 
-        res = supabase.table("social_tokens").select("access_token")\
-            .eq("user_email", f"linkedin_{payload.linkedin_id}")\
-            .execute()
+        token = await token_manager.get_linkedin_token(payload.linkedin_id)
 
-        if not res.data:
+        if not token:
             raise HTTPException(401, "LinkedIn not connected")
 
-        token = res.data[0]['access_token']
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json",
-            "X-Restli-Protocol-Version": "2.0.0"
-        }
-
         target_urn = payload.author_urn if payload.author_urn else f"urn:li:person:{payload.linkedin_id}"
 
         media_asset_urn = None
+        upload_stats = None
 
         if payload.image_url:
             print(f"Processing image for LinkedIn: {payload.image_url}")
 
-            try:
-                # 1. Download Image
-                img_resp = requests.get(payload.image_url, timeout=15)
-
-                if img_resp.status_code != 200:
-                    print(f"❌ Image Download Failed: {img_resp.status_code}")
-                    raise HTTPException(status_code=400, detail=f"Could not download image. Status: {img_resp.status_code}")
-
-                img_content = img_resp.content
-
-                if len(img_content) < 100:
-                    raise HTTPException(status_code=400, detail="Image file is too small or empty.")
-            
-            except Exception as e:
-                print(f"Image Fetch Error: {e}")
-                raise HTTPException(status_code=400, detail=f"Failed to fetch source image: {str(e)}")
-
-            # 2. Register Upload
-            reg_url = "https://api.linkedin.com/v2/assets?action=registerUpload"
-            reg_body = {
-                "registerUploadRequest": {
-                    "recipes": ["urn:li:digitalmediaRecipe:feedshare-image"],
-                    "owner": target_urn,
-                    "serviceRelationships": [{
-                        "relationshipType": "OWNER",
-                        "identifier": "urn:li:userGeneratedContent"
-                    }]
-                }
-            }
+            media_asset_urn, upload_stats = await linkedin.upload_image_from_url(token, target_urn, payload.image_url)
 
-            reg_res = requests.post(reg_url, headers=headers, json=reg_body)
-
-            if reg_res.status_code != 200:
-                print(f"Register Error: {reg_res.text}")
-                raise HTTPException(400, f"Image Reg Failed: {reg_res.text}")
-
-            upload_data = reg_res.json()
-            upload_url = upload_data['value']['uploadMechanism']['com.linkedin.digitalmedia.uploading.MediaUploadHttpRequest']['uploadUrl']
-            asset = upload_data['value']['asset']
-
-            # 3. Upload Binary (No Authorization Header)
-            print(f"Uploading {len(img_content)} bytes to LinkedIn...")
-            put_res = requests.put(upload_url, data=img_content, headers={"Content-Type": "application/octet-stream"})
-
-            if put_res.status_code not in [200, 201]:
-                print(f"Binary Upload Failed: {put_res.text}")
-                raise HTTPException(status_code=500, detail="Failed to upload image binary to LinkedIn.")
-
-            media_asset_urn = asset
-            print(f"Image uploaded successfully. Asset: {asset}")
-
-        # 4. Create Post
-        post_data = {
-            "author": target_urn,
-            "lifecycleState": "PUBLISHED",
-            "specificContent": {
-                "com.linkedin.ugc.ShareContent": {
-                    "shareCommentary": {
-                        "text": payload.text
-                    },
-                    "shareMediaCategory": "IMAGE" if media_asset_urn else "NONE",
-                    "media": [{
-                        "status": "READY",
-                        "description": {"text": "Shared via AfterGlow"},
-                        "media": media_asset_urn,
-                        "title": {"text": "Image"}
-                    }] if media_asset_urn else []
-                }
-            },
-            "visibility": {
-                "com.linkedin.ugc.MemberNetworkVisibility": "PUBLIC"
-            }
-        }
-
-        # Cleanup if no media
-        if not media_asset_urn:
-             # Ensure structure is clean for text-only
-            post_data["specificContent"]["com.linkedin.ugc.ShareContent"]["media"] = []
-            post_data["specificContent"]["com.linkedin.ugc.ShareContent"]["shareMediaCategory"] = "NONE"
-
-        response = requests.post(
-            "https://api.linkedin.com/v2/ugcPosts",
-            headers=headers,
-            json=post_data
-        )
+            print(f"Image uploaded successfully. Asset: {media_asset_urn}")
 
-        if response.status_code != 201:
-            print(f"LinkedIn Create Error: {response.text}")
-            raise HTTPException(400, f"LinkedIn Error: {response.text}")
+        post_id = await linkedin.create_post(token, target_urn, payload.text, media_asset_urn)
 
-        return {"status": "success", "post_id": response.json().get("id")}
+        return {"status": "success", "post_id": post_id, "upload": upload_stats}
 
     except HTTPException as he:
         raise he  
@@ -800,9 +1004,9 @@ async def post_to_linkedin(payload: LinkedInPostRequest):
 @app.get("/api/vault/scripts")
 async def get_vault_scripts(email:str):
     try:
-        res = supabase.table("assets").select("*")\
+        res = await run_blocking("supabase", supabase.table("assets").select("*")\
             .eq("user_email", email).eq("asset_type", "script")\
-            .order("created_at", desc=True).limit(20).execute()
+            .order("created_at", desc=True).limit(20).execute)
 
         return {"scripts": res.data}
 
@@ -820,7 +1024,9 @@ async def upload_image(file: UploadFile = File(...), email: str = Form(...)):
         bucket_name = "generated_images"
 
         print(f"Uploading local file {filename}...")
-        supabase.storage.from_(bucket_name).upload(
+        await run_blocking(
+            "supabase",
+            supabase.storage.from_(bucket_name).upload,
             path=filename,
             file=contents,
             file_options={"content-type": file.content_type}
@@ -828,7 +1034,7 @@ async def upload_image(file: UploadFile = File(...), email: str = Form(...)):
 
         public_url = supabase.storage.from_(bucket_name).get_public_url(filename)
 
-        supabase.table("assets").insert({
+        await run_blocking("supabase", supabase.table("assets").insert({
             "user_email": email,
             "asset_type": "image",
             "content": public_url,
@@ -836,7 +1042,7 @@ async def upload_image(file: UploadFile = File(...), email: str = Form(...)):
                 "source": "device_upload", 
                 "filename": filename
             }
-        }).execute()
+        }).execute)
 
         return {"url": public_url}
 
@@ -0,0 +1,38 @@
+import threading
+from collections import defaultdict
+from fastapi import APIRouter
+
+
+router = APIRouter()
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_gauges = {}
+
+def incr(name: str, value: float = 1):
+    with _lock:
+        _counters[name] += value
+
+def set_gauge(name: str, value: float):
+    with _lock:
+        _gauges[name] = value
+
+def observe(name: str, value: float):
+    with _lock:
+        _counters[f"{name}_count"] += 1
+        _counters[f"{name}_sum"] += value
+        _gauges[f"{name}_max"] = max(_gauges.get(f"{name}_max", value), value)
+
+def ratio(hits: str, misses: str):
+    with _lock:
+        total = _counters[hits] + _counters[misses]
+
+        return _counters[hits] / total if total else 0.0
+
+def snapshot():
+    with _lock:
+        return {"counters": dict(_counters), "gauges": dict(_gauges)}
+
+@router.get("/api/metrics")
+async def get_metrics():
+    return snapshot()
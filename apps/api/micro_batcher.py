@@ -0,0 +1,93 @@
+import os
+import time
+import asyncio
+from dotenv import load_dotenv
+import metrics
+
+
+load_dotenv()
+
+# Routes whose LLM calls are batched, e.g. LLM_BATCHING=enhance_prompt,trends
+LLM_BATCHING = {route.strip() for route in os.getenv("LLM_BATCHING", "").split(",") if route.strip()}
+
+# The window is also the most a request waits in the queue before its batch
+# is sent; a full batch is sent straight away.
+BATCH_WINDOW = float(os.getenv("BATCH_WINDOW_MS", 25)) / 1000
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", 8))
+
+def batching_enabled(route: str) -> bool:
+    return route in LLM_BATCHING
+
+class MicroBatcher:
+    # run_batch(items) is an async callable returning one result per item, in
+    # order; an exception in the list (including a CancelledError returned by
+    # gather(return_exceptions=True)) fails only that caller.
+    def __init__(self, name: str, run_batch, window: float = BATCH_WINDOW, max_size: int = BATCH_MAX_SIZE):
+        self.name = name
+        self.run_batch = run_batch
+        self.window = window
+        self.max_size = max_size
+        self.pending = []
+        self.timer = None
+        # The event loop only keeps weak references to tasks
+        self.tasks = set()
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        self.pending.append((item, future, time.perf_counter()))
+
+        if len(self.pending) >= self.max_size:
+            self._flush()
+
+        elif self.timer is None:
+            self.timer = loop.call_later(self.window, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        # Callers that gave up while queued are not sent
+        batch = [entry for entry in self.pending if not entry[1].done()]
+        self.pending = []
+
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _run(self, batch: list):
+        now = time.perf_counter()
+
+        metrics.observe(f"batch_{self.name}_size", len(batch))
+
+        for _, _, queued_at in batch:
+            metrics.observe(f"batch_{self.name}_wait_seconds", now - queued_at)
+
+        try:
+            results = await self.run_batch([item for item, _, _ in batch])
+
+        except asyncio.CancelledError as e:
+            # Callers must not be left waiting on a batch that will never finish
+            self._settle(batch, [e] * len(batch))
+            raise
+
+        except Exception as e:
+            results = [e] * len(batch)
+
+        self._settle(batch, results)
+
+    def _settle(self, batch: list, results: list):
+        for (_, future, _), result in zip(batch, results):
+            if future.done():
+                continue
+
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+
+            else:
+                future.set_result(result)
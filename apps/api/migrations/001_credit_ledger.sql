@@ -0,0 +1,99 @@
+-- Credit ledger: every debit is a single conditional UPDATE ... RETURNING on
+-- profiles plus a ledger row, executed in one RPC round trip.
+
+create table if not exists credit_reservations (
+    id uuid primary key default gen_random_uuid(),
+    user_email text not null,
+    amount integer not null check (amount >= 0),
+    status text not null default 'held' check (status in ('held', 'committed', 'refunded')),
+    reason text,
+    created_at timestamptz not null default now(),
+    settled_at timestamptz
+);
+
+create index if not exists credit_reservations_held_idx
+    on credit_reservations (created_at)
+    where status = 'held';
+
+-- Returns no row when the profile is missing or the balance is too low.
+create or replace function reserve_credits(
+    p_email text,
+    p_amount integer,
+    p_reason text default null,
+    p_commit boolean default false
+)
+returns table (reservation_id uuid, credits_balance integer, subscription_tier text)
+language plpgsql
+as $$
+declare
+    v_balance integer;
+    v_tier text;
+    v_id uuid;
+begin
+    update profiles
+       set credits_balance = profiles.credits_balance - p_amount
+     where profiles.user_email = p_email
+       and profiles.credits_balance >= p_amount
+    returning profiles.credits_balance, profiles.subscription_tier
+         into v_balance, v_tier;
+
+    if not found then
+        return;
+    end if;
+
+    insert into credit_reservations (user_email, amount, status, reason, settled_at)
+    values (
+        p_email,
+        p_amount,
+        case when p_commit then 'committed' else 'held' end,
+        p_reason,
+        case when p_commit then now() else null end
+    )
+    returning id into v_id;
+
+    return query select v_id, v_balance, v_tier;
+end;
+$$;
+
+create or replace function commit_credits(p_reservation_id uuid)
+returns boolean
+language plpgsql
+as $$
+begin
+    update credit_reservations
+       set status = 'committed', settled_at = now()
+     where id = p_reservation_id
+       and status = 'held';
+
+    return found;
+end;
+$$;
+
+-- Idempotent: only a held reservation is returned to the balance.
+create or replace function refund_credits(p_reservation_id uuid)
+returns integer
+language plpgsql
+as $$
+declare
+    v_email text;
+    v_amount integer;
+    v_balance integer;
+begin
+    update credit_reservations
+       set status = 'refunded', settled_at = now()
+     where id = p_reservation_id
+       and status = 'held'
+    returning user_email, amount into v_email, v_amount;
+
+    if not found then
+        return null;
+    end if;
+
+    update profiles
+       set credits_balance = profiles.credits_balance + v_amount
+     where profiles.user_email = v_email
+    returning profiles.credits_balance into v_balance;
+
+    return v_balance;
+end;
+$$;
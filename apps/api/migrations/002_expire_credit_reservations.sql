@@ -0,0 +1,33 @@
+-- Releases reservations that were never committed or refunded, e.g. when the
+-- worker died mid-generation. Returns the number of reservations released.
+create or replace function expire_credit_reservations(p_max_age_seconds integer)
+returns integer
+language plpgsql
+as $$
+declare
+    v_count integer;
+begin
+    with expired as (
+        update credit_reservations
+           set status = 'refunded', settled_at = now()
+         where status = 'held'
+           and created_at < now() - make_interval(secs => p_max_age_seconds)
+        returning user_email, amount
+    ),
+    totals as (
+        select user_email, sum(amount) as amount
+          from expired
+         group by user_email
+    ),
+    refunded as (
+        update profiles
+           set credits_balance = profiles.credits_balance + totals.amount
+          from totals
+         where profiles.user_email = totals.user_email
+        returning 1
+    )
+    select count(*) into v_count from expired;
+
+    return v_count;
+end;
+$$;
@@ -0,0 +1,13 @@
+-- Palettes computed from YouTube thumbnails, one row per video and
+-- extraction method. thumbnail_url + etag identify the image that was
+-- analysed; checked_at (epoch seconds) is when it was last confirmed current.
+create table if not exists thumbnail_colors (
+    video_id      text not null,
+    method        text not null,
+    thumbnail_url text not null,
+    etag          text,
+    color         text not null,
+    palette       jsonb not null default '[]'::jsonb,
+    checked_at    double precision not null,
+    primary key (video_id, method)
+);
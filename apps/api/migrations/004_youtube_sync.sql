@@ -0,0 +1,27 @@
+-- Uploads synced from each user's channel. Incremental syncs only append
+-- uploads newer than youtube_sync_state.last_published_at; counts are
+-- refreshed in batches of 50 ids per videos.list call.
+create table if not exists youtube_videos (
+    user_email    text not null,
+    video_id      text not null,
+    title         text,
+    published_at  timestamptz,
+    thumbnail_url text,
+    view_count    bigint not null default 0,
+    like_count    bigint not null default 0,
+    comment_count bigint not null default 0,
+    synced_at     timestamptz not null default now(),
+    primary key (user_email, video_id)
+);
+
+create index if not exists youtube_videos_user_published_idx
+    on youtube_videos (user_email, published_at desc);
+
+-- last_published_at is the playlist time of the newest upload seen, which
+-- is the order the uploads playlist is returned in.
+create table if not exists youtube_sync_state (
+    user_email          text primary key,
+    uploads_playlist_id text not null,
+    last_published_at   timestamptz,
+    last_synced_at      timestamptz not null default now()
+);
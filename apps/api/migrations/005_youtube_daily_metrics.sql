@@ -0,0 +1,13 @@
+-- Per-day YouTube Analytics rows per user. Rows are only refetched while
+-- provisional (fetched within ANALYTICS_SETTLE_DAYS of the day itself), so
+-- a refresh asks YouTube for at most the last few days.
+create table if not exists youtube_daily_metrics (
+    user_email         text not null,
+    day                date not null,
+    views              bigint not null default 0,
+    minutes_watched    bigint not null default 0,
+    likes              bigint not null default 0,
+    subscribers_gained bigint not null default 0,
+    fetched_at         date not null default current_date,
+    primary key (user_email, day)
+);
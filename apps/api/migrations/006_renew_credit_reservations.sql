@@ -0,0 +1,57 @@
+-- Long-running work (queued video jobs) renews its hold so the sweeper only
+-- releases reservations that have not been renewed for p_max_age_seconds.
+
+alter table credit_reservations add column if not exists renewed_at timestamptz;
+
+drop index if exists credit_reservations_held_idx;
+
+create index if not exists credit_reservations_held_idx
+    on credit_reservations ((coalesce(renewed_at, created_at)))
+    where status = 'held';
+
+-- Returns false when the reservation is no longer held.
+create or replace function renew_credit_reservation(p_reservation_id uuid)
+returns boolean
+language plpgsql
+as $$
+begin
+    update credit_reservations
+       set renewed_at = now()
+     where id = p_reservation_id
+       and status = 'held';
+
+    return found;
+end;
+$$;
+
+create or replace function expire_credit_reservations(p_max_age_seconds integer)
+returns integer
+language plpgsql
+as $$
+declare
+    v_count integer;
+begin
+    with expired as (
+        update credit_reservations
+           set status = 'refunded', settled_at = now()
+         where status = 'held'
+           and coalesce(renewed_at, created_at) < now() - make_interval(secs => p_max_age_seconds)
+        returning user_email, amount
+    ),
+    totals as (
+        select user_email, sum(amount) as amount
+          from expired
+         group by user_email
+    ),
+    refunded as (
+        update profiles
+           set credits_balance = profiles.credits_balance + totals.amount
+          from totals
+         where profiles.user_email = totals.user_email
+        returning 1
+    )
+    select count(*) into v_count from expired;
+
+    return v_count;
+end;
+$$;
@@ -0,0 +1,23 @@
+-- Top-ups are a single increment so they can't race with reserve_credits
+-- the way a read-then-write of the balance did. Returns null when the
+-- profile is missing.
+create or replace function add_credits(
+    p_email text,
+    p_amount integer,
+    p_tier text default null
+)
+returns integer
+language plpgsql
+as $$
+declare
+    v_balance integer;
+begin
+    update profiles
+       set credits_balance = profiles.credits_balance + p_amount,
+           subscription_tier = coalesce(p_tier, profiles.subscription_tier)
+     where profiles.user_email = p_email
+    returning profiles.credits_balance into v_balance;
+
+    return v_balance;
+end;
+$$;
@@ -0,0 +1,388 @@
+import os
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from fastapi import HTTPException
+from pydantic import ValidationError
+from dotenv import load_dotenv
+import metrics
+
+
+load_dotenv()
+
+ROUTER_EWMA_ALPHA = float(os.getenv("ROUTER_EWMA_ALPHA", 0.2))
+ROUTER_BREAKER_FAILURES = int(os.getenv("ROUTER_BREAKER_FAILURES", 3))
+ROUTER_BREAKER_ERROR_RATE = float(os.getenv("ROUTER_BREAKER_ERROR_RATE", 0.5))
+ROUTER_BREAKER_MIN_SAMPLES = int(os.getenv("ROUTER_BREAKER_MIN_SAMPLES", 10))
+ROUTER_BREAKER_COOLDOWN = float(os.getenv("ROUTER_BREAKER_COOLDOWN", 30))
+ROUTER_HEDGE_TIERS = {tier.strip() for tier in os.getenv("ROUTER_HEDGE_TIERS", "pro").split(",") if tier.strip()}
+ROUTER_HEDGE_FACTOR = float(os.getenv("ROUTER_HEDGE_FACTOR", 1.5))
+ROUTER_HEDGE_DELAY = float(os.getenv("ROUTER_HEDGE_DELAY", 5))
+ROUTER_HEDGE_MIN_DELAY = float(os.getenv("ROUTER_HEDGE_MIN_DELAY", 1))
+
+ROUTER_TIMEOUTS = {
+    "text": float(os.getenv("ROUTER_TIMEOUT_TEXT", 60)),
+    "image": float(os.getenv("ROUTER_TIMEOUT_IMAGE", 120)),
+}
+
+# Targets whose EWMA latency is above this are tried after their faster peers
+ROUTER_SLOW_SECONDS = {
+    "text": float(os.getenv("ROUTER_SLOW_SECONDS_TEXT", 20)),
+    "image": float(os.getenv("ROUTER_SLOW_SECONDS_IMAGE", 60)),
+}
+
+# First entry is the tier's preferred model, the rest its fallbacks in order.
+# Any chain can be replaced with ROUTER_CHAIN_<TASK>_<TIER>, e.g.
+# ROUTER_CHAIN_TEXT_PRO=gemini:gemini-3-flash-preview,groq:llama-3.3-70b-versatile
+DEFAULT_CHAINS = {
+    "text": {
+        "free": "groq:llama-3.1-8b-instant,groq:llama-3.3-70b-versatile,gemini:gemini-3-flash-preview",
+        "standard": "groq:llama-3.3-70b-versatile,gemini:gemini-3-flash-preview,groq:llama-3.1-8b-instant",
+        "pro": "gemini:gemini-3-flash-preview,groq:llama-3.3-70b-versatile,groq:llama-3.1-8b-instant",
+    },
+    "image": {
+        "free": "huggingface:black-forest-labs/flux.1-schnell,huggingface:stabilityai/stable-diffusion-xl-base-1.0",
+        "standard": "huggingface:stabilityai/stable-diffusion-xl-base-1.0,huggingface:black-forest-labs/flux.1-schnell",
+        "pro": "gemini:imagen-4.0-generate-001,huggingface:stabilityai/stable-diffusion-xl-base-1.0",
+    },
+}
+
+# Statuses that mean the request itself was rejected (bad parameters, a
+# safety refusal), so another provider won't do better and the provider
+# isn't unhealthy. Auth, not-found, timeouts and rate limits still fail over.
+CLIENT_ERROR_STATUSES = {400, 413, 422}
+
+def is_client_error(e: BaseException) -> bool:
+    if isinstance(e, ValidationError):
+        return True
+
+    # HTTPException and most SDK errors carry status_code; google-genai uses
+    # code, huggingface_hub the response
+    status = getattr(e, "status_code", None) or getattr(e, "code", None) or getattr(getattr(e, "response", None), "status_code", None)
+
+    return status in CLIENT_ERROR_STATUSES
+
+class ProbeInFlight(Exception):
+    # The target's breaker is half-open and another request already holds its probe
+    pass
+
+@dataclass(frozen=True)
+class Target:
+    provider: str
+    model: str
+
+    @property
+    def name(self) -> str:
+        return f"{self.provider}:{self.model}"
+
+def parse_chain(raw: str):
+    targets = []
+
+    for item in (raw or "").split(","):
+        provider, _, model = item.strip().partition(":")
+
+        if provider and model:
+            targets.append(Target(provider, model))
+
+    return targets
+
+def load_chains():
+    return {
+        task: {
+            tier: parse_chain(os.getenv(f"ROUTER_CHAIN_{task.upper()}_{tier.upper()}", raw))
+            for tier, raw in tiers.items()
+        }
+        for task, tiers in DEFAULT_CHAINS.items()
+    }
+
+class ProviderHealth:
+    # EWMA latency and error rate for one provider/model, plus a circuit
+    # breaker: after repeated failures the target is skipped for a cooldown,
+    # then a single probe request decides whether it is back.
+    def __init__(self, name: str):
+        self.name = name
+        self.latency = None
+        self.error_rate = 0.0
+        self.samples = 0
+        self.failures = 0
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.probing = False
+
+    def usable(self) -> bool:
+        if self.state == "closed":
+            return True
+
+        return not self.probing and time.monotonic() - self.opened_at >= ROUTER_BREAKER_COOLDOWN
+
+    def begin(self) -> bool:
+        # Claims the single half-open probe; False if it can't be sent now
+        if self.state == "closed":
+            return True
+
+        if not self.usable():
+            return False
+
+        self.state = "half_open"
+        self.probing = True
+
+        return True
+
+    def release(self):
+        # The attempt was abandoned (hedge loser, client gone), which says
+        # nothing about the provider
+        self.probing = False
+
+    def record_success(self, seconds: float):
+        self.latency = seconds if self.latency is None else ROUTER_EWMA_ALPHA * seconds + (1 - ROUTER_EWMA_ALPHA) * self.latency
+        self._record(error=False)
+        self.failures = 0
+        self.probing = False
+
+        if self.state != "closed":
+            print(f"Router: {self.name} recovered, closing its breaker")
+            self.state = "closed"
+
+        metrics.set_gauge(f"router_{self.name}_latency_ewma", self.latency)
+        metrics.set_gauge(f"router_{self.name}_open", 0)
+
+    def record_failure(self):
+        self._record(error=True)
+        self.failures += 1
+        self.probing = False
+
+        tripped = self.failures >= ROUTER_BREAKER_FAILURES or (
+            self.samples >= ROUTER_BREAKER_MIN_SAMPLES and self.error_rate >= ROUTER_BREAKER_ERROR_RATE
+        )
+
+        if self.state == "half_open" or (self.state == "closed" and tripped):
+            print(f"Router: opening breaker for {self.name} ({self.failures} failures, error rate {self.error_rate:.2f})")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            metrics.incr("router_breaker_opens")
+            metrics.set_gauge(f"router_{self.name}_open", 1)
+
+    def _record(self, error: bool):
+        self.samples += 1
+        self.error_rate = ROUTER_EWMA_ALPHA * float(error) + (1 - ROUTER_EWMA_ALPHA) * self.error_rate
+        metrics.set_gauge(f"router_{self.name}_error_rate", self.error_rate)
+
+    def to_dict(self):
+        return {
+            "state": self.state,
+            "latency_ewma": self.latency,
+            "error_rate": round(self.error_rate, 4),
+            "samples": self.samples
+        }
+
+class ModelRouter:
+    def __init__(self, chains: dict = None):
+        self.chains = chains or load_chains()
+        self.health = {}
+
+    def health_for(self, target: Target) -> ProviderHealth:
+        health = self.health.get(target.name)
+
+        if health is None:
+            health = self.health[target.name] = ProviderHealth(target.name)
+
+        return health
+
+    def chain(self, task: str, tier: str):
+        tiers = self.chains[task]
+
+        return tiers.get(tier) or tiers["free"]
+
+    def primary(self, task: str, tier: str) -> Target:
+        return self.chain(task, tier)[0]
+
+    def candidates(self, task: str, tier: str):
+        # Chain order, minus open breakers, with slow targets moved behind
+        # the healthy ones
+        usable = [target for target in self.chain(task, tier) if self.health_for(target).usable()]
+        slow = [target for target in usable if (self.health_for(target).latency or 0) > ROUTER_SLOW_SECONDS[task]]
+
+        return [target for target in usable if target not in slow] + slow
+
+    def pick(self, task: str, tier: str) -> Target:
+        candidates = self.candidates(task, tier)
+
+        if not candidates:
+            raise HTTPException(503, f"Every {task} provider for the {tier} tier is unavailable; try again shortly")
+
+        return candidates[0]
+
+    @asynccontextmanager
+    async def track(self, target: Target):
+        # Records the outcome of a call made outside route(), e.g. a stream
+        health = self.health_for(target)
+
+        if not health.begin():
+            raise ProbeInFlight(f"{target.name} is recovering and already being probed")
+
+        started = time.perf_counter()
+
+        try:
+            yield
+
+        except (asyncio.CancelledError, GeneratorExit):
+            health.release()
+            raise
+
+        except Exception as e:
+            if is_client_error(e):
+                health.release()
+
+            else:
+                health.record_failure()
+
+            raise
+
+        health.record_success(time.perf_counter() - started)
+
+    async def route(self, task: str, tier: str, call, hedge: bool = None):
+        # call(target) is an async callable doing the provider request. Returns
+        # (result, decision); decision describes what was tried, for metadata.
+        candidates = self.candidates(task, tier)
+
+        if not candidates:
+            raise HTTPException(503, f"Every {task} provider for the {tier} tier is unavailable; try again shortly")
+
+        hedge = tier in ROUTER_HEDGE_TIERS if hedge is None else hedge
+        decision = {"task": task, "tier": tier, "hedged": False, "attempts": []}
+
+        try:
+            if hedge and len(candidates) > 1:
+                result, target = await self._hedged(task, candidates, call, decision)
+
+            else:
+                result, target = await self._sequential(task, candidates, call, decision)
+
+        except ProbeInFlight:
+            raise HTTPException(503, f"Every {task} provider for the {tier} tier is unavailable; try again shortly")
+
+        decision.update(provider=target.provider, model=target.model, fallback=target != self.primary(task, tier))
+
+        if decision["fallback"]:
+            metrics.incr("router_fallbacks")
+
+        return result, decision
+
+    async def _attempt(self, task: str, target: Target, call, decision: dict):
+        attempt = {"target": target.name}
+        decision["attempts"].append(attempt)
+        started = time.perf_counter()
+
+        try:
+            async with self.track(target):
+                result = await asyncio.wait_for(call(target), ROUTER_TIMEOUTS[task])
+
+        except asyncio.CancelledError:
+            attempt["status"] = "cancelled"
+            raise
+
+        except ProbeInFlight:
+            attempt["status"] = "skipped"
+            raise
+
+        except Exception as e:
+            if is_client_error(e):
+                attempt["status"] = "rejected"
+                attempt["error"] = str(e)[:200] or type(e).__name__
+                raise
+
+            attempt["status"] = "timeout" if isinstance(e, asyncio.TimeoutError) else "error"
+            attempt["error"] = str(e)[:200] or type(e).__name__
+            print(f"Router: {target.name} failed ({attempt['status']}): {e}")
+            raise
+
+        finally:
+            attempt["seconds"] = round(time.perf_counter() - started, 3)
+            metrics.incr(f"router_{target.provider}_{attempt.get('status', 'ok')}")
+
+        attempt["status"] = "ok"
+
+        return result
+
+    async def _sequential(self, task: str, candidates: list, call, decision: dict):
+        error = None
+
+        for target in candidates:
+            try:
+                return await self._attempt(task, target, call, decision), target
+
+            except Exception as e:
+                if is_client_error(e):
+                    raise
+
+                # A skipped probe doesn't hide a real failure from an earlier target
+                if error is None or not isinstance(e, ProbeInFlight):
+                    error = e
+
+        raise error
+
+    def _hedge_delay(self, target: Target) -> float:
+        latency = self.health_for(target).latency
+
+        return max(ROUTER_HEDGE_MIN_DELAY, latency * ROUTER_HEDGE_FACTOR if latency else ROUTER_HEDGE_DELAY)
+
+    async def _hedged(self, task: str, candidates: list, call, decision: dict):
+        # If the first target is slower than it usually is, the next one is
+        # raced against it and the first success wins. At most one hedge is
+        # sent; after that, further targets are only tried on failure. The
+        # loser is cancelled, though a blocking SDK call already running in
+        # its pool thread still finishes in the background.
+        remaining = list(candidates)
+        running = {}
+        hedges_left = 1
+        error = None
+
+        def launch():
+            target = remaining.pop(0)
+            running[asyncio.ensure_future(self._attempt(task, target, call, decision))] = target
+
+        launch()
+
+        try:
+            while running:
+                timeout = self._hedge_delay(candidates[0]) if remaining and hedges_left else None
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    hedges_left -= 1
+                    decision["hedged"] = True
+                    metrics.incr("router_hedges")
+                    launch()
+                    continue
+
+                for attempt in done:
+                    target = running.pop(attempt)
+
+                    if attempt.exception() is None:
+                        if decision["hedged"]:
+                            metrics.incr(f"router_hedge_wins_{'primary' if target == candidates[0] else 'secondary'}")
+
+                        return attempt.result(), target
+
+                    if is_client_error(attempt.exception()):
+                        raise attempt.exception()
+
+                    if error is None or not isinstance(attempt.exception(), ProbeInFlight):
+                        error = attempt.exception()
+
+                if remaining and not running:
+                    launch()
+
+            raise error
+
+        finally:
+            for attempt in running:
+                attempt.cancel()
+
+            await asyncio.gather(*running, return_exceptions=True)
+
+    def snapshot(self):
+        return {name: health.to_dict() for name, health in self.health.items()}
+
+model_router = ModelRouter()
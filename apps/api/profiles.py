@@ -0,0 +1,57 @@
+import os
+from cachetools import TTLCache
+from dotenv import load_dotenv
+from db import supabase
+from executor import run_blocking
+import metrics
+
+
+load_dotenv()
+
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", 10000))
+PROFILE_CACHE_TTL = int(os.getenv("PROFILE_CACHE_TTL", 300))
+
+# Bounded LRU with per-entry TTL, keyed by email. Only touched from the event
+# loop thread, so no lock is needed around it.
+_cache = TTLCache(maxsize=PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL)
+
+def _record(hit: bool):
+    metrics.incr("profile_cache_hits" if hit else "profile_cache_misses")
+    metrics.set_gauge("profile_cache_hit_rate", metrics.ratio("profile_cache_hits", "profile_cache_misses"))
+    metrics.set_gauge("profile_cache_size", len(_cache))
+
+async def get_profile(email: str):
+    profile = _cache.get(email)
+
+    if profile is not None:
+        _record(hit=True)
+        return dict(profile)
+
+    _record(hit=False)
+
+    res = await run_blocking("supabase", supabase.table("profiles").select("*")\
+        .eq("user_email", email).execute)
+
+    if not res.data:
+        return None
+
+    _cache[email] = res.data[0]
+
+    return dict(res.data[0])
+
+def store(email: str, profile: dict):
+    _cache[email] = dict(profile)
+
+def update_cached(email: str, **fields):
+    # Write-through for callers that already know the new values; an entry
+    # that is not cached stays uncached rather than being half-filled.
+    profile = _cache.get(email)
+
+    if profile is not None:
+        _cache[email] = {**profile, **fields}
+
+def invalidate(email: str):
+    _cache.pop(email, None)
+
+def clear():
+    _cache.clear()
@@ -0,0 +1,108 @@
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+from dotenv import load_dotenv
+from response_cache import build_backend
+import metrics
+
+
+load_dotenv()
+
+PROMPT_CACHE_ENABLED = os.getenv("PROMPT_CACHE_ENABLED", "true").lower() == "true"
+PROMPT_CACHE_BACKEND = os.getenv("PROMPT_CACHE_BACKEND", os.getenv("RESPONSE_CACHE_BACKEND", "memory"))
+PROMPT_CACHE_SIZE = int(os.getenv("PROMPT_CACHE_SIZE", 2000))
+PROMPT_CACHE_PREFIX = os.getenv("PROMPT_CACHE_PREFIX", "pc:")
+
+# Credits charged when a paid route is answered from the cache
+PROMPT_CACHE_HIT_COST = int(os.getenv("PROMPT_CACHE_HIT_COST", 0))
+
+# Seconds a result is reused for. Trend ideas are keyed by niche only and
+# shared by every user in it, so they turn over quickly.
+PROMPT_CACHE_TTLS = {
+    "enhance_prompt": int(os.getenv("PROMPT_CACHE_TTL_ENHANCE_PROMPT", 86400)),
+    "repurpose": int(os.getenv("PROMPT_CACHE_TTL_REPURPOSE", 86400)),
+    "trends": int(os.getenv("PROMPT_CACHE_TTL_TRENDS", 900)),
+}
+
+# Comma separated routes that always go to the model, e.g. PROMPT_CACHE_BYPASS=trends
+PROMPT_CACHE_BYPASS = {route.strip() for route in os.getenv("PROMPT_CACHE_BYPASS", "").split(",") if route.strip()}
+
+def normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text or "").strip().casefold()
+
+def cache_key(route: str, model_name: str, prompt: str = "", tone: str = None, niche: str = None) -> str:
+    # Content-addressed: identical inputs to the same model share an entry
+    # no matter who sent them.
+    payload = json.dumps([route, model_name, normalize(prompt), normalize(tone), normalize(niche)])
+
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+class PromptCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.inflight = {}
+
+    def enabled(self, route: str) -> bool:
+        return PROMPT_CACHE_ENABLED and route not in PROMPT_CACHE_BYPASS
+
+    async def get(self, route: str, key: str):
+        if not self.enabled(route):
+            return None
+
+        try:
+            entry = await self.backend.get(f"{route}:{key}")
+
+        except Exception as e:
+            print(f"Prompt cache read failed for {route}: {e}")
+            entry = None
+
+        hit = entry is not None and time.time() - entry[1] < PROMPT_CACHE_TTLS[route]
+
+        metrics.incr(f"prompt_cache_{route}_{'hits' if hit else 'misses'}")
+        metrics.set_gauge(f"prompt_cache_{route}_hit_rate", metrics.ratio(f"prompt_cache_{route}_hits", f"prompt_cache_{route}_misses"))
+
+        return entry[0] if hit else None
+
+    async def set(self, route: str, key: str, value):
+        if not self.enabled(route) or value is None:
+            return
+
+        try:
+            await self.backend.set(f"{route}:{key}", value, time.time(), PROMPT_CACHE_TTLS[route])
+
+        except Exception as e:
+            print(f"Prompt cache write failed for {route}: {e}")
+
+    def generate(self, route: str, key: str, generate):
+        # Identical requests arriving while the model is still answering wait
+        # for that answer instead of each paying for their own. generate()
+        # returns the value to cache, or None to cache nothing.
+        task = self.inflight.get((route, key))
+
+        if task is None:
+            task = asyncio.ensure_future(self._generate_and_store(route, key, generate))
+            self.inflight[(route, key)] = task
+            task.add_done_callback(lambda _: self.inflight.pop((route, key), None))
+
+        return asyncio.shield(task)
+
+    async def get_or_generate(self, route: str, key: str, generate, fresh: bool = False):
+        # fresh skips the lookup but still refreshes the entry
+        value = None if fresh else await self.get(route, key)
+
+        if value is not None:
+            return value, True
+
+        return await self.generate(route, key, generate), False
+
+    async def _generate_and_store(self, route: str, key: str, generate):
+        value = await generate()
+
+        await self.set(route, key, value)
+
+        return value
+
+prompt_cache = PromptCache(build_backend(PROMPT_CACHE_BACKEND, size=PROMPT_CACHE_SIZE, max_age=max(PROMPT_CACHE_TTLS.values()), prefix=PROMPT_CACHE_PREFIX))
@@ -0,0 +1,223 @@
+import io
+import os
+import time
+import asyncio
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+from typing import List, Optional
+from dotenv import load_dotenv
+from executor import run_blocking
+from token_manager import token_manager
+import canva_export
+import http_client
+import instagram
+import linkedin
+import metrics
+
+
+load_dotenv()
+
+router = APIRouter()
+
+PUBLISH_MAX_TARGETS = int(os.getenv("PUBLISH_MAX_TARGETS", 20))
+PUBLISH_MEDIA_MAX_BYTES = int(os.getenv("PUBLISH_MEDIA_MAX_BYTES", 10 * 1024 * 1024))
+PUBLISH_TARGET_TIMEOUT = float(os.getenv("PUBLISH_TARGET_TIMEOUT", 120))
+PUBLISH_CONCURRENCY = int(os.getenv("PUBLISH_CONCURRENCY", 4))
+YOUTUBE_THUMBNAIL_MAX_BYTES = int(os.getenv("YOUTUBE_THUMBNAIL_MAX_BYTES", 2 * 1024 * 1024))
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Which key of a /api/repurpose result holds the copy for each platform
+CONTENT_KEYS = {
+    "linkedin": "linkedin",
+    "instagram": "instagram",
+    "youtube_community": "youtube",
+}
+
+class PublishTarget(BaseModel):
+    platform: str  # linkedin | instagram | youtube_thumbnail | youtube_community
+    account_id: str  # linkedin_id, instagram_id or the YouTube account's email
+    author_urn: Optional[str] = None  # LinkedIn organization to post as
+    video_id: Optional[str] = None  # youtube_thumbnail only
+    text: Optional[str] = None
+
+class PublishRequest(BaseModel):
+    text: Optional[str] = None
+    content: dict = {}  # e.g. the /api/repurpose output, keyed by platform
+    image_url: Optional[str] = None
+    targets: List[PublishTarget]
+
+class SharedMedia:
+    # One publish downloads the asset's image at most once, and targets that
+    # post as the same owner share a single upload of it.
+    def __init__(self, url: str = None):
+        self.url = url
+        self.download = None
+        self.uploads = {}
+
+    def content(self):
+        if self.download is None:
+            self.download = asyncio.ensure_future(self._download())
+
+        return asyncio.shield(self.download)
+
+    def upload_once(self, key: tuple, upload):
+        task = self.uploads.get(key)
+
+        if task is None:
+            task = self.uploads[key] = asyncio.ensure_future(upload())
+
+        return asyncio.shield(task)
+
+    async def _download(self):
+        body = bytearray()
+
+        async with http_client.stream("GET", self.url, provider="media") as res:
+            if res.status_code != 200:
+                raise HTTPException(400, f"Could not download image. Status: {res.status_code}")
+
+            async for chunk in res.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                body.extend(chunk)
+
+                if len(body) > PUBLISH_MEDIA_MAX_BYTES:
+                    raise HTTPException(413, f"Image exceeds the {PUBLISH_MEDIA_MAX_BYTES} byte limit")
+
+            content_type = res.headers.get("Content-Type", "application/octet-stream")
+
+        metrics.incr("publish_media_downloads")
+
+        return bytes(body), content_type
+
+    def close(self):
+        for task in [self.download, *self.uploads.values()]:
+            if task is not None and not task.done():
+                task.cancel()
+
+async def publish_linkedin(target: PublishTarget, text: str, media: SharedMedia):
+    token = await token_manager.get_linkedin_token(target.account_id)
+
+    if not token:
+        raise HTTPException(401, "LinkedIn not connected")
+
+    author = target.author_urn or f"urn:li:person:{target.account_id}"
+    asset = None
+
+    if media.url:
+        async def upload():
+            content, content_type = await media.content()
+
+            return await linkedin.upload_image(token, author, content, content_type)
+
+        asset = await media.upload_once(("linkedin", author), upload)
+
+    elif not text:
+        raise HTTPException(400, "LinkedIn posts need text or an image")
+
+    return {"post_id": await linkedin.create_post(token, author, text or "", asset), "asset": asset}
+
+async def publish_instagram(target: PublishTarget, text: str, media: SharedMedia):
+    if not media.url:
+        raise HTTPException(400, "Instagram posts need an image")
+
+    token = await token_manager.get_instagram_token(target.account_id)
+
+    if not token:
+        raise HTTPException(401, "Instagram not connected")
+
+    return {"post_id": await instagram.publish_image(target.account_id, token, media.url, text or "")}
+
+async def publish_youtube_thumbnail(target: PublishTarget, text: str, media: SharedMedia):
+    if not media.url or not target.video_id:
+        raise HTTPException(400, "Thumbnail targets need an image and a video_id")
+
+    creds = await token_manager.get_google_credentials(target.account_id)
+
+    if not creds:
+        raise HTTPException(401, "YouTube not connected")
+
+    content, content_type = await media.content()
+
+    # YouTube's own thumbnail limit, well under PUBLISH_MEDIA_MAX_BYTES
+    if len(content) > YOUTUBE_THUMBNAIL_MAX_BYTES:
+        raise HTTPException(413, f"Thumbnails are limited to {YOUTUBE_THUMBNAIL_MAX_BYTES} bytes")
+
+    mimetype = content_type.split(";")[0].strip()
+
+    await run_blocking("google", canva_export.upload_thumbnail, creds, target.video_id, io.BytesIO(content), mimetype)
+
+    return {"video_id": target.video_id}
+
+async def publish_youtube_community(target: PublishTarget, text: str, media: SharedMedia):
+    raise HTTPException(501, "YouTube has no public API for community posts")
+
+PUBLISHERS = {
+    "linkedin": publish_linkedin,
+    "instagram": publish_instagram,
+    "youtube_thumbnail": publish_youtube_thumbnail,
+    "youtube_community": publish_youtube_community,
+}
+
+# Bounds concurrent writes per platform; request rates are additionally
+# smoothed by the per-provider token buckets in http_client.
+_platform_slots = {platform: asyncio.Semaphore(PUBLISH_CONCURRENCY) for platform in PUBLISHERS}
+
+def text_for(req: PublishRequest, target: PublishTarget):
+    return target.text or req.content.get(CONTENT_KEYS.get(target.platform)) or req.text
+
+async def publish_target(req: PublishRequest, target: PublishTarget, media: SharedMedia):
+    result = {"platform": target.platform, "account_id": target.account_id}
+    started = time.perf_counter()
+
+    try:
+        publisher = PUBLISHERS.get(target.platform)
+
+        if publisher is None:
+            raise HTTPException(400, f"Unknown platform: {target.platform}")
+
+        async with _platform_slots[target.platform]:
+            result.update(await asyncio.wait_for(publisher(target, text_for(req, target), media), PUBLISH_TARGET_TIMEOUT))
+
+        result["status"] = "published"
+
+    except HTTPException as he:
+        result.update(status="failed", status_code=he.status_code, error=he.detail)
+
+    except asyncio.TimeoutError:
+        result.update(status="failed", status_code=504, error="Timed out")
+
+    except Exception as e:
+        print(f"Publish Error ({target.platform} {target.account_id}): {e}")
+        result.update(status="failed", status_code=500, error=str(e))
+
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    metrics.incr(f"publish_{target.platform}_{result['status']}")
+
+    return result
+
+@router.post("/api/publish")
+async def publish(req: PublishRequest):
+    if not req.targets:
+        raise HTTPException(400, "No targets given")
+
+    if len(req.targets) > PUBLISH_MAX_TARGETS:
+        raise HTTPException(400, f"At most {PUBLISH_MAX_TARGETS} targets per publish")
+
+    media = SharedMedia(req.image_url)
+
+    try:
+        results = await asyncio.gather(*(publish_target(req, target, media) for target in req.targets))
+
+    finally:
+        media.close()
+
+    published = sum(1 for r in results if r["status"] == "published")
+
+    if published == len(results):
+        status = "success"
+
+    elif published:
+        status = "partial"
+
+    else:
+        status = "failed"
+
+    return {"status": status, "published": published, "failed": len(results) - published, "results": results}
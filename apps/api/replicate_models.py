@@ -0,0 +1,114 @@
+import os
+import time
+import asyncio
+import replicate
+from dotenv import load_dotenv
+from executor import run_blocking
+import metrics
+
+
+load_dotenv()
+
+# REPLICATE_BASE_URL is honoured by the SDK, so pointing it at a local fake
+# Replicate server is enough to exercise every Replicate-backed route.
+replicate_client = replicate.Client(api_token=os.getenv("REPLICATE_API_TOKEN"))
+
+REPLICATE_VERSION_TTL = int(os.getenv("REPLICATE_VERSION_TTL", 3600))
+REPLICATE_VERSION_MAX_STALE = int(os.getenv("REPLICATE_VERSION_MAX_STALE", 86400))
+
+def parse_pinned_versions(raw: str):
+    # "owner/model:version_id,owner/other:version_id"
+    pinned = {}
+
+    for item in (raw or "").split(","):
+        item = item.strip()
+
+        if ":" in item:
+            model_name, version_id = item.split(":", 1)
+            pinned[model_name.strip()] = version_id.strip()
+
+    return pinned
+
+class VersionResolver:
+    def __init__(self, client, ttl: int = REPLICATE_VERSION_TTL, max_stale: int = REPLICATE_VERSION_MAX_STALE, pinned: dict = None):
+        self.client = client
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.pinned = pinned or {}
+        self.cache = {}
+        self.locks = {}
+        self.refreshing = {}
+
+    async def resolve(self, model_name: str) -> str:
+        if model_name in self.pinned:
+            metrics.incr("replicate_version_pinned")
+            return f"{model_name}:{self.pinned[model_name]}"
+
+        entry = self.cache.get(model_name)
+
+        if entry:
+            version_id, fetched_at = entry
+            age = time.monotonic() - fetched_at
+
+            if age < self.ttl:
+                self._record_hit()
+                return f"{model_name}:{version_id}"
+
+            if age < self.max_stale:
+                # Serve the known version and refresh it behind the request
+                self._record_hit()
+                self._schedule_refresh(model_name)
+                return f"{model_name}:{version_id}"
+
+        metrics.incr("replicate_version_cache_misses")
+
+        lock = self.locks.setdefault(model_name, asyncio.Lock())
+
+        async with lock:
+            entry = self.cache.get(model_name)
+
+            # Another request may have filled the cache while we waited
+            if entry and time.monotonic() - entry[1] < self.ttl:
+                return f"{model_name}:{entry[0]}"
+
+            version_id = await self._fetch(model_name)
+
+        return f"{model_name}:{version_id}"
+
+    def invalidate(self, model_name: str):
+        self.cache.pop(model_name, None)
+
+    def _record_hit(self):
+        metrics.incr("replicate_version_cache_hits")
+        # Every hit skips models.get + versions.list
+        metrics.incr("replicate_version_round_trips_avoided", 2)
+
+    def _schedule_refresh(self, model_name: str):
+        task = self.refreshing.get(model_name)
+
+        if task and not task.done():
+            return
+
+        self.refreshing[model_name] = asyncio.create_task(self._refresh(model_name))
+
+    async def _refresh(self, model_name: str):
+        try:
+            await self._fetch(model_name)
+            metrics.incr("replicate_version_refreshes")
+
+        except Exception as e:
+            print(f"Replicate version refresh failed for {model_name}: {e}")
+
+    async def _fetch(self, model_name: str) -> str:
+        model = await run_blocking("replicate", self.client.models.get, model_name)
+        latest_version = (await run_blocking("replicate", model.versions.list))[0]
+
+        metrics.incr("replicate_version_lookups")
+        self.cache[model_name] = (latest_version.id, time.monotonic())
+
+        return latest_version.id
+
+version_resolver = VersionResolver(
+    replicate_client,
+    pinned=parse_pinned_versions(os.getenv("REPLICATE_PINNED_VERSIONS"))
+)
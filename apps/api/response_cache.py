@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import asyncio
+from collections import OrderedDict
+from cachetools import TTLCache
+from dotenv import load_dotenv
+import metrics
+
+try:
+    import redis.asyncio as redis
+except ImportError:
+    redis = None
+
+
+load_dotenv()
+
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory")
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 5000))
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 3600))
+RESPONSE_CACHE_MAX_STALE = int(os.getenv("RESPONSE_CACHE_MAX_STALE", 86400))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_PREFIX = os.getenv("RESPONSE_CACHE_PREFIX", "rc:")
+
+class MemoryBackend:
+    # Bounded LRU holding live objects; entries are dropped once they are too
+    # old to be served even as stale.
+    def __init__(self, size: int = RESPONSE_CACHE_SIZE, max_age: int = RESPONSE_CACHE_MAX_STALE):
+        self.entries = TTLCache(maxsize=size, ttl=max_age)
+
+    async def get(self, key: str):
+        return self.entries.get(key)
+
+    async def set(self, key: str, value, stored_at: float, max_age: int):
+        self.entries[key] = (value, stored_at)
+
+    async def delete(self, key: str):
+        self.entries.pop(key, None)
+
+class RedisBackend:
+    def __init__(self, url: str = REDIS_URL, prefix: str = REDIS_PREFIX):
+        self.client = redis.from_url(url)
+        self.prefix = prefix
+
+    async def get(self, key: str):
+        raw = await self.client.get(self.prefix + key)
+
+        if raw is None:
+            return None
+
+        entry = json.loads(raw)
+
+        return entry["value"], entry["stored_at"]
+
+    async def set(self, key: str, value, stored_at: float, max_age: int):
+        await self.client.set(self.prefix + key, json.dumps({"value": value, "stored_at": stored_at}), ex=max_age)
+
+    async def delete(self, key: str):
+        await self.client.delete(self.prefix + key)
+
+class LocalBackend:
+    # Stand-in with Redis semantics (JSON strings, per-key expiry, LRU bound)
+    # for running without a Redis server; values round-trip through JSON so
+    # anything that works here also works against Redis.
+    def __init__(self, size: int = RESPONSE_CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+
+    async def get(self, key: str):
+        item = self.entries.get(key)
+
+        if item is None:
+            return None
+
+        raw, expires_at = item
+
+        if expires_at <= time.time():
+            del self.entries[key]
+            return None
+
+        self.entries.move_to_end(key)
+        entry = json.loads(raw)
+
+        return entry["value"], entry["stored_at"]
+
+    async def set(self, key: str, value, stored_at: float, max_age: int):
+        self.entries[key] = (json.dumps({"value": value, "stored_at": stored_at}), time.time() + max_age)
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    async def delete(self, key: str):
+        self.entries.pop(key, None)
+
+def build_backend(name: str = RESPONSE_CACHE_BACKEND, size: int = RESPONSE_CACHE_SIZE, max_age: int = RESPONSE_CACHE_MAX_STALE, prefix: str = REDIS_PREFIX):
+    if name == "redis":
+        if redis is not None:
+            return RedisBackend(prefix=prefix)
+
+        print("Cache backend redis requested but the redis package is not installed; using memory")
+
+    if name == "local":
+        return LocalBackend(size)
+
+    return MemoryBackend(size, max_age)
+
+class ResponseCache:
+    def __init__(self, backend, ttl: int = RESPONSE_CACHE_TTL, max_stale: int = RESPONSE_CACHE_MAX_STALE):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.inflight = {}
+
+    async def get_or_fetch(self, namespace: str, key: str, fetch, ttl: int = None, provider: str = None, cost: int = 0):
+        # fetch is an async callable returning a JSON-serialisable value. Every
+        # hit counts `cost` against {provider}_quota_saved.
+        ttl = ttl or self.ttl
+        cache_key = f"{namespace}:{key}"
+
+        try:
+            entry = await self.backend.get(cache_key)
+
+        except Exception as e:
+            print(f"Response cache read failed for {cache_key}: {e}")
+            entry = None
+
+        if entry is not None:
+            value, stored_at = entry
+            age = time.time() - stored_at
+
+            if age < ttl:
+                self._record_hit(namespace, provider, cost)
+                return value
+
+            if age < self.max_stale:
+                # Serve what we have and revalidate behind the request
+                self._record_hit(namespace, provider, cost, stale=True)
+                self._schedule_refresh(cache_key, fetch)
+                return value
+
+        metrics.incr("response_cache_misses")
+        metrics.incr(f"response_cache_{namespace}_misses")
+
+        return await self._fetch(cache_key, fetch)
+
+    async def invalidate(self, namespace: str, key: str):
+        await self.backend.delete(f"{namespace}:{key}")
+
+    def _record_hit(self, namespace: str, provider: str, cost: int, stale: bool = False):
+        metrics.incr("response_cache_hits")
+        metrics.incr(f"response_cache_{namespace}_hits")
+
+        if stale:
+            metrics.incr("response_cache_stale_hits")
+
+        if provider and cost:
+            metrics.incr(f"{provider}_quota_saved", cost)
+
+        metrics.set_gauge("response_cache_hit_rate", metrics.ratio("response_cache_hits", "response_cache_misses"))
+
+    def _fetch(self, cache_key: str, fetch):
+        # Concurrent misses and refreshes for one key share a single fetch
+        task = self.inflight.get(cache_key)
+
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_and_store(cache_key, fetch))
+            self.inflight[cache_key] = task
+            task.add_done_callback(lambda _: self.inflight.pop(cache_key, None))
+
+        return asyncio.shield(task)
+
+    async def _fetch_and_store(self, cache_key: str, fetch):
+        value = await fetch()
+
+        try:
+            await self.backend.set(cache_key, value, time.time(), self.max_stale)
+
+        except Exception as e:
+            print(f"Response cache write failed for {cache_key}: {e}")
+
+        return value
+
+    def _schedule_refresh(self, cache_key: str, fetch):
+        if cache_key in self.inflight:
+            return
+
+        task = self._fetch(cache_key, fetch)
+        task.add_done_callback(self._log_refresh_error)
+
+    def _log_refresh_error(self, task):
+        if not task.cancelled() and task.exception():
+            print(f"Response cache refresh failed: {task.exception()}")
+
+        else:
+            metrics.incr("response_cache_refreshes")
+
+response_cache = ResponseCache(build_backend())
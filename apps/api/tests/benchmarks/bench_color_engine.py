@@ -0,0 +1,75 @@
+# Palette extraction over a fixture set of thumbnails: the old per-image
+# list comprehension + Counter against color_engine's batched histogram and
+# k-means paths. The fixtures are generated from a fixed seed (YouTube-sized
+# 480x360 JPEGs with a flat banner and a noisy body, plus near-black and
+# near-white frames) so every run sees the same images.
+#
+#   cd apps/api && python tests/benchmarks/bench_color_engine.py
+import io
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+import numpy as np
+from PIL import Image
+import color_engine
+
+FIXTURES = int(os.getenv("BENCH_FIXTURES", 50))
+ROUNDS = int(os.getenv("BENCH_ROUNDS", 5))
+
+def fixtures(count: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    images = []
+
+    for i in range(count):
+        pixels = rng.integers(0, 256, (360, 480, 3), dtype=np.uint8)
+        pixels[:180] = rng.integers(0, 256, 3)
+
+        if i % 10 == 0:
+            pixels[:] = 10  # near black: filtered, falls back to all pixels
+
+        elif i % 10 == 5:
+            pixels[180:] = 240  # near white body
+
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, "JPEG", quality=90)
+        images.append(buffer.getvalue())
+
+    return images
+
+def old_dominant_color(data: bytes):
+    # The previous analytics.get_dominant_color
+    img = Image.open(io.BytesIO(data)).resize((50, 50)).convert("RGB")
+    pixels = list(img.getdata())
+    colorful = [p for p in pixels if not (p[0] < 30 and p[1] < 30 and p[2] < 30) and not (p[0] > 220 and p[1] > 220 and p[2] > 220)]
+
+    return Counter(colorful or pixels).most_common(1)[0][0]
+
+def timed(fn) -> float:
+    fn()
+    started = time.perf_counter()
+
+    for _ in range(ROUNDS):
+        fn()
+
+    return (time.perf_counter() - started) / ROUNDS
+
+def main():
+    images = fixtures(FIXTURES)
+    runs = {
+        "old (Counter)": lambda: [old_dominant_color(data) for data in images],
+        "histogram": lambda: color_engine.extract_palettes(images),
+        "kmeans": lambda: color_engine.extract_palettes(images, method="kmeans"),
+    }
+
+    print(f"{FIXTURES} thumbnails, mean of {ROUNDS} rounds")
+
+    for name, fn in runs.items():
+        seconds = timed(fn)
+        print(f"{name:<14} {seconds * 1000:8.1f} ms/batch {seconds / FIXTURES * 1000:7.2f} ms/image")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# Load test for the per-provider executor: cheap requests keep arriving
+# while long generations are in flight, once with the blocking SDK call made
+# directly on the event loop (how the handlers used to work) and once through
+# executor.run_blocking. Prints the cheap route's latency percentiles and the
+# event loop's scheduling lag for each mode.
+#
+#   cd apps/api && python tests/benchmarks/bench_event_loop.py
+import os
+import sys
+import time
+import asyncio
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+import httpx
+from fastapi import FastAPI
+from executor import run_blocking
+
+GENERATION_SECONDS = float(os.getenv("BENCH_GENERATION_SECONDS", 2))
+GENERATIONS = int(os.getenv("BENCH_GENERATIONS", 4))
+CHEAP_RATE = float(os.getenv("BENCH_CHEAP_RATE", 100))  # requests per second
+DURATION = float(os.getenv("BENCH_DURATION", 5))
+
+def build_app(use_executor: bool):
+    app = FastAPI()
+
+    @app.get("/api/health")
+    async def health():
+        return {"status": "ok"}
+
+    @app.post("/api/generate")
+    async def generate():
+        # Stands in for groq/gemini/hf/replicate: a synchronous SDK call
+        if use_executor:
+            await run_blocking("huggingface", time.sleep, GENERATION_SECONDS)
+
+        else:
+            time.sleep(GENERATION_SECONDS)
+
+        return {"status": "done"}
+
+    return app
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+async def measure_lag(stop: asyncio.Event, lags: list, interval: float = 0.01):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+
+async def run(use_executor: bool):
+    transport = httpx.ASGITransport(app=build_app(use_executor))
+    latencies, lags = [], []
+    stop = asyncio.Event()
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def cheap(scheduled: float):
+            # Measured from when the request was due, not when the blocked
+            # loop finally got round to sending it
+            await client.get("/api/health")
+            latencies.append(time.perf_counter() - scheduled)
+
+        async def generations():
+            # Back to back, so a generation is always in flight
+            deadline = time.perf_counter() + DURATION
+
+            while time.perf_counter() < deadline:
+                await asyncio.gather(*(client.post("/api/generate") for _ in range(GENERATIONS)))
+
+        lag_task = asyncio.ensure_future(measure_lag(stop, lags))
+        load = asyncio.ensure_future(generations())
+        probes = []
+        started = time.perf_counter()
+
+        for i in range(int(DURATION * CHEAP_RATE)):
+            scheduled = started + i / CHEAP_RATE
+            await asyncio.sleep(max(0, scheduled - time.perf_counter()))
+            probes.append(asyncio.ensure_future(cheap(scheduled)))
+
+        await asyncio.gather(*probes)
+        await load
+        stop.set()
+        await lag_task
+
+    return latencies, lags
+
+def report(name: str, latencies: list, lags: list):
+    ms = lambda seconds: f"{seconds * 1000:8.1f}"
+
+    print(
+        f"{name:<10} requests={len(latencies):<5} "
+        f"p50={ms(statistics.median(latencies))}ms p99={ms(percentile(latencies, 99))}ms max={ms(max(latencies))}ms "
+        f"loop lag p99={ms(percentile(lags, 99))}ms"
+    )
+
+def main():
+    print(f"{GENERATIONS} concurrent {GENERATION_SECONDS}s generations, cheap requests at {CHEAP_RATE}/s for {DURATION}s")
+
+    for name, use_executor in (("direct", False), ("executor", True)):
+        report(name, *asyncio.run(run(use_executor)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+# Per-request cost of building a Google API client: googleapiclient's build(),
+# which re-reads and parses the bundled discovery document on every call,
+# against google_services.build_service() over the documents preloaded at
+# startup. Both bind a fresh set of user credentials each time, as the request
+# handlers do. No network is used.
+#
+#   cd apps/api && python tests/benchmarks/bench_google_services.py
+import os
+import sys
+import time
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+import google_services
+
+ROUNDS = int(os.getenv("BENCH_ROUNDS", 200))
+
+def credentials():
+    return Credentials(token="bench-token")
+
+def measure(name: str, construct):
+    construct()
+    samples = []
+
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        construct()
+        samples.append((time.perf_counter() - started) * 1000)
+
+    samples.sort()
+
+    print(f"{name:<34} rounds={ROUNDS} median={statistics.median(samples):.3f}ms p99={samples[int(len(samples) * 0.99) - 1]:.3f}ms")
+
+def main():
+    google_services.preload_discovery_documents()
+
+    for api, version in google_services.DISCOVERY_APIS:
+        measure(f"build {api} {version}", lambda: build(api, version, credentials=credentials(), cache_discovery=False))
+        measure(f"build_service {api} {version}", lambda: google_services.build_service(api, version, credentials()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# Connection churn of per-module Supabase clients (what main, auth,
+# analytics, webhooks, vault and video each built with create_client) against
+# the single pooled client in db.py. A local stub PostgREST counts the TCP
+# connections it accepts while the same concurrent query load goes through
+# the supabase thread pool.
+#
+#   cd apps/api && python tests/benchmarks/bench_supabase_connections.py
+import os
+import sys
+import time
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+QUERIES = int(os.getenv("BENCH_QUERIES", 600))
+MODULES = ("main", "auth", "analytics", "webhooks", "vault", "video")
+KEY = "eyJhbGciOiJIUzI1NiJ9.e30.bench"
+
+class StubPostgrest(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b"[]"
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class CountingServer(ThreadingHTTPServer):
+    daemon_threads = True
+    connections = 0
+
+    def get_request(self):
+        request = super().get_request()
+        self.connections += 1
+
+        return request
+
+server = CountingServer(("127.0.0.1", 0), StubPostgrest)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+
+os.environ["SUPABASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+os.environ["SUPABASE_KEY"] = KEY
+
+from supabase import create_client
+from executor import run_blocking
+import db
+
+async def load(clients: list):
+    queries = [
+        run_blocking("supabase", clients[i % len(clients)].table("profiles").select("*").eq("user_email", f"u{i}").execute)
+        for i in range(QUERIES)
+    ]
+
+    await asyncio.gather(*queries)
+
+def measure(name: str, clients: list):
+    server.connections = 0
+    started = time.perf_counter()
+
+    asyncio.run(load(clients))
+
+    print(f"{name:<22} queries={QUERIES} connections={server.connections:<5} seconds={time.perf_counter() - started:.2f}")
+
+def main():
+    measure("per-module clients", [create_client(os.environ["SUPABASE_URL"], KEY) for _ in MODULES])
+    measure("shared db.supabase", [db.supabase])
+
+    db.close_supabase()
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+import os
+import sys
+import asyncio
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# Modules build their SDK clients at import; these only need to parse, no
+# test talks to the real services.
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9")
+os.environ.setdefault("SUPABASE_KEY", "eyJhbGciOiJIUzI1NiJ9.e30.test")
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+os.environ.setdefault("GROQ_API_KEY", "test")
+
+@pytest.fixture
+def run():
+    # Runs a coroutine on a fresh loop, closing the shared HTTP clients
+    # (bound to that loop) before it goes away
+    import http_client
+
+    def run(coro):
+        async def main():
+            try:
+                return await coro
+
+            finally:
+                await http_client.close_all()
+
+        return asyncio.run(main())
+
+    return run
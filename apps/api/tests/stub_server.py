@@ -0,0 +1,85 @@
+# A local HTTP server standing in for a third-party API. routes maps
+# "METHOD /path" to handler(request) returning (status, headers, body); body
+# may be bytes, or anything else to be sent as JSON.
+import json
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import urlsplit, parse_qs
+
+class StubServer:
+    def __init__(self, routes: dict):
+        self.routes = routes
+        self.calls = Counter()
+        self.requests = []
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.server = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def handle_one(self):
+                parts = urlsplit(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                request = SimpleNamespace(
+                    method=self.command,
+                    path=parts.path,
+                    query=parse_qs(parts.query),
+                    headers=self.headers,
+                    body=self.rfile.read(length) if length else b""
+                )
+                route = f"{self.command} {parts.path}"
+
+                with stub.lock:
+                    stub.calls[route] += 1
+                    stub.requests.append(request)
+
+                handler = stub.routes.get(route)
+                status, headers, body = handler(request) if handler else (404, {}, {"error": "not found"})
+
+                if not isinstance(body, bytes):
+                    body = json.dumps(body).encode()
+                    headers = {"Content-Type": "application/json", **headers}
+
+                self.send_response(status)
+
+                for name, value in headers.items():
+                    self.send_header(name, value)
+
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_POST = do_PUT = do_DELETE = handle_one
+
+        class Server(ThreadingHTTPServer):
+            daemon_threads = True
+
+            def get_request(self):
+                request = super().get_request()
+
+                with stub.lock:
+                    stub.connections += 1
+
+                return request
+
+        self.server = Server(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,191 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+import admission
+import profiles
+
+WEIGHTS = {tier: limits["weight"] for tier, limits in admission.TIER_DEFAULTS.items()}
+
+@pytest.fixture
+def tiers(monkeypatch):
+    # Users are named after their tier, e.g. pro@example.com
+    async def get_profile(email):
+        return {"subscription_tier": email.split("@")[0]}
+
+    monkeypatch.setattr(profiles, "get_profile", get_profile)
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+def test_contended_slots_are_shared_by_weight(run):
+    queue = admission.FairQueue(1, WEIGHTS)
+    granted = []
+
+    async def waiter(tier):
+        await queue.acquire(tier, 10)
+        granted.append(tier)
+
+    async def go():
+        await queue.acquire("free", 10)
+
+        tasks = [asyncio.ensure_future(waiter(tier)) for tier in WEIGHTS for _ in range(30)]
+        await settle()
+
+        for _ in range(30):
+            queue.release()
+            await settle()
+
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    run(go())
+
+    assert len(granted) == 30
+    assert {tier: granted.count(tier) for tier in WEIGHTS} == {"free": 3, "standard": 9, "pro": 18}
+    assert queue.depth() == 0
+
+def test_timed_out_waiter_leaves_no_slot_behind(run):
+    queue = admission.FairQueue(1, WEIGHTS)
+
+    async def go():
+        await queue.acquire("free", 10)
+
+        with pytest.raises(HTTPException) as rejected:
+            await queue.acquire("pro", 0.01)
+
+        queue.release()
+
+        return rejected.value
+
+    rejected = run(go())
+
+    assert rejected.status_code == 429
+    assert int(rejected.headers["Retry-After"]) >= 1
+    assert queue.depth() == 0 and queue.in_use == 0
+
+def test_cancelled_waiter_leaves_no_slot_behind(run):
+    queue = admission.FairQueue(1, WEIGHTS)
+
+    async def go():
+        await queue.acquire("free", 10)
+
+        task = asyncio.ensure_future(queue.acquire("pro", 10))
+        await settle()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+        queue.release()
+
+    run(go())
+
+    assert queue.depth() == 0 and queue.in_use == 0
+
+@pytest.mark.parametrize("error", [asyncio.CancelledError, asyncio.TimeoutError])
+def test_slot_granted_as_the_wait_fails_goes_back(run, monkeypatch, error):
+    queue = admission.FairQueue(1, WEIGHTS)
+
+    # The grant lands in the same loop iteration as the timeout or cancel,
+    # so the wait fails even though the future already holds a slot
+    async def wait_for(future, timeout):
+        await future
+        raise error()
+
+    async def go():
+        await queue.acquire("free", 10)
+        monkeypatch.setattr(asyncio, "wait_for", wait_for)
+
+        task = asyncio.ensure_future(queue.acquire("pro", 10))
+        await settle()
+        queue.release()
+
+        return (await asyncio.gather(task, return_exceptions=True))[0]
+
+    outcome = run(go())
+
+    assert isinstance(outcome, HTTPException if error is asyncio.TimeoutError else asyncio.CancelledError)
+    assert queue.depth() == 0 and queue.in_use == 0
+
+def test_slot_granted_as_the_waiter_is_cancelled_is_not_leaked(run, tiers):
+    controller = admission.AdmissionController(slots=1)
+
+    async def work(email):
+        async with controller.admit(email, "test"):
+            await asyncio.sleep(0.01)
+
+    async def go():
+        holder = asyncio.ensure_future(work("pro@example.com"))
+        await settle()
+
+        waiters = [asyncio.ensure_future(work("standard@example.com")) for _ in range(3)]
+        await settle()
+
+        # The holder's release grants the next waiter, which is cancelled
+        # before it gets to run
+        await holder
+        waiters[0].cancel()
+        waiters[1].cancel()
+
+        await asyncio.gather(*waiters, return_exceptions=True)
+
+    run(go())
+
+    assert controller.queue.in_use == 0 and controller.queue.depth() == 0
+    assert not controller.in_flight
+
+def test_rate_limit_rejects_with_retry_after(run, tiers):
+    controller = admission.AdmissionController(slots=4)
+    burst = admission.TIER_LIMITS["free"]["burst"]
+
+    async def go():
+        for _ in range(burst):
+            async with controller.admit("free@example.com", "test"):
+                pass
+
+        with pytest.raises(HTTPException) as rejected:
+            await controller.acquire("free@example.com", "test")
+
+        return rejected.value
+
+    rejected = run(go())
+
+    assert rejected.status_code == 429
+    assert int(rejected.headers["Retry-After"]) >= 1
+    assert not controller.in_flight
+
+def test_concurrency_cap_is_checked_before_spending_a_token(run, tiers):
+    controller = admission.AdmissionController(slots=4)
+    cap = admission.TIER_LIMITS["free"]["concurrency"]
+
+    async def go():
+        tickets = [await controller.acquire("free@example.com", "test") for _ in range(cap)]
+        tokens = controller.buckets["free@example.com"].tokens
+
+        with pytest.raises(HTTPException) as rejected:
+            await controller.acquire("free@example.com", "test")
+
+        for ticket in tickets:
+            ticket.release()
+
+        return rejected.value, tokens, controller.buckets["free@example.com"].tokens
+
+    rejected, before, after = run(go())
+
+    assert rejected.status_code == 429
+    assert after >= before
+    assert not controller.in_flight and controller.queue.in_use == 0
+
+def test_token_bucket_refills_over_time(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(admission.time, "monotonic", lambda: now[0])
+
+    bucket = admission.TokenBucket(60, 2)
+
+    assert bucket.take() == 0 and bucket.take() == 0
+    assert bucket.take() == pytest.approx(1.0)
+
+    now[0] += 1
+
+    assert bucket.take() == 0
@@ -0,0 +1,102 @@
+# http_client against a local stub server: retries, keep-alive and rate limiting
+import time
+import httpx
+import pytest
+from stub_server import StubServer
+import http_client
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(http_client, "backoff_delay", lambda attempt, retry_after=None: 0)
+
+def flaky(failures: int, status: int, headers: dict = None):
+    # Fails the first `failures` requests with `status`, then succeeds
+    seen = []
+
+    def handler(request):
+        seen.append(request)
+
+        if len(seen) <= failures:
+            return status, headers or {}, {"error": status}
+
+        return 200, {}, {"ok": True}
+
+    return handler
+
+def test_get_is_retried_until_it_succeeds(run):
+    with StubServer({"GET /flaky": flaky(2, 503)}) as stub:
+        response = run(http_client.get(f"{stub.url}/flaky"))
+
+    assert response.status_code == 200
+    assert stub.calls["GET /flaky"] == 3
+
+def test_retries_stop_at_the_limit(run):
+    with StubServer({"GET /down": flaky(10, 502)}) as stub:
+        response = run(http_client.get(f"{stub.url}/down", retries=2))
+
+    assert response.status_code == 502
+    assert stub.calls["GET /down"] == 3
+
+def test_post_is_not_replayed_after_a_server_error(run):
+    with StubServer({"POST /create": flaky(1, 500)}) as stub:
+        response = run(http_client.post(f"{stub.url}/create", json={"a": 1}))
+
+    assert response.status_code == 500
+    assert stub.calls["POST /create"] == 1
+
+def test_post_is_retried_after_a_429(run):
+    with StubServer({"POST /create": flaky(1, 429, {"Retry-After": "0"})}) as stub:
+        response = run(http_client.post(f"{stub.url}/create", json={"a": 1}))
+
+    assert response.status_code == 200
+    assert stub.calls["POST /create"] == 2
+
+def test_connect_errors_are_retried_then_raised(run):
+    with StubServer({}) as stub:
+        url = stub.url
+
+    with pytest.raises(httpx.ConnectError):
+        run(http_client.post(f"{url}/gone", retries=1))
+
+def test_requests_share_a_keep_alive_connection(run):
+    async def many(url):
+        for _ in range(20):
+            await http_client.get(url)
+
+    with StubServer({"GET /ping": lambda request: (200, {}, {"ok": True})}) as stub:
+        run(many(f"{stub.url}/ping"))
+
+    assert stub.calls["GET /ping"] == 20
+    assert stub.connections == 1
+
+def test_rate_limiter_smooths_a_burst(run):
+    async def burst(url):
+        client = http_client.ProviderClient("default")
+        client.limiter = http_client.RateLimiter(rate=20, burst=2)
+        started = time.perf_counter()
+
+        try:
+            for _ in range(6):
+                await client.get(url)
+
+        finally:
+            await client.aclose()
+
+        return time.perf_counter() - started
+
+    with StubServer({"GET /ping": lambda request: (200, {}, {"ok": True})}) as stub:
+        seconds = run(burst(f"{stub.url}/ping"))
+
+    # Two from the burst, then four more at 20/s
+    assert seconds >= 0.19
+
+def test_streams_are_not_retried(run):
+    async def read(url):
+        async with http_client.stream("GET", url, provider="media") as response:
+            return response.status_code, await response.aread()
+
+    with StubServer({"GET /image": flaky(1, 503)}) as stub:
+        status, _ = run(read(f"{stub.url}/image"))
+
+    assert status == 503
+    assert stub.calls["GET /image"] == 1
@@ -0,0 +1,116 @@
+import asyncio
+import pytest
+from micro_batcher import MicroBatcher
+
+def recorder(results=None):
+    batches = []
+
+    async def run_batch(items):
+        batches.append(list(items))
+
+        return results(items) if results else [item * 10 for item in items]
+
+    return batches, run_batch
+
+async def submit_all(batcher, items):
+    return await asyncio.gather(*(batcher.submit(item) for item in items), return_exceptions=True)
+
+def test_full_batch_is_sent_without_waiting_for_the_window(run):
+    batches, run_batch = recorder()
+    batcher = MicroBatcher("test", run_batch, window=10, max_size=3)
+
+    async def go():
+        return await asyncio.wait_for(asyncio.gather(*(batcher.submit(i) for i in range(3))), 1)
+
+    assert run(go()) == [0, 10, 20]
+    assert batches == [[0, 1, 2]]
+
+def test_partial_batch_is_sent_when_the_window_closes(run):
+    batches, run_batch = recorder()
+    batcher = MicroBatcher("test", run_batch, window=0.02, max_size=8)
+
+    assert run(submit_all(batcher, [1, 2])) == [10, 20]
+    assert batches == [[1, 2]]
+
+def test_an_exception_fails_only_its_caller(run):
+    def results(items):
+        return [ValueError("bad") if item == 1 else item for item in items]
+
+    _, run_batch = recorder(results)
+    batcher = MicroBatcher("test", run_batch, window=0.01)
+
+    outcome = run(submit_all(batcher, range(3)))
+
+    assert outcome[0] == 0 and outcome[2] == 2
+    assert isinstance(outcome[1], ValueError)
+
+def test_a_returned_cancelled_error_fails_its_caller(run):
+    async def run_batch(items):
+        async def one(item):
+            if item == 1:
+                raise asyncio.CancelledError()
+
+            return item
+
+        return await asyncio.gather(*(one(item) for item in items), return_exceptions=True)
+
+    batcher = MicroBatcher("test", run_batch, window=0.01)
+
+    outcome = run(submit_all(batcher, range(3)))
+
+    assert outcome[0] == 0 and outcome[2] == 2
+    assert isinstance(outcome[1], asyncio.CancelledError)
+
+def test_a_failed_batch_fails_every_caller(run):
+    async def run_batch(items):
+        raise RuntimeError("provider down")
+
+    batcher = MicroBatcher("test", run_batch, window=0.01)
+
+    outcome = run(submit_all(batcher, [1, 2]))
+
+    assert all(isinstance(result, RuntimeError) for result in outcome)
+
+def test_cancelling_a_batch_settles_its_callers(run):
+    started = []
+
+    async def run_batch(items):
+        started.append(items)
+        await asyncio.sleep(10)
+
+    batcher = MicroBatcher("test", run_batch, window=0.01)
+
+    async def go():
+        callers = [asyncio.ensure_future(batcher.submit(i)) for i in range(2)]
+
+        while not started:
+            await asyncio.sleep(0.01)
+
+        assert len(batcher.tasks) == 1
+
+        for task in list(batcher.tasks):
+            task.cancel()
+
+        outcome = await asyncio.wait_for(asyncio.gather(*callers, return_exceptions=True), 1)
+        await asyncio.sleep(0)
+
+        return outcome, len(batcher.tasks)
+
+    outcome, remaining = run(go())
+
+    assert all(isinstance(result, asyncio.CancelledError) for result in outcome)
+    assert remaining == 0
+
+def test_callers_that_gave_up_are_not_sent(run):
+    batches, run_batch = recorder()
+    batcher = MicroBatcher("test", run_batch, window=0.05)
+
+    async def go():
+        gone = asyncio.ensure_future(batcher.submit(1))
+        await asyncio.sleep(0)
+        gone.cancel()
+
+        return await batcher.submit(2)
+
+    assert run(go()) == 20
+    assert batches == [[2]]
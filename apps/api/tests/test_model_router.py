@@ -0,0 +1,145 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+import model_router
+from model_router import ModelRouter, Target
+
+PRIMARY = Target("fast", "one")
+SECONDARY = Target("backup", "two")
+TERTIARY = Target("last", "three")
+
+class ProviderError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"provider returned {status_code}")
+        self.status_code = status_code
+
+def make_router():
+    return ModelRouter({"text": {"free": [PRIMARY, SECONDARY, TERTIARY]}})
+
+def fake_call(behaviour: dict):
+    # behaviour maps a target to a result, an exception to raise, or a
+    # coroutine function to await
+    calls = []
+
+    async def call(target):
+        calls.append(target)
+        outcome = behaviour.get(target, target.name)
+
+        if isinstance(outcome, BaseException):
+            raise outcome
+
+        if callable(outcome):
+            return await outcome()
+
+        return outcome
+
+    return calls, call
+
+@pytest.fixture(autouse=True)
+def quick_hedges(monkeypatch):
+    monkeypatch.setattr(model_router, "ROUTER_HEDGE_DELAY", 0.02)
+    monkeypatch.setattr(model_router, "ROUTER_HEDGE_MIN_DELAY", 0.02)
+
+def test_failure_falls_over_to_the_next_target(run):
+    router = make_router()
+    calls, call = fake_call({PRIMARY: ProviderError(503)})
+
+    result, decision = run(router.route("text", "free", call, hedge=False))
+
+    assert result == SECONDARY.name
+    assert calls == [PRIMARY, SECONDARY]
+    assert decision["fallback"] is True
+    assert [attempt["status"] for attempt in decision["attempts"]] == ["error", "ok"]
+
+def test_client_error_is_not_retried_elsewhere(run):
+    router = make_router()
+    calls, call = fake_call({PRIMARY: ProviderError(400)})
+
+    with pytest.raises(ProviderError):
+        run(router.route("text", "free", call, hedge=False))
+
+    assert calls == [PRIMARY]
+    assert router.health_for(PRIMARY).failures == 0
+    assert router.health_for(PRIMARY).samples == 0
+
+def test_breaker_opens_after_repeated_failures(run):
+    router = make_router()
+    calls, call = fake_call({PRIMARY: ProviderError(503)})
+
+    for _ in range(model_router.ROUTER_BREAKER_FAILURES):
+        run(router.route("text", "free", call, hedge=False))
+
+    assert router.health_for(PRIMARY).state == "open"
+
+    calls.clear()
+    result, _ = run(router.route("text", "free", call, hedge=False))
+
+    assert result == SECONDARY.name
+    assert calls == [SECONDARY]
+
+def test_half_open_breaker_sends_a_single_probe(monkeypatch):
+    health = model_router.ProviderHealth(PRIMARY.name)
+
+    for _ in range(model_router.ROUTER_BREAKER_FAILURES):
+        health.record_failure()
+
+    assert not health.usable()
+
+    monkeypatch.setattr(model_router, "ROUTER_BREAKER_COOLDOWN", 0)
+
+    assert health.begin() is True
+    assert health.state == "half_open"
+    assert health.begin() is False
+
+    # A failed probe reopens the breaker; a successful one closes it
+    health.record_failure()
+
+    assert health.state == "open"
+    assert health.begin() is True
+
+    health.record_success(0.1)
+
+    assert health.state == "closed" and health.failures == 0
+
+def test_every_breaker_open_is_a_503(run):
+    router = make_router()
+    _, call = fake_call({target: ProviderError(503) for target in (PRIMARY, SECONDARY, TERTIARY)})
+
+    for _ in range(model_router.ROUTER_BREAKER_FAILURES):
+        with pytest.raises(ProviderError):
+            run(router.route("text", "free", call, hedge=False))
+
+    with pytest.raises(HTTPException) as rejected:
+        run(router.route("text", "free", call, hedge=False))
+
+    assert rejected.value.status_code == 503
+
+def test_slow_primary_is_hedged_and_loses(run):
+    router = make_router()
+
+    async def slow():
+        await asyncio.sleep(5)
+        return PRIMARY.name
+
+    calls, call = fake_call({PRIMARY: slow})
+
+    result, decision = run(asyncio.wait_for(router.route("text", "free", call, hedge=True), 1))
+
+    assert result == SECONDARY.name
+    assert calls == [PRIMARY, SECONDARY]
+    assert decision["hedged"] is True
+    assert {attempt["target"]: attempt["status"] for attempt in decision["attempts"]} == {PRIMARY.name: "cancelled", SECONDARY.name: "ok"}
+
+    # The cancelled loser says nothing about the primary's health
+    assert router.health_for(PRIMARY).samples == 0
+    assert router.health_for(PRIMARY).state == "closed"
+
+def test_fast_primary_is_not_hedged(run):
+    router = make_router()
+    calls, call = fake_call({})
+
+    result, decision = run(router.route("text", "free", call, hedge=True))
+
+    assert result == PRIMARY.name
+    assert calls == [PRIMARY]
+    assert decision["hedged"] is False and decision["fallback"] is False
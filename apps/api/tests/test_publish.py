@@ -0,0 +1,124 @@
+# Publishing fan-out against fake LinkedIn, Graph API and image hosts
+import json
+import pytest
+from stub_server import StubServer
+from token_manager import token_manager
+import canva_export
+import instagram
+import linkedin
+import publish
+
+IMAGE = b"\xff\xd8" + b"x" * 5000
+
+@pytest.fixture
+def platforms(monkeypatch):
+    state = {"container_status": "FINISHED", "image": IMAGE, "image_type": "image/jpeg"}
+
+    def register_upload(request):
+        owner = json.loads(request.body)["registerUploadRequest"]["owner"]
+
+        return 200, {}, {"value": {
+            "asset": f"urn:li:digitalmediaAsset:{owner}",
+            "uploadMechanism": {"com.linkedin.digitalmedia.uploading.MediaUploadHttpRequest": {"uploadUrl": f"{stub.url}/upload"}}
+        }}
+
+    stub = StubServer({
+        "GET /image.jpg": lambda request: (200, {"Content-Type": state["image_type"]}, state["image"]),
+        "POST /li/assets": register_upload,
+        "PUT /upload": lambda request: (201, {}, b""),
+        "POST /li/ugcPosts": lambda request: (201, {}, {"id": f"urn:li:share:{len(stub.requests)}"}),
+        "POST /graph/ig1/media": lambda request: (200, {}, {"id": "C1"}),
+        "GET /graph/C1": lambda request: (200, {}, {"status_code": state["container_status"]}),
+        "POST /graph/ig1/media_publish": lambda request: (200, {}, {"id": "IG1"}),
+    })
+
+    async def token(account_id):
+        return "token"
+
+    async def credentials(email):
+        return "credentials"
+
+    uploads = []
+
+    with stub:
+        monkeypatch.setattr(linkedin, "LINKEDIN_API", f"{stub.url}/li")
+        monkeypatch.setattr(instagram, "GRAPH_API", f"{stub.url}/graph")
+        monkeypatch.setattr(token_manager, "get_linkedin_token", token)
+        monkeypatch.setattr(token_manager, "get_instagram_token", token)
+        monkeypatch.setattr(token_manager, "get_google_credentials", credentials)
+        monkeypatch.setattr(canva_export, "upload_thumbnail", lambda creds, video_id, image, mimetype: uploads.append((video_id, len(image.read()), mimetype)))
+
+        yield stub, state, uploads
+
+def request(stub, *targets, **fields):
+    return publish.PublishRequest(image_url=f"{stub.url}/image.jpg", targets=list(targets), **fields)
+
+def test_fans_out_with_one_download_and_one_upload_per_author(platforms, run):
+    stub, _, _ = platforms
+
+    result = run(publish.publish(request(
+        stub,
+        {"platform": "linkedin", "account_id": "m1"},
+        {"platform": "linkedin", "account_id": "m1", "author_urn": "urn:li:organization:9"},
+        {"platform": "linkedin", "account_id": "m2", "author_urn": "urn:li:organization:9"},
+        {"platform": "instagram", "account_id": "ig1"},
+        content={"linkedin": "hello linkedin", "instagram": "hello instagram"}
+    )))
+
+    assert result["status"] == "success"
+    assert result["published"] == 4
+    assert stub.calls["GET /image.jpg"] == 1
+    assert stub.calls["POST /li/assets"] == 2  # the member and the organization
+    assert stub.calls["PUT /upload"] == 2
+    assert stub.calls["POST /li/ugcPosts"] == 3
+    assert stub.calls["POST /graph/ig1/media_publish"] == 1
+
+    captions = [r.body for r in stub.requests if r.path == "/graph/ig1/media"]
+    assert b"hello+instagram" in captions[0]
+
+def test_one_failed_platform_is_a_partial_publish(platforms, run):
+    stub, state, _ = platforms
+    state["container_status"] = "ERROR"
+
+    result = run(publish.publish(request(
+        stub,
+        {"platform": "linkedin", "account_id": "m1"},
+        {"platform": "instagram", "account_id": "ig1"},
+        {"platform": "tiktok", "account_id": "x"},
+        text="hello"
+    )))
+
+    statuses = {r["platform"]: (r["status"], r.get("status_code")) for r in result["results"]}
+
+    assert result["status"] == "partial"
+    assert statuses == {"linkedin": ("published", None), "instagram": ("failed", 400), "tiktok": ("failed", 400)}
+    assert stub.calls["POST /graph/ig1/media_publish"] == 0
+
+def test_thumbnail_uses_the_image_content_type(platforms, run):
+    stub, state, uploads = platforms
+    state["image_type"] = "image/png; charset=binary"
+
+    result = run(publish.publish(request(stub, {"platform": "youtube_thumbnail", "account_id": "a@b", "video_id": "v1"})))
+
+    assert result["status"] == "success"
+    assert uploads == [("v1", len(IMAGE), "image/png")]
+
+def test_oversized_thumbnail_is_rejected_before_upload(platforms, run, monkeypatch):
+    stub, state, uploads = platforms
+    monkeypatch.setattr(publish, "YOUTUBE_THUMBNAIL_MAX_BYTES", 1000)
+
+    result = run(publish.publish(request(stub, {"platform": "youtube_thumbnail", "account_id": "a@b", "video_id": "v1"})))
+
+    assert result["results"][0]["status_code"] == 413
+    assert uploads == []
+
+def test_oversized_media_fails_every_target(platforms, run, monkeypatch):
+    stub, _, _ = platforms
+    monkeypatch.setattr(publish, "PUBLISH_MEDIA_MAX_BYTES", 1000)
+
+    result = run(publish.publish(request(stub, {"platform": "linkedin", "account_id": "m1"}, {"platform": "linkedin", "account_id": "m2"})))
+
+    assert result["status"] == "failed"
+    assert {r["status_code"] for r in result["results"]} == {413}
+    assert stub.calls["GET /image.jpg"] == 1
+    assert stub.calls["POST /li/ugcPosts"] == 0
@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import sqlite3
+import tempfile
+import threading
+import asyncio
+from dotenv import load_dotenv
+from db import supabase
+from executor import run_blocking
+import color_engine
+import metrics
+
+
+load_dotenv()
+
+COLOR_CACHE_BACKEND = os.getenv("COLOR_CACHE_BACKEND", "disk")
+COLOR_CACHE_PATH = os.getenv("COLOR_CACHE_PATH", os.path.join(tempfile.gettempdir(), "thumbnail_colors.sqlite3"))
+COLOR_CACHE_TABLE = os.getenv("COLOR_CACHE_TABLE", "thumbnail_colors")
+
+# Ids go in the query string of an .in_() filter, so large lookups are split
+# to keep each request URL well under proxy limits
+COLOR_CACHE_LOOKUP_CHUNK = int(os.getenv("COLOR_CACHE_LOOKUP_CHUNK", 150))
+
+# Within this window a cached palette is served without touching the network;
+# after it the thumbnail is revalidated with If-None-Match against its ETag.
+COLOR_CACHE_REVALIDATE_AFTER = int(os.getenv("COLOR_CACHE_REVALIDATE_AFTER", 86400))
+
+FIELDS = ("video_id", "method", "thumbnail_url", "etag", "color", "palette", "checked_at")
+
+class DiskColorStore:
+    def __init__(self, path: str = COLOR_CACHE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = None
+
+    def _connect(self):
+        if self.conn is None:
+            directory = os.path.dirname(self.path)
+
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.conn.execute("pragma journal_mode=wal")
+            self.conn.execute(
+                "create table if not exists thumbnail_colors ("
+                " video_id text not null, method text not null, thumbnail_url text not null,"
+                " etag text, color text not null, palette text not null, checked_at real not null,"
+                " primary key (video_id, method))"
+            )
+
+        return self.conn
+
+    def _get_many(self, video_ids: list, method: str):
+        with self.lock:
+            conn = self._connect()
+            placeholders = ",".join("?" * len(video_ids))
+
+            rows = conn.execute(
+                f"select {', '.join(FIELDS)} from thumbnail_colors where method = ? and video_id in ({placeholders})",
+                [method, *video_ids]
+            ).fetchall()
+
+        entries = [dict(zip(FIELDS, row)) for row in rows]
+
+        for entry in entries:
+            entry["palette"] = json.loads(entry["palette"])
+
+        return entries
+
+    def _put_many(self, entries: list):
+        with self.lock:
+            conn = self._connect()
+
+            conn.executemany(
+                f"insert or replace into thumbnail_colors ({', '.join(FIELDS)}) values ({','.join('?' * len(FIELDS))})",
+                [[json.dumps(e[f]) if f == "palette" else e[f] for f in FIELDS] for e in entries]
+            )
+            conn.commit()
+
+    async def get_many(self, video_ids: list, method: str):
+        return await run_blocking("images", self._get_many, video_ids, method)
+
+    async def put_many(self, entries: list):
+        await run_blocking("images", self._put_many, entries)
+
+class SupabaseColorStore:
+    def __init__(self, table: str = COLOR_CACHE_TABLE):
+        self.table = table
+
+    async def get_many(self, video_ids: list, method: str):
+        chunks = [video_ids[i:i + COLOR_CACHE_LOOKUP_CHUNK] for i in range(0, len(video_ids), COLOR_CACHE_LOOKUP_CHUNK)]
+
+        results = await asyncio.gather(*(
+            run_blocking("supabase", supabase.table(self.table).select(",".join(FIELDS))\
+                .eq("method", method).in_("video_id", chunk).execute)
+            for chunk in chunks
+        ))
+
+        return [row for res in results for row in res.data or []]
+
+    async def put_many(self, entries: list):
+        await run_blocking("supabase", supabase.table(self.table).upsert(entries).execute)
+
+class NullColorStore:
+    async def get_many(self, video_ids: list, method: str):
+        return []
+
+    async def put_many(self, entries: list):
+        pass
+
+def _build_store(backend: str):
+    if backend == "supabase":
+        return SupabaseColorStore()
+
+    if backend == "disk":
+        return DiskColorStore()
+
+    return NullColorStore()
+
+store = _build_store(COLOR_CACHE_BACKEND)
+
+async def lookup(video_ids: list, urls: list, method: str):
+    # Returns {video_id: entry} for cached palettes whose thumbnail URL still
+    # matches; a different URL means the thumbnail was replaced.
+    if not video_ids:
+        return {}
+
+    try:
+        entries = await store.get_many(video_ids, method)
+
+    except Exception as e:
+        print(f"Color cache read failed: {e}")
+        entries = []
+
+    wanted = dict(zip(video_ids, urls))
+
+    return {e["video_id"]: e for e in entries if wanted.get(e["video_id"]) == e["thumbnail_url"]}
+
+def is_fresh(entry: dict) -> bool:
+    return time.time() - entry["checked_at"] < COLOR_CACHE_REVALIDATE_AFTER
+
+async def save(entries: list):
+    if not entries:
+        return
+
+    try:
+        await store.put_many(entries)
+
+    except Exception as e:
+        print(f"Color cache write failed: {e}")
+
+def record(hits: int = 0, misses: int = 0, revalidated: int = 0):
+    metrics.incr("thumbnail_color_cache_hits", hits)
+    metrics.incr("thumbnail_color_cache_misses", misses)
+    metrics.incr("thumbnail_color_cache_revalidated", revalidated)
+    metrics.set_gauge(
+        "thumbnail_color_cache_hit_rate",
+        metrics.ratio("thumbnail_color_cache_hits", "thumbnail_color_cache_misses")
+    )
+
+def make_entry(video_id: str, method: str, url: str, etag: str, palette: list):
+    return {
+        "video_id": video_id,
+        "method": method,
+        "thumbnail_url": url,
+        "etag": etag,
+        "color": color_engine.dominant_color(palette),
+        "palette": palette,
+        "checked_at": time.time()
+    }
@@ -0,0 +1,324 @@
+import os
+import time
+import base64
+import asyncio
+from datetime import datetime, timezone
+from cachetools import TTLCache
+from google.oauth2.credentials import Credentials
+from google.auth.transport.requests import Request as GoogleRequest
+from google.auth.exceptions import RefreshError
+from dotenv import load_dotenv
+from db import supabase
+from executor import run_blocking
+import http_client
+import metrics
+
+
+load_dotenv()
+
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 5000))
+TOKEN_CACHE_TTL = int(os.getenv("TOKEN_CACHE_TTL", 86400))
+TOKEN_REFRESH_MARGIN = int(os.getenv("TOKEN_REFRESH_MARGIN", 300))
+TOKEN_REFRESH_INTERVAL = int(os.getenv("TOKEN_REFRESH_INTERVAL", 60))
+GOOGLE_REFRESH_TIMEOUT = float(os.getenv("GOOGLE_REFRESH_TIMEOUT", 30))
+
+# Used when the provider did not tell us expires_in (e.g. rows written before
+# this cache existed); the row's updated_at is the best guess of issue time.
+TOKEN_LIFETIMES = {
+    "youtube": 3600,
+    "canva": 14400,
+    "linkedin": 60 * 86400,
+    "instagram": 60 * 86400,
+}
+
+GOOGLE_TOKEN_URI = "https://oauth2.googleapis.com/token"
+CANVA_TOKEN_URL = "https://api.canva.com/rest/v1/oauth/token"
+LINKEDIN_TOKEN_URL = "https://www.linkedin.com/oauth/v2/accessToken"
+
+class CachedToken:
+    def __init__(self, provider: str, key: str, access_token: str, refresh_token: str, expires_at: float = None):
+        self.provider = provider
+        self.key = key
+        self.access_token = access_token
+        self.refresh_token = refresh_token
+        self.expires_at = expires_at
+        self.credentials = None
+        self.retry_at = 0.0
+
+    def expires_within(self, seconds: float) -> bool:
+        return self.expires_at is None or self.expires_at - time.time() <= seconds
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and self.expires_at <= time.time()
+
+def _parse_timestamp(value):
+    if not value:
+        return None
+
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+
+        return parsed.timestamp()
+
+    except ValueError:
+        return None
+
+def _google_expiry(expires_at: float):
+    # google-auth compares expiry against a naive UTC datetime
+    return datetime.fromtimestamp(expires_at, timezone.utc).replace(tzinfo=None) if expires_at else None
+
+def _basic_auth(client_id: str, client_secret: str) -> str:
+    return base64.b64encode(f"{client_id}:{client_secret}".encode()).decode()
+
+async def _refresh_canva(refresh_token: str):
+    response = await http_client.post(
+        CANVA_TOKEN_URL,
+        headers={
+            "Authorization": f"Basic {_basic_auth(os.getenv('CANVA_CLIENT_ID'), os.getenv('CANVA_CLIENT_SECRET'))}",
+            "Content-Type": "application/x-www-form-urlencoded"
+        },
+        data={"grant_type": "refresh_token", "refresh_token": refresh_token}
+    )
+
+    return response.json()
+
+async def _refresh_linkedin(refresh_token: str):
+    response = await http_client.post(
+        LINKEDIN_TOKEN_URL,
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+        data={
+            "grant_type": "refresh_token",
+            "refresh_token": refresh_token,
+            "client_id": os.getenv("LINKEDIN_CLIENT_ID"),
+            "client_secret": os.getenv("LINKEDIN_CLIENT_SECRET")
+        }
+    )
+
+    return response.json()
+
+class TokenManager:
+    def __init__(self, margin: int = TOKEN_REFRESH_MARGIN):
+        self.margin = margin
+        self.entries = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL)
+        self.loading = {}
+        self.refreshing = {}
+
+    async def get_google_credentials(self, email: str):
+        entry = await self._get("youtube", email)
+
+        if not entry:
+            return None
+
+        if entry.credentials is None:
+            # Handed out without the refresh token, so when google-auth wants a
+            # new token (expiry, or a 401 mid-call) it has to go through
+            # refresh_handler: the refresh is then shared with every other
+            # caller for this user and saved to social_tokens.
+            credentials = Credentials(token=entry.access_token, expiry=_google_expiry(entry.expires_at))
+            credentials.refresh_handler = self._google_refresh_handler(asyncio.get_running_loop(), email, credentials)
+            entry.credentials = credentials
+
+        return entry.credentials
+
+    async def get_canva_token(self, canva_id: str):
+        entry = await self._get("canva", f"canva_{canva_id}")
+
+        return entry.access_token if entry else None
+
+    async def get_linkedin_token(self, linkedin_id: str):
+        entry = await self._get("linkedin", f"linkedin_{linkedin_id}")
+
+        return entry.access_token if entry else None
+
+    async def get_instagram_token(self, instagram_id: str):
+        entry = await self._get("instagram", f"instagram_{instagram_id}")
+
+        return entry.access_token if entry else None
+
+    async def force_refresh(self, provider: str, key: str):
+        # For callers that just got a 401 with a token we believed was live
+        entry = self.entries.get((provider, key)) or await self._load(provider, key)
+
+        if not entry or not entry.refresh_token:
+            return None
+
+        entry = await self._refresh(entry)
+
+        return entry.access_token if entry else None
+
+    def _google_refresh_handler(self, loop, email: str, credentials: Credentials):
+        # Called by google-auth from a pool thread while a request is executing
+        def handler(request, scopes=None):
+            future = asyncio.run_coroutine_threadsafe(self._refresh_google(email, credentials.token), loop)
+            entry = future.result(GOOGLE_REFRESH_TIMEOUT)
+
+            if entry is None:
+                raise RefreshError(f"Could not refresh the Google token for {email}")
+
+            return entry.access_token, _google_expiry(entry.expires_at or time.time() + TOKEN_LIFETIMES["youtube"])
+
+        return handler
+
+    async def _refresh_google(self, email: str, stale_token: str):
+        entry = self.entries.get(("youtube", email)) or await self._load("youtube", email)
+
+        if not entry or not entry.refresh_token:
+            return None
+
+        # Another caller already replaced the token this one was refused with
+        if entry.access_token != stale_token and not entry.expires_within(self.margin):
+            return entry
+
+        return await self._refresh(entry)
+
+    def invalidate(self, provider: str, key: str):
+        self.entries.pop((provider, key), None)
+
+    async def run_refresher(self, interval: int = TOKEN_REFRESH_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+
+            for entry in list(self.entries.values()):
+                if entry.refresh_token and entry.expires_within(self.margin):
+                    self._schedule_refresh(entry)
+
+    async def _get(self, provider: str, key: str):
+        entry = self.entries.get((provider, key))
+
+        if entry is None:
+            metrics.incr("token_cache_misses")
+            entry = await self._load(provider, key)
+
+            if entry is None:
+                return None
+
+        else:
+            metrics.incr("token_cache_hits")
+
+        if entry.refresh_token and entry.expired:
+            # Known to be dead: the caller has to wait for the new token
+            refreshed = await self._refresh(entry)
+            entry = refreshed or entry
+
+        elif entry.refresh_token and entry.expires_within(self.margin):
+            self._schedule_refresh(entry)
+
+        return entry
+
+    async def _load(self, provider: str, key: str):
+        # Concurrent first requests for the same user share one SELECT
+        task = self.loading.get((provider, key))
+
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_row(provider, key))
+            self.loading[(provider, key)] = task
+            task.add_done_callback(lambda _: self.loading.pop((provider, key), None))
+
+        return await asyncio.shield(task)
+
+    async def _fetch_row(self, provider: str, key: str):
+        res = await run_blocking("supabase", supabase.table("social_tokens").select("*")\
+            .eq("user_email", key).eq("provider", provider).execute)
+
+        if not res.data:
+            return None
+
+        row = res.data[0]
+        issued_at = _parse_timestamp(row.get("updated_at"))
+
+        entry = CachedToken(
+            provider,
+            key,
+            row["access_token"],
+            row.get("refresh_token"),
+            issued_at + TOKEN_LIFETIMES[provider] if issued_at else None
+        )
+
+        self.entries[(provider, key)] = entry
+
+        return entry
+
+    def _schedule_refresh(self, entry: CachedToken):
+        task = self.refreshing.get((entry.provider, entry.key))
+
+        if (task is None or task.done()) and time.time() >= entry.retry_at:
+            asyncio.ensure_future(self._refresh(entry))
+
+    async def _refresh(self, entry: CachedToken):
+        # Every concurrent caller for this user awaits the same refresh, so the
+        # provider sees one token request and social_tokens one UPDATE.
+        cache_key = (entry.provider, entry.key)
+        task = self.refreshing.get(cache_key)
+
+        if task is None or task.done():
+            task = asyncio.ensure_future(self._do_refresh(entry))
+            self.refreshing[cache_key] = task
+            task.add_done_callback(lambda done: self._forget_refresh(cache_key, done))
+
+        try:
+            return await asyncio.shield(task)
+
+        except Exception as e:
+            # Back off so a revoked grant is not retried on every request
+            entry.retry_at = time.time() + self.margin
+            print(f"Token refresh failed for {entry.provider}/{entry.key}: {e}")
+            return None
+
+    def _forget_refresh(self, cache_key: tuple, task):
+        if self.refreshing.get(cache_key) is task:
+            del self.refreshing[cache_key]
+
+    async def _do_refresh(self, entry: CachedToken):
+        if entry.provider == "youtube":
+            creds = Credentials(
+                token=entry.access_token,
+                refresh_token=entry.refresh_token,
+                token_uri=GOOGLE_TOKEN_URI,
+                client_id=os.getenv("GOOGLE_CLIENT_ID"),
+                client_secret=os.getenv("GOOGLE_CLIENT_SECRET")
+            )
+
+            await run_blocking("google", creds.refresh, GoogleRequest())
+
+            access_token = creds.token
+            refresh_token = creds.refresh_token or entry.refresh_token
+            expires_at = creds.expiry.replace(tzinfo=timezone.utc).timestamp() if creds.expiry else None
+
+        else:
+            refresh = _refresh_canva if entry.provider == "canva" else _refresh_linkedin
+            tokens = await refresh(entry.refresh_token)
+
+            if "access_token" not in tokens:
+                raise RuntimeError(f"provider rejected refresh: {tokens}")
+
+            access_token = tokens["access_token"]
+            refresh_token = tokens.get("refresh_token", entry.refresh_token)
+            expires_in = tokens.get("expires_in")
+            expires_at = time.time() + int(expires_in) if expires_in else None
+
+        await run_blocking("supabase", supabase.table("social_tokens").update({
+            "access_token": access_token,
+            "refresh_token": refresh_token,
+            "updated_at": "now()"
+        }).eq("user_email", entry.key).eq("provider", entry.provider).execute)
+
+        refreshed = CachedToken(
+            entry.provider,
+            entry.key,
+            access_token,
+            refresh_token,
+            expires_at or time.time() + TOKEN_LIFETIMES[entry.provider]
+        )
+
+        self.entries[(entry.provider, entry.key)] = refreshed
+        metrics.incr("token_refreshes")
+
+        print(f"Refreshed {entry.provider} token for {entry.key}")
+
+        return refreshed
+
+token_manager = TokenManager()
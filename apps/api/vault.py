@@ -1,19 +1,14 @@
-import os
 from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
 from dotenv import load_dotenv
-from supabase import Client, create_client
+from db import supabase
+from executor import run_blocking
 
 
 load_dotenv()
 
 router = APIRouter()
 
-supabase: Client = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_KEY")
-)
-
 class AssetRequest(BaseModel):
     email: str
     asset_type: str
@@ -30,7 +25,7 @@ async def save_asset(payload: AssetRequest):
             "metadata": payload.metadata
         }
 
-        res = supabase.table("assets").insert(data).execute()
+        res = await run_blocking("supabase", supabase.table("assets").insert(data).execute)
 
         return {"status": "success", "asset_id": res.data[0]['id']}
 
@@ -47,7 +42,7 @@ async def list_assets(email: str, asset_type: str = "all"):
         if asset_type != "all":
             query = query.eq("asset_type", asset_type)
 
-        res = query.execute()
+        res = await run_blocking("supabase", query.execute)
         
         return res.data
 
@@ -58,7 +53,7 @@ async def list_assets(email: str, asset_type: str = "all"):
 @router.delete("/vault/delete")
 async def delete_asset(asset_id: str):
     try:
-        supabase.table("assets").delete().eq("id", asset_id).execute()
+        await run_blocking("supabase", supabase.table("assets").delete().eq("id", asset_id).execute)
         
         return {"status": "deleted"}
 
@@ -1,89 +1,197 @@
 import os
+import asyncio
 import replicate
 from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from supabase import create_client, Client
 from dotenv import load_dotenv
+from db import supabase
+from executor import run_blocking
+from jobs import JobQueue, JOB_QUEUE_RETRY_AFTER
+from replicate_models import replicate_client, version_resolver
+import credits
+from admission import admission
 
 
 load_dotenv()
 
 router = APIRouter()
 
-supabase: Client = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
-
 VIDEO_COST = 10
+VIDEO_MODEL = "anotherjesse/zeroscope-v2-xl"
+VIDEO_WORKERS = int(os.getenv("VIDEO_WORKERS", 2))
+VIDEO_POLL_INTERVAL = float(os.getenv("VIDEO_POLL_INTERVAL", 2))
+VIDEO_MAX_QUEUE = int(os.getenv("VIDEO_MAX_QUEUE", 50))
+
+# Queued and rendering jobs can outlive CREDIT_RESERVATION_TIMEOUT, so their
+# holds are renewed well inside it to keep the sweeper off them
+VIDEO_HOLD_RENEW_INTERVAL = int(os.getenv("VIDEO_HOLD_RENEW_INTERVAL", credits.CREDIT_RESERVATION_TIMEOUT // 3))
 
 class VideoRequest(BaseModel):
     email: str
     prompt: str
 
+def build_video_input(prompt: str, tier: str):
+    num_frames = 48 if tier == 'pro' else 24
+
+    return {
+        "prompt": prompt,
+        "num_frames": num_frames,
+        "width": 576,
+        "height": 320,
+        "fps": 24,
+        "guidance_scale": 12.5,
+        "num_inference_steps": 50
+    }
+
+def extract_video_url(output):
+    if hasattr(output, 'url'):
+        return output.url
+
+    elif isinstance(output, list) and len(output) > 0:
+        return output[0].url if hasattr(output[0], 'url') else str(output[0])
+
+    return str(output)
+
+async def save_video_asset(email: str, prompt: str, video_url: str):
+    await run_blocking("supabase", supabase.table("assets").insert({
+        "user_email": email,
+        "asset_type": "video",
+        "content": video_url,
+        "metadata": {"prompt": prompt, "model": VIDEO_MODEL}
+    }).execute)
+
+async def settle_video_hold(job, reservation):
+    if await credits.commit(reservation):
+        return
+
+    # The hold lapsed and its credits already went back to the user, so the
+    # finished video is charged afresh; a 402 here fails the job
+    print(f"Video job {job.id}: hold {reservation.id} was no longer held, debiting again")
+
+    await credits.debit(reservation.email, VIDEO_COST, reason="video")
+
+async def run_video_job(job):
+    email = job.payload["email"]
+    prompt = job.payload["prompt"]
+    reservation = job.payload["reservation"]
+    prediction = None
+    settled = False
+
+    try:
+        version_id = await version_resolver.resolve(VIDEO_MODEL)
+
+        prediction = await run_blocking(
+            "replicate",
+            replicate_client.predictions.create,
+            version=version_id.split(":", 1)[1],
+            input=build_video_input(prompt, reservation.tier)
+        )
+
+        while prediction.status not in ("succeeded", "failed", "canceled"):
+            await asyncio.sleep(VIDEO_POLL_INTERVAL)
+            await run_blocking("replicate", prediction.reload)
+
+            progress = prediction.progress
+
+            if progress is not None and progress.percentage != job.progress:
+                job.update(progress=progress.percentage)
+
+        if prediction.status != "succeeded":
+            raise RuntimeError(f"Replicate prediction {prediction.status}: {prediction.error}")
+
+        video_url = extract_video_url(prediction.output)
+
+        # Charged before the asset is stored, so a video that could not be
+        # paid for never reaches the vault
+        await settle_video_hold(job, reservation)
+        settled = True
+
+    finally:
+        # Also runs when the worker is cancelled at shutdown; a prediction
+        # nobody will collect is stopped so Replicate doesn't bill for it
+        if prediction is not None and prediction.status not in ("succeeded", "failed", "canceled"):
+            try:
+                await asyncio.shield(run_blocking("replicate", prediction.cancel))
+
+            except Exception as e:
+                print(f"Cancelling prediction {prediction.id} for video job {job.id} failed: {e}")
+
+        if not settled:
+            try:
+                await asyncio.shield(credits.refund(reservation))
+
+            except Exception as e:
+                print(f"Credit refund failed for video job {job.id} ({reservation.id}): {e}")
+
+    try:
+        await save_video_asset(email, prompt, video_url)
+
+    except Exception as e:
+        # Already paid for, so the job still hands back the video
+        print(f"Video job {job.id}: saving the asset failed: {e}")
+
+    return {"video_url": video_url, "prediction_id": prediction.id}
+
+async def renew_video_holds(interval: int = VIDEO_HOLD_RENEW_INTERVAL):
+    while True:
+        await asyncio.sleep(interval)
+
+        for job in video_jobs.active():
+            try:
+                await credits.renew(job.payload["reservation"])
+
+            except Exception as e:
+                print(f"Renewing the hold for video job {job.id} failed: {e}")
+
+video_jobs = JobQueue("video", run_video_job, concurrency=VIDEO_WORKERS, max_pending=VIDEO_MAX_QUEUE)
+
+@router.on_event("startup")
+async def start_video_workers():
+    video_jobs.start()
+
+@router.on_event("shutdown")
+async def stop_video_workers():
+    for job in await video_jobs.stop():
+        try:
+            await credits.refund(job.payload["reservation"])
+
+        except Exception as e:
+            print(f"Credit refund failed for video job {job.id}: {e}")
+
 @router.post("/video/generate")
 async def generate_video(payload: VideoRequest):
-    try: 
-        res = supabase.table("profiles").select("*")\
-            .eq("user_email", payload.email).execute()
-
-        if not res.data:
-            raise HTTPException(404, "user not found. Please visit Pricing page to initialize.")
-
-        profile = res.data[0]
-        credits = profile["credits_balance"]
-        tier = profile["subscription_tier"]
-
-        if credits < VIDEO_COST:
-            raise HTTPException(402, "Insufficient credits. Please top up.")
-
-        num_frames = 48 if tier == 'pro' else 24
-
-        print(f"Generating video for {payload.email} ({tier} tier)...")
-
-        model_name = "anotherjesse/zeroscope-v2-xl"
-        model = replicate.models.get(model_name)
-        latest_version = model.versions.list()[0]
-        version_id = f"{model_name}:{latest_version.id}"
-
-        output = replicate.run(
-            version_id,
-            input={
-                "prompt": payload.prompt,
-                "num_frames": num_frames,
-                "width": 576,
-                "height": 320,
-                "fps": 24,
-                "guidance_scale": 12.5,
-                "num_inference_steps": 50
-            }
-        )
+    try:
+        # The hold is refunded on any failure, including a client disconnect
+        # or a failed save, and committed once the asset is stored
+        async with admission.admit(payload.email, "video"), credits.hold(payload.email, VIDEO_COST, reason="video", create_missing=False) as reservation:
+            tier = reservation.tier
 
-        if hasattr(output, 'url'):
-            video_url = output.url
-        
-        elif isinstance(output, list) and len(output) > 0:
-            video_url = output[0].url if hasattr(output[0], 'url') else str(output[0])
+            print(f"Generating video for {payload.email} ({tier} tier)...")
 
-        else:
-            video_url = str(output)
+            version_id = await version_resolver.resolve(VIDEO_MODEL)
 
-        new_balance = credits - VIDEO_COST
+            output = await run_blocking(
+                "replicate",
+                replicate_client.run,
+                version_id,
+                input=build_video_input(payload.prompt, tier)
+            )
 
-        supabase.table("profiles").update({"credits_balance": new_balance})\
-            .eq("user_email", payload.email).execute()
+            video_url = extract_video_url(output)
 
-        if payload.email:
-            supabase.table("assets").insert({
-                "user_email": payload.email,
-                "asset_type": "video",
-                "content": video_url,
-                "metadata": {"prompt": payload.prompt, "model": model_name}
-            }).execute()
+            if payload.email:
+                await save_video_asset(payload.email, payload.prompt, video_url)
 
         return {
             "video_url": video_url,
-            "credits_remaining": new_balance,
+            "credits_remaining": reservation.balance,
             "message": "Video generation successful"
         }
 
+    except HTTPException as he:
+        raise he
+
     except replicate.exceptions.ReplicateError as e:
         print(f"Replicate Error: {e}")
         raise HTTPException(502, "AI Service Error. Credits were not deducted.")
@@ -92,5 +200,49 @@ async def generate_video(payload: VideoRequest):
         print(f"Server Error: {e}")
         raise HTTPException(500, str(e))
 
+@router.post("/video/jobs")
+async def submit_video_job(payload: VideoRequest):
+    # The job queue already bounds how many videos render at once, so only
+    # the per-user rate limit applies here
+    await admission.check_rate(payload.email, "video")
+
+    # Checked before reserving so a full queue turns the request away without a hold
+    if video_jobs.full():
+        raise HTTPException(503, "The video queue is full, try again shortly", headers={"Retry-After": str(JOB_QUEUE_RETRY_AFTER)})
+
+    reservation = await credits.reserve(payload.email, VIDEO_COST, reason="video", create_missing=False)
+
+    try:
+        job = await video_jobs.submit({"email": payload.email, "prompt": payload.prompt, "reservation": reservation})
+
+    except BaseException:
+        await asyncio.shield(credits.refund(reservation))
+        raise
+
+    print(f"Queued video job {job.id} for {payload.email} ({reservation.tier} tier)")
+
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "credits_remaining": reservation.balance
+    }
+
+@router.get("/video/jobs/{job_id}")
+async def get_video_job(job_id: str):
+    job = video_jobs.get(job_id)
+
+    if not job:
+        raise HTTPException(404, "Job not found")
+
+    return job.to_dict()
 
+@router.get("/video/jobs/{job_id}/events")
+async def stream_video_job(job_id: str):
+    if not video_jobs.get(job_id):
+        raise HTTPException(404, "Job not found")
 
+    return StreamingResponse(
+        video_jobs.events(job_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
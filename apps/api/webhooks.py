@@ -4,8 +4,8 @@ import hashlib
 import json
 import stripe
 from fastapi import APIRouter, Request, HTTPException, Header
-from supabase import create_client, Client
 from dotenv import load_dotenv
+import credits
 
 
 load_dotenv()
@@ -14,11 +14,6 @@ router = APIRouter()
 stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
 endpoint_secret = os.getenv("STRIPE_WEBHOOK_SECRET")
 
-supabase: Client = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_KEY")
-)
-
 secret = os.getenv("RAZORPAY_WEBHOOK_SECRET")
 
 @router.post("/stripe/webhook")
@@ -62,21 +57,13 @@ async def stripe_webhook(request: Request, stripe_signature: str = Header(None))
             credits_to_add = 2000
             new_tier = 'pro'
 
-        res = supabase.table("profiles")\
-            .select("credits_balance").eq("user_email", user_email)\
-            .execute()
-        
-        current_balance = res.data[0]['credits_balance'] if res.data else 0
+        balance = await credits.add(user_email, credits_to_add, tier=new_tier)
 
-        update_data = {"credits_balance": current_balance + credits_to_add}
+        if balance is None:
+            print(f"Webhook Error: No profile for {user_email}")
 
-        if new_tier:
-            update_data['subscription_tier'] = new_tier
-        
-        supabase.table("profiles").update(update_data)\
-            .eq("user_email", user_email).execute()
-        
-        print(f"Credits updated. New Balance: {current_balance + credits_to_add}")
+        else:
+            print(f"Credits updated. New Balance: {balance}")
 
     return {"status": "success"}
 
@@ -131,21 +118,13 @@ async def razorpay_webhook(request: Request):
             credits_to_add = 1500
             new_tier = 'pro'
         
-        res = supabase.table("profiles")\
-            .select("credits_balance").eq("user_email", user_email)\
-            .execute()
-        
-        current_balance = res.data[0]['credits_balance'] if res.data else 0
+        balance = await credits.add(user_email, credits_to_add, tier=new_tier)
 
-        update_data = {"credits_balance": current_balance + credits_to_add}
+        if balance is None:
+            print(f"Webhook Error: No profile for {user_email}")
 
-        if new_tier:
-            update_data['subscription_tier'] = new_tier
-        
-        supabase.table("profiles").update(update_data)\
-            .eq("user_email", user_email).execute()
-        
-        print(f"Credits updated. New Balance: {current_balance + credits_to_add}")
+        else:
+            print(f"Credits updated. New Balance: {balance}")
     
     return {"status": "success"}
 
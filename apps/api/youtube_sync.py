@@ -0,0 +1,278 @@
+import os
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from db import supabase
+from executor import run_blocking
+from google_services import build_service
+from response_cache import response_cache
+import metrics
+
+
+load_dotenv()
+
+YOUTUBE_PAGE_SIZE = 50
+YOUTUBE_UPSERT_CHUNK = int(os.getenv("YOUTUBE_UPSERT_CHUNK", 500))
+SUPABASE_PAGE_SIZE = 1000
+CHANNEL_CACHE_TTL = int(os.getenv("YOUTUBE_CHANNEL_CACHE_TTL", 3600))
+
+# Data API units per call; every list method we use costs 1
+QUOTA_COSTS = {
+    "channels.list": 1,
+    "playlistItems.list": 1,
+    "videos.list": 1,
+}
+
+class QuotaMeter:
+    def __init__(self):
+        self.units = 0
+        self.calls = defaultdict(int)
+
+    def charge(self, method: str):
+        cost = QUOTA_COSTS.get(method, 1)
+
+        self.units += cost
+        self.calls[method] += 1
+        metrics.incr("youtube_quota_units", cost)
+
+    def to_dict(self):
+        return {"units": self.units, "calls": dict(self.calls)}
+
+async def execute(quota: QuotaMeter, method: str, request):
+    quota.charge(method)
+
+    return await run_blocking("google", request.execute)
+
+def parse_timestamp(value):
+    if not value:
+        return None
+
+    parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def video_id(item: dict) -> str:
+    return item["snippet"]["resourceId"]["videoId"]
+
+def published_at(item: dict):
+    details = item.get("contentDetails", {})
+
+    return parse_timestamp(details.get("videoPublishedAt") or item["snippet"].get("publishedAt"))
+
+def added_at(item: dict):
+    # When the upload entered the playlist. This is what the playlist is
+    # ordered by, so it (not videoPublishedAt) is the incremental cursor.
+    return parse_timestamp(item["snippet"].get("publishedAt"))
+
+def thumbnail_url(snippet: dict, *sizes) -> str:
+    thumbs = snippet.get("thumbnails", {})
+
+    for size in sizes or ("high", "medium", "default"):
+        if size in thumbs:
+            return thumbs[size].get("url", "")
+
+    return ""
+
+async def get_channel(email: str, creds, part: str = "snippet,statistics"):
+    # Channel snippet/statistics barely move within an hour, and every
+    # dashboard load asks for them, so they go through the response cache.
+    async def fetch():
+        youtube = build_service('youtube', 'v3', creds)
+
+        return await execute(QuotaMeter(), "channels.list", youtube.channels().list(part=part, mine=True))
+
+    return await response_cache.get_or_fetch(
+        "youtube_channel", f"{email}:{part}", fetch,
+        ttl=CHANNEL_CACHE_TTL, provider="youtube", cost=QUOTA_COSTS["channels.list"]
+    )
+
+async def get_uploads_playlist(youtube, quota: QuotaMeter):
+    res = await execute(quota, "channels.list", youtube.channels().list(part="contentDetails", mine=True))
+
+    if not res.get("items"):
+        return None
+
+    return res["items"][0]["contentDetails"]["relatedPlaylists"]["uploads"]
+
+async def iter_upload_pages(youtube, uploads_id: str, quota: QuotaMeter, since=None, limit: int = None, part: str = "snippet,contentDetails"):
+    # The uploads playlist is newest first, so an incremental run can stop at
+    # the first item that is not newer than `since`.
+    page_token = None
+    seen = 0
+
+    while True:
+        page_size = YOUTUBE_PAGE_SIZE if limit is None else min(YOUTUBE_PAGE_SIZE, limit - seen)
+
+        res = await execute(quota, "playlistItems.list", youtube.playlistItems().list(
+            part=part,
+            playlistId=uploads_id,
+            maxResults=page_size,
+            pageToken=page_token
+        ))
+
+        items = res.get("items", [])
+        reached_since = False
+
+        if since is not None:
+            fresh = [item for item in items if (added_at(item) or since) > since]
+            reached_since = len(fresh) < len(items)
+            items = fresh
+
+        if items:
+            seen += len(items)
+            yield items
+
+        page_token = res.get("nextPageToken")
+
+        if not page_token or reached_since or (limit is not None and seen >= limit):
+            return
+
+async def get_videos(creds, video_ids: list, quota: QuotaMeter, part: str = "statistics"):
+    # videos().list takes at most 50 ids, so larger sets go out as parallel
+    # batches. httplib2 connections are not thread-safe, so every batch gets
+    # its own service object (cheap now that discovery docs are cached).
+    batches = [video_ids[i:i + YOUTUBE_PAGE_SIZE] for i in range(0, len(video_ids), YOUTUBE_PAGE_SIZE)]
+
+    responses = await asyncio.gather(*(
+        execute(quota, "videos.list", build_service('youtube', 'v3', creds).videos().list(part=part, id=','.join(batch)))
+        for batch in batches
+    ))
+
+    return {video['id']: video for res in responses for video in res.get('items', [])}
+
+async def iter_videos(creds, uploads_id: str, quota: QuotaMeter, since=None, limit: int = None, part: str = "statistics"):
+    # Yields (playlist_item, video) pairs. The videos().list call for one page
+    # runs while the next playlist page is being fetched.
+    youtube = build_service('youtube', 'v3', creds)
+    pending = None
+
+    try:
+        async for page in iter_upload_pages(youtube, uploads_id, quota, since=since, limit=limit):
+            task = asyncio.ensure_future(get_videos(creds, [video_id(item) for item in page], quota, part))
+
+            if pending:
+                previous, previous_task = pending
+                videos = await previous_task
+
+                for item in previous:
+                    yield item, videos.get(video_id(item))
+
+            pending = (page, task)
+
+        if pending:
+            previous, previous_task = pending
+            pending = None
+            videos = await previous_task
+
+            for item in previous:
+                yield item, videos.get(video_id(item))
+
+    finally:
+        if pending:
+            pending[1].cancel()
+
+def to_row(email: str, item: dict, video: dict):
+    stats = (video or {}).get("statistics", {})
+    snippet = item["snippet"]
+    published = published_at(item)
+
+    return {
+        "user_email": email,
+        "video_id": video_id(item),
+        "title": snippet.get("title"),
+        "published_at": published.isoformat() if published else None,
+        "thumbnail_url": thumbnail_url(snippet),
+        "view_count": int(stats.get("viewCount", 0)),
+        "like_count": int(stats.get("likeCount", 0)),
+        "comment_count": int(stats.get("commentCount", 0)),
+        "synced_at": "now()"
+    }
+
+async def save_videos(rows: list):
+    for i in range(0, len(rows), YOUTUBE_UPSERT_CHUNK):
+        await run_blocking("supabase", supabase.table("youtube_videos").upsert(rows[i:i + YOUTUBE_UPSERT_CHUNK]).execute)
+
+async def load_videos(email: str):
+    rows = []
+
+    while True:
+        res = await run_blocking("supabase", supabase.table("youtube_videos").select("*")\
+            .eq("user_email", email)\
+            .order("published_at", desc=True)\
+            .range(len(rows), len(rows) + SUPABASE_PAGE_SIZE - 1).execute)
+
+        rows.extend(res.data or [])
+
+        if len(res.data or []) < SUPABASE_PAGE_SIZE:
+            return rows
+
+async def load_state(email: str):
+    res = await run_blocking("supabase", supabase.table("youtube_sync_state").select("*")\
+        .eq("user_email", email).execute)
+
+    return res.data[0] if res.data else None
+
+async def sync_channel(email: str, creds, full: bool = False, quota: QuotaMeter = None):
+    # Pulls only uploads newer than the last sync into youtube_videos; a full
+    # run (or a changed uploads playlist) walks the whole channel again.
+    quota = quota or QuotaMeter()
+    youtube = build_service('youtube', 'v3', creds)
+
+    uploads_id = await get_uploads_playlist(youtube, quota)
+
+    if not uploads_id:
+        return None
+
+    state = None if full else await load_state(email)
+    since = None
+
+    if state and state.get("uploads_playlist_id") == uploads_id:
+        since = parse_timestamp(state.get("last_published_at"))
+
+    rows = []
+    newest = since
+
+    async for item, video in iter_videos(creds, uploads_id, quota, since=since):
+        rows.append(to_row(email, item, video))
+
+        added = added_at(item)
+
+        if added and (newest is None or added > newest):
+            newest = added
+
+    await save_videos(rows)
+
+    await run_blocking("supabase", supabase.table("youtube_sync_state").upsert({
+        "user_email": email,
+        "uploads_playlist_id": uploads_id,
+        "last_published_at": newest.isoformat() if newest else None,
+        "last_synced_at": "now()"
+    }).execute)
+
+    metrics.incr("youtube_sync_runs")
+    metrics.incr("youtube_sync_new_videos", len(rows))
+
+    return {
+        "uploads_playlist_id": uploads_id,
+        "new_videos": len(rows),
+        "incremental": since is not None,
+        "last_published_at": newest.isoformat() if newest else None
+    }
+
+async def refresh_statistics(creds, rows: list, quota: QuotaMeter):
+    # Refreshes counts for already-synced videos at one unit per 50 videos
+    videos = await get_videos(creds, [row["video_id"] for row in rows], quota)
+
+    for row in rows:
+        stats = videos.get(row["video_id"], {}).get("statistics")
+
+        if stats:
+            row["view_count"] = int(stats.get("viewCount", 0))
+            row["like_count"] = int(stats.get("likeCount", 0))
+            row["comment_count"] = int(stats.get("commentCount", 0))
+            row["synced_at"] = "now()"
+
+    await save_videos(rows)
+
+    return rows